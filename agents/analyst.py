@@ -1,17 +1,20 @@
 # agents/analyst.py
 from langchain_core.messages import HumanMessage, SystemMessage
-from config import multimodal_llm
+from config import get_llm
+from tools.llm_client import ainvoke_llm, invoke_llm
 from prompts import ANALYST_PROMPT_ENHANCED  # 使用新的 Prompt
+from tools.context_budget import apply_budget, error_section, plan_section
 from tools.pdf_utils import pdf_to_base64_images
+from tools.image_utils import preprocess_sketch
+import asyncio
 import base64
 import os
 
-def get_analyst_response(user_request: dict) -> str:
+def build_analyst_messages(user_request: dict):
     """
-    调用几何分析师LLM。
-    可以处理初始请求，也可以处理包含反馈的诊断任务。
+    根据请求类型构建发送给几何分析师的消息列表。
+    返回 (messages, error)，出错时 messages 为 None。
     """
-    print("-> Calling Geometric Analyst...")
     system_message = SystemMessage(content=ANALYST_PROMPT_ENHANCED)
     
     content = []
@@ -23,30 +26,35 @@ def get_analyst_response(user_request: dict) -> str:
     elif user_request["type"] == "initial_image":
         image_path = user_request["data"]
         try:
-            with open(image_path, "rb") as image_file:
-                b64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            image_bytes, mime_type = preprocess_sketch(image_path)
+            b64_image = base64.b64encode(image_bytes).decode('utf-8')
             content.append({"type": "text", "text": "这是用户的手绘草图，请执行职责一进行分析，将其转换为结构化的JSON格式。"})
-            content.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64_image}"}})
+            content.append({"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{b64_image}"}})
         except Exception as e:
-            return f"Error reading image file: {e}"
+            return None, f"Error reading image file: {e}"
 
     # 场景二：诊断与修正
     elif user_request["type"] == "feedback":
         feedback_data = user_request["data"]
+        fitted = apply_budget("triage", [
+            plan_section("original_description", feedback_data['original_description']),
+            error_section("critic_feedback", feedback_data['critic_feedback']),
+            error_section("log_content", feedback_data['log_content']),
+        ])
         text_prompt = f"""
         请执行职责二进行诊断和修正。以下是反馈包：
 
         1.  **你上次生成的JSON描述 (规划)**:
             ```json
-            {feedback_data['original_description']}
+            {fitted['original_description']}
             ```
         
         2.  **审查员的意见**:
-            {feedback_data['critic_feedback']}
+            {fitted['critic_feedback']}
 
-        3.  **编译日志 (截取)**:
+        3.  **编译日志摘要**:
             ```
-            {feedback_data['log_content']}
+            {fitted['log_content']}
             ```
         
         请结合下面的PDF截图，分析问题并决定是修正JSON还是维持原样。
@@ -65,8 +73,29 @@ def get_analyst_response(user_request: dict) -> str:
              content.append({"type": "text", "text": "\n(无法加载PDF截图。请仅根据文本信息进行诊断。)"})
 
     else:
-        return "Error: Invalid request type."
+        return None, "Error: Invalid request type."
 
     human_message = HumanMessage(content=content)
-    response = multimodal_llm.invoke([system_message, human_message])
+    return [system_message, human_message], None
+
+def get_analyst_response(user_request: dict) -> str:
+    """
+    调用几何分析师LLM。
+    可以处理初始请求，也可以处理包含反馈的诊断任务。
+    """
+    print("-> Calling Geometric Analyst...")
+    messages, error = build_analyst_messages(user_request)
+    if error:
+        return error
+    response = invoke_llm(get_llm("planner"), messages, agent="planner")
+    return response.content
+
+async def aget_analyst_response(user_request: dict) -> str:
+    """get_analyst_response 的异步版本。"""
+    print("-> Calling Geometric Analyst (async)...")
+    # 读取图片和渲染PDF属于阻塞操作，放到线程中执行，避免阻塞事件循环
+    messages, error = await asyncio.to_thread(build_analyst_messages, user_request)
+    if error:
+        return error
+    response = await ainvoke_llm(get_llm("planner"), messages, agent="planner")
     return response.content
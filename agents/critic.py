@@ -1,6 +1,7 @@
 # agents/critic.py
 from langchain_core.messages import HumanMessage, SystemMessage
-from config import text_llm
+from config import get_llm
+from tools.llm_client import invoke_llm
 from prompts import CRITIC_PROMPT
 
 def get_critic_response(structured_description: str, python_code: str) -> str:
@@ -25,7 +26,7 @@ def get_critic_response(structured_description: str, python_code: str) -> str:
     """
     human_message = HumanMessage(content=review_content)
 
-    response = text_llm.invoke([system_message, human_message])
+    response = invoke_llm(get_llm("critic"), [system_message, human_message], agent="critic")
     feedback = response.content.strip()
 
     print(f"--- Critic's Feedback ---\n{feedback}\n------------------------")
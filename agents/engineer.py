@@ -1,6 +1,7 @@
 # agents/engineer.py
 from langchain_core.messages import HumanMessage, SystemMessage
-from config import text_llm
+from config import get_llm
+from tools.llm_client import invoke_llm
 from prompts import ENGINEER_PROMPT
 from tools.python_executor import execute_python_code
 import re # 导入正则表达式库
@@ -34,7 +35,7 @@ def get_engineer_response(structured_description: str, output_filename: str) ->
     human_message = HumanMessage(content="Please complete the Python script based on the provided template and JSON data.")
 
     # 生成代码
-    code_response = text_llm.invoke([system_message, human_message])
+    code_response = invoke_llm(get_llm("translator"), [system_message, human_message], agent="translator")
     full_response = code_response.content
     
     # 关键步骤：解析出纯净的代码
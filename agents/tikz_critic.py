@@ -1,33 +1,52 @@
 # agents/tikz_critic.py
 from langchain_core.messages import HumanMessage, SystemMessage
-from config import text_llm
+from config import get_llm
+from tools.llm_client import ainvoke_llm, invoke_llm
 from prompts import CRITIC_PROMPT_TIKZ
+from tools.context_budget import apply_budget, code_section, error_lines_of, error_section, plan_section
 
-def get_tikz_critic_response(structured_description: str, latex_code: str, compilation_result: dict) -> str:
-    """
-    调用审查员LLM来审查LaTeX代码和编译结果。
-    """
-    print("-> Calling Critic...")
+def build_tikz_critic_messages(structured_description: str, latex_code: str, compilation_result: dict) -> list:
+    """构建发送给审查员的消息列表。"""
     system_message = SystemMessage(content=CRITIC_PROMPT_TIKZ)
     
     # 将所有信息组合成一个清晰的上下文
     compilation_status = "Success" if compilation_result["success"] else f"Failure:\n{compilation_result['error']}"
+    # 提示词超出预算时，先删去计划中的推理说明，再只保留错误行附近的代码
+    fitted = apply_budget("critic", [
+        plan_section("description", structured_description),
+        code_section("latex_code", latex_code, error_lines_of(compilation_result.get("error", ""))),
+        error_section("compilation", compilation_status),
+    ])
     
     review_content = f"""
     **1. Original Geometric Description (JSON):**
     ```json
-    {structured_description}
+    {fitted["description"]}
     ```
 
     **2. Generated LaTeX Code:**
     ```latex
-    {latex_code}
+    {fitted["latex_code"]}
     ```
     
     **3. Compilation Result:**
-    {compilation_status}
+    {fitted["compilation"]}
     """
     human_message = HumanMessage(content=review_content)
+    return [system_message, human_message]
+
+def get_tikz_critic_response(structured_description: str, latex_code: str, compilation_result: dict) -> str:
+    """
+    调用审查员LLM来审查LaTeX代码和编译结果。
+    """
+    print("-> Calling Critic...")
+    messages = build_tikz_critic_messages(structured_description, latex_code, compilation_result)
+    response = invoke_llm(get_llm("critic"), messages, agent="critic")
+    return response.content.strip()
 
-    response = text_llm.invoke([system_message, human_message])
+async def aget_tikz_critic_response(structured_description: str, latex_code: str, compilation_result: dict) -> str:
+    """get_tikz_critic_response 的异步版本。"""
+    print("-> Calling Critic (async)...")
+    messages = build_tikz_critic_messages(structured_description, latex_code, compilation_result)
+    response = await ainvoke_llm(get_llm("critic"), messages, agent="critic")
     return response.content.strip()
@@ -1,16 +1,81 @@
 # agents/tikz_engineer.py
 from langchain_core.messages import HumanMessage, SystemMessage
-from config import text_llm
-from prompts import TIKZ_ENGINEER_PROMPT
+from config import get_llm
+from tools.llm_client import ainvoke_llm, invoke_llm
+from prompts import TIKZ_ENGINEER_PROMPT, TIKZ_PATCH_PROMPT
+from tools.context_budget import apply_budget, error_section, fixed_section, plan_section
 
-def get_tikz_engineer_response(structured_description: str) -> str:
+def _with_hint(content: str, hint: str) -> str:
+    """在输入末尾附加候选方案的提示 (并行生成多个候选时使用)"""
+    return f"{content}\n\n{hint}" if hint else content
+
+def get_tikz_engineer_response(structured_description: str, temperature: float = None, hint: str = "",
+                               use_cache=None) -> str:
     """
     调用 TikZ 工程师 LLM 生成 LaTeX 代码。
+    temperature 与 hint 用于并行生成多个不同的候选方案；use_cache 传给 invoke_llm (修正轮次传 False)。
     """
     print("-> Calling TikZ Engineer...")
     system_message = SystemMessage(content=TIKZ_ENGINEER_PROMPT)
-    human_message = HumanMessage(content=structured_description)
+    human_message = HumanMessage(content=_with_hint(structured_description, hint))
     
-    response = text_llm.invoke([system_message, human_message])
+    response = invoke_llm(get_llm("translator", temperature), [system_message, human_message],
+                          use_cache=use_cache, agent="translator")
     # TikZ/LaTeX 代码不需要解析，直接返回内容
     return response.content.strip()
+
+async def aget_tikz_engineer_response(structured_description: str, temperature: float = None, hint: str = "",
+                                      use_cache=None) -> str:
+    """get_tikz_engineer_response 的异步版本。"""
+    print("-> Calling TikZ Engineer (async)...")
+    system_message = SystemMessage(content=TIKZ_ENGINEER_PROMPT)
+    human_message = HumanMessage(content=_with_hint(structured_description, hint))
+
+    response = await ainvoke_llm(get_llm("translator", temperature), [system_message, human_message],
+                                 use_cache=use_cache, agent="translator")
+    return response.content.strip()
+
+def build_tikz_patch_messages(structured_description: str, previous_code: str, feedback: str, hint: str = "") -> list:
+    """构建修正轮次的消息：要求工程师针对上一轮的代码返回统一差异格式的补丁。"""
+    system_message = SystemMessage(content=TIKZ_PATCH_PROMPT)
+    # 补丁的上下文行必须与原始代码逐字一致：省略部分代码后，工程师会把 "% ... (省略 N 行)" 写进补丁，
+    # 导致补丁无法应用。因此上一轮的代码总是完整发送，只裁剪构建计划与反馈
+    fitted = apply_budget("engineer", [
+        plan_section("description", structured_description),
+        fixed_section("previous_code", previous_code),
+        error_section("feedback", feedback),
+    ])
+    revision_content = f"""
+    **1. Geometric Description (JSON):**
+    ```json
+    {fitted["description"]}
+    ```
+
+    **2. Previous LaTeX Code:**
+    ```latex
+    {fitted["previous_code"]}
+    ```
+
+    **3. Feedback:**
+    {fitted["feedback"]}
+    """
+    return [system_message, HumanMessage(content=_with_hint(revision_content, hint))]
+
+def get_tikz_patch_response(structured_description: str, previous_code: str, feedback: str,
+                            temperature: float = None, hint: str = "") -> str:
+    """
+    调用 TikZ 工程师 LLM，返回修正上一轮代码的补丁 (unified diff)。
+    补丁只在修正轮次请求，不使用 LLM 缓存：同样的失败会得到完全相同的提示词，缓存只会重放同一个补丁。
+    """
+    print("-> Calling TikZ Engineer (patch mode)...")
+    messages = build_tikz_patch_messages(structured_description, previous_code, feedback, hint)
+    response = invoke_llm(get_llm("translator", temperature), messages, use_cache=False, agent="translator")
+    return response.content.strip()
+
+async def aget_tikz_patch_response(structured_description: str, previous_code: str, feedback: str,
+                                   temperature: float = None, hint: str = "") -> str:
+    """get_tikz_patch_response 的异步版本。"""
+    print("-> Calling TikZ Engineer (patch mode, async)...")
+    messages = build_tikz_patch_messages(structured_description, previous_code, feedback, hint)
+    response = await ainvoke_llm(get_llm("translator", temperature), messages, use_cache=False, agent="translator")
+    return response.content.strip()
@@ -1,6 +1,7 @@
 # agents/title_generator.py
 from langchain_core.messages import HumanMessage, SystemMessage
-from config import text_llm
+from config import get_llm
+from tools.llm_client import ainvoke_llm, invoke_llm
 from prompts import TITLE_GENERATOR_PROMPT
 import re
 
@@ -12,8 +13,21 @@ def get_title_from_description(structured_description: str) -> str:
     system_message = SystemMessage(content=TITLE_GENERATOR_PROMPT)
     human_message = HumanMessage(content=structured_description)
 
-    response = text_llm.invoke([system_message, human_message])
-    title = response.content.strip()
+    response = invoke_llm(get_llm("title"), [system_message, human_message], agent="title")
+    return sanitize_title(response.content)
+
+async def aget_title_from_description(structured_description: str) -> str:
+    """get_title_from_description 的异步版本。"""
+    print("-> Calling Title Generator (async)...")
+    system_message = SystemMessage(content=TITLE_GENERATOR_PROMPT)
+    human_message = HumanMessage(content=structured_description)
+
+    response = await ainvoke_llm(get_llm("title"), [system_message, human_message], agent="title")
+    return sanitize_title(response.content)
+
+def sanitize_title(raw_title: str) -> str:
+    """将LLM返回的标题清理为适合文件系统的名称。"""
+    title = raw_title.strip()
 
     # 移除不适合用作文件名的特殊字符
     # 允许下划线、连字符和中文字符
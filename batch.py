@@ -0,0 +1,173 @@
+# batch.py
+import json
+import os
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from workflow import build_workflow
+from tools.checkpoint import checkpoint_enabled, discard_checkpoints, job_config, new_job_id, resumable_state
+from tools.logger import flush_logs, log_message
+from tools.tracing import export_trace, print_trace_summary, trace_run
+
+DEFAULT_WORKERS = 4
+
+
+def load_batch_requests(jsonl_path: str) -> list[dict]:
+    """
+    从 JSONL 文件中读取批量请求，每行一个 JSON 对象。
+    支持的字段: id/request_id (任务编号), data/body/text (文本描述或图片路径), type (可选)。
+    """
+    jobs = []
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Skipping line {line_no}: invalid JSON ({e})")
+                continue
+
+            data = record.get("data") or record.get("body") or record.get("text")
+            if not data:
+                print(f"⚠️ Skipping line {line_no}: no 'data' field found.")
+                continue
+
+            job_id = str(record.get("id") or record.get("request_id") or f"job-{line_no:04d}")
+            if record.get("type") in ("text", "image"):
+                request_type = record["type"]
+            else:
+                request_type = "image" if os.path.exists(data) else "text"
+
+            jobs.append({"id": job_id, "initial_request": {"type": request_type, "data": data}})
+    return jobs
+
+
+def summarize_final_state(job_id: str, final_state: dict, elapsed: float) -> dict:
+    """将工作流的最终状态整理为一条批处理结果记录。"""
+    saved_files = final_state.get("saved_files", [])
+    approved = final_state.get("critic_feedback") == "APPROVED"
+    return {
+        "id": job_id,
+        "status": "approved" if approved else "failed",
+        "iterations": final_state.get("iteration_count", 0),
+        "final_pdf": saved_files[-1] if approved and saved_files else None,
+        "saved_files": saved_files,
+        "output_directory": final_state.get("output_directory"),
+        "log_file_path": final_state.get("log_file_path"),
+        "critic_feedback": None if approved else final_state.get("critic_feedback"),
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def _stream_job(app, payload, config: dict, on_progress=None) -> dict:
+    """执行工作流并返回最终状态；每个节点完成后以 (节点名, 当前完整状态) 调用 on_progress"""
+    final_state = None
+    node_name = None
+    for mode, chunk in app.stream(payload, config, stream_mode=["updates", "values"]):
+        if mode == "updates":
+            node_name = next(iter(chunk), None)
+        else:
+            final_state = chunk
+            if on_progress and node_name:
+                on_progress(node_name, final_state)
+    return final_state or {}
+
+
+def run_job(app, job: dict, trace_spans: list = None, resume: bool = False, on_progress=None) -> dict:
+    """
+    运行单个任务，异常不会向外抛出，而是记录在结果中。
+    每个任务的追踪文件写入其输出目录；传入 trace_spans 时同时收集该任务的所有 span 用于汇总。
+    每次运行使用唯一的检查点 ID (结果中的 job_id)；resume 为 True 时从 job["job_id"] 的检查点继续运行。
+    传入 on_progress 时，每个节点完成后以 (节点名, 当前状态) 调用，用于报告进度。
+    """
+    start = time.perf_counter()
+    job_id = job.get("job_id") or new_job_id(job["id"])
+    payload = None if resume else {"initial_request": job["initial_request"]}
+    with trace_run(job["id"]) as tracer:
+        try:
+            final_state = _stream_job(app, payload, job_config(job_id), on_progress)
+            # 工作流已经运行结束，检查点不再需要；出错的任务保留检查点以便恢复
+            discard_checkpoints(job_id)
+        except Exception as e:
+            final_state = None
+            result = {
+                "id": job["id"],
+                "job_id": job_id,
+                "status": "error",
+                "error": f"{type(e).__name__}: {e}",
+                "elapsed_seconds": round(time.perf_counter() - start, 3),
+            }
+            if checkpoint_enabled():
+                print(f"⚠️ Job {job['id']} failed: {result['error']}. Resume with: python main.py --resume {job_id}")
+    if tracer is not None:
+        export_trace(tracer, (final_state or {}).get("output_directory", ""))
+        if trace_spans is not None:
+            trace_spans.extend(tracer.spans)
+    if final_state is None:
+        return result
+
+    result = {**summarize_final_state(job["id"], final_state, time.perf_counter() - start), "job_id": job_id}
+    log_path = result["log_file_path"]
+    if log_path:
+        log_message(log_path, json.dumps(result, ensure_ascii=False, indent=2), title=f"批处理任务结果 ({job['id']})")
+    return result
+
+
+def resume_job(app, job_id: str) -> dict:
+    """
+    从检查点恢复一个中断的任务：从最后完成的节点继续运行，沿用原来的输出目录和 workflow_log.txt。
+    没有检查点或任务已经结束时抛出 ValueError。
+    """
+    state = resumable_state(app, job_id)
+    print(f"\n--- Resuming job {job_id} (iteration {state.get('iteration_count', 0)}) ---")
+    if state.get("log_file_path"):
+        log_message(state["log_file_path"], f"从检查点恢复任务 {job_id}，继续运行。", title="恢复运行")
+    return run_job(app, {"id": job_id, "job_id": job_id}, resume=True)
+
+
+def run_batch(jsonl_path: str, workers: int = DEFAULT_WORKERS, summary_path: str = "") -> str:
+    """
+    并发地执行 JSONL 文件中的所有请求，并将每个任务的结果写入汇总 JSONL 文件。
+    返回汇总文件的路径。
+    """
+    jobs = load_batch_requests(jsonl_path)
+    if not summary_path:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        summary_path = os.path.join("outputs", f"batch_summary_{timestamp}.jsonl")
+    summary_dir = os.path.dirname(summary_path)
+    if summary_dir:
+        os.makedirs(summary_dir, exist_ok=True)
+
+    print(f"\n--- Batch Mode: {len(jobs)} job(s) from {jsonl_path} with {workers} worker(s) ---")
+    if not jobs:
+        return summary_path
+
+    # 编译后的图是无状态的 (状态保存在按任务区分的检查点中)，可以被所有工作线程共享
+    app = build_workflow()
+    counts = {"approved": 0, "failed": 0, "error": 0}
+    trace_spans = []
+    batch_start = time.perf_counter()
+
+    with open(summary_path, 'w', encoding='utf-8') as summary_file, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run_job, app, job, trace_spans): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            counts[result["status"]] += 1
+            # 每完成一个任务就立即写入，保证中途退出时已完成的结果不会丢失
+            summary_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            summary_file.flush()
+            print(f"\n<<< Batch Progress: {done}/{len(jobs)} | {result['id']} -> {result['status']} "
+                  f"({result['elapsed_seconds']}s) >>>")
+
+    elapsed = time.perf_counter() - batch_start
+    print("\n--- Batch Finished ---")
+    print(f"✅ Approved: {counts['approved']}  ❌ Failed: {counts['failed']}  ⚠️ Errors: {counts['error']}")
+    print(f"⏱️ Total time: {elapsed:.1f}s ({len(jobs) / elapsed:.2f} jobs/s)")
+    print(f"📄 Batch summary written to: {summary_path}")
+    print_trace_summary(trace_spans)
+    flush_logs()
+    return summary_path
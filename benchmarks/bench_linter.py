@@ -0,0 +1,55 @@
+# benchmarks/bench_linter.py
+# 在样例语料上运行编译前静态检查，统计可节省的 pdflatex 编译与审查员 (Critic) 调用次数。
+# 语料文件名以 bad_ 开头表示含有机械性错误，以 ok_ 开头表示可以正常编译。
+# 用法 (在项目根目录下): python -m benchmarks.bench_linter [--corpus DIR]
+import argparse
+import os
+import time
+
+from tools.latex_linter import lint_latex_code
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "fixtures", "lint_corpus")
+
+def main():
+    parser = argparse.ArgumentParser(description="Report how many compile + critic round trips the static pre-check saves.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="包含 .tex 样例的目录")
+    parser.add_argument("--verbose", action="store_true", help="打印每个文件的检查结果")
+    args = parser.parse_args()
+
+    files = sorted(name for name in os.listdir(args.corpus) if name.endswith(".tex"))
+    caught, missed, false_positives = [], [], []
+    total_time = 0.0
+
+    for name in files:
+        with open(os.path.join(args.corpus, name), 'r', encoding='utf-8') as f:
+            code = f.read()
+        start = time.perf_counter()
+        findings = lint_latex_code(code)
+        total_time += time.perf_counter() - start
+
+        expected_bad = name.startswith("bad_")
+        if findings and expected_bad:
+            caught.append(name)
+        elif findings:
+            false_positives.append(name)
+        elif expected_bad:
+            missed.append(name)
+
+        if args.verbose or (findings and not expected_bad):
+            status = "FLAGGED" if findings else "clean"
+            print(f"[{status}] {name}")
+            for finding in findings:
+                print(f"    - {finding}")
+
+    bad_total = sum(1 for name in files if name.startswith("bad_"))
+    print("\n--- Static Pre-check Report ---")
+    print(f"Corpus:                 {len(files)} documents ({bad_total} with mechanical errors)")
+    print(f"Caught before compile:  {len(caught)}/{bad_total}")
+    print(f"Missed:                 {', '.join(missed) or 'none'}")
+    print(f"False positives:        {', '.join(false_positives) or 'none'}")
+    # 每个被拦截的文档省去一次 pdflatex 编译和一次审查员 LLM 调用
+    print(f"Critic calls saved:     {len(caught)} (plus {len(caught)} pdflatex runs)")
+    print(f"Lint time:              {total_time * 1000 / max(1, len(files)):.2f} ms per document")
+
+if __name__ == "__main__":
+    main()
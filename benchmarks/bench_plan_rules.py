@@ -0,0 +1,53 @@
+# benchmarks/bench_plan_rules.py
+# 规则翻译器与数值几何验证的回归语料：每个样例声明期望结果，
+# check 为 "verify" 时 expect 表示验证器是否应当直接批准 tex，为 "translate" 时表示翻译器是否应当能翻译该计划。
+# 任何样例与期望不符时以非零状态退出。
+# 用法 (在项目根目录下): python -m benchmarks.bench_plan_rules [--corpus PATH] [--verbose]
+import argparse
+import json
+import os
+import sys
+
+from tools.geometry_verifier import format_verification_report, verify_geometry
+from tools.tikz_translator import translate_plan
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "fixtures", "plan_rules_corpus.json")
+
+def run_case(case: dict) -> tuple:
+    """返回 (实际结果, 详细信息)"""
+    plan = json.dumps(case["plan"], ensure_ascii=False)
+    if case["check"] == "translate":
+        code = translate_plan(plan)
+        return code is not None, code or "(fell back to the engineer LLM)"
+    if case["check"] == "verify":
+        report = verify_geometry(plan, case["tex"])
+        return report["approved"], format_verification_report(report)
+    raise ValueError(f"Unknown check: {case['check']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the rule-based translator and the geometry verifier against expected outcomes.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="回归语料 (JSON)")
+    parser.add_argument("--verbose", action="store_true", help="打印每个样例的详细结果")
+    args = parser.parse_args()
+
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    mismatches = []
+    for case in cases:
+        actual, detail = run_case(case)
+        ok = actual == case["expect"]
+        if not ok:
+            mismatches.append(case["id"])
+        if args.verbose or not ok:
+            print(f"[{'ok' if ok else 'MISMATCH'}] {case['check']} {case['id']}: expected {case['expect']}, got {actual}")
+            print("    " + detail.replace("\n", "\n    "))
+
+    print("\n--- Plan Rules Report ---")
+    for check in ("translate", "verify"):
+        subset = [case for case in cases if case["check"] == check]
+        print(f"{check:<10} {len(subset) - sum(1 for c in subset if c['id'] in mismatches)}/{len(subset)} as expected")
+    print(f"Mismatches: {', '.join(mismatches) or 'none'}")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
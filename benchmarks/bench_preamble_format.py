@@ -0,0 +1,83 @@
+# benchmarks/bench_preamble_format.py
+# 对比普通编译与使用预编译导言区格式时的单次 pdflatex 编译延迟。
+# 用法 (在项目根目录下): python -m benchmarks.bench_preamble_format --runs 10
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import tools.latex_format as latex_format
+from config import update_config
+from tools.latex_compiler import compile_latex_code
+
+SAMPLE_DOCUMENT = r"""\documentclass[tikz,border=10pt]{standalone}
+\usepackage{tikz}
+\usetikzlibrary{calc,intersections}
+
+\begin{document}
+\begin{tikzpicture}
+    \coordinate (A) at (0,0);
+    \coordinate (B) at (4,0);
+    \coordinate (C) at (4,3);
+    \coordinate (D) at (0,3);
+    \draw (A) -- (B) -- (C) -- (D) -- cycle;
+    \draw (A) -- (C);
+    \node[below left] at (A) {$A$};
+    \node[below right] at (B) {$B$};
+    \node[above right] at (C) {$C$};
+    \node[above left] at (D) {$D$};
+    % run %RUN%
+\end{tikzpicture}
+\end{document}
+"""
+
+def _time_compiles(runs: int, work_dir: str, label: str) -> list:
+    """编译 runs 次，返回每次的耗时（秒）；每次的源码略有不同以避开编译缓存"""
+    timings = []
+    for i in range(runs):
+        code = SAMPLE_DOCUMENT.replace("%RUN%", f"{label}-{i}")
+        start = time.perf_counter()
+        result = compile_latex_code(code, os.path.join(work_dir, f"{label}_{i}"), work_dir)
+        timings.append(time.perf_counter() - start)
+        if not result["success"]:
+            raise RuntimeError(f"Compilation failed during benchmark:\n{result['error']}")
+    return timings
+
+def _describe(timings: list) -> str:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return (f"mean {statistics.mean(timings) * 1000:7.1f} ms | median {statistics.median(timings) * 1000:7.1f} ms | "
+            f"p95 {p95 * 1000:7.1f} ms | min {ordered[0] * 1000:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pdflatex latency with and without the precompiled TikZ preamble.")
+    parser.add_argument("--runs", type=int, default=10, help="每种模式的编译次数 (默认: 10)")
+    args = parser.parse_args()
+
+    # 基准测试需要真实运行 pdflatex，因此关闭编译缓存
+    update_config("compile_cache", enabled=False)
+
+    with tempfile.TemporaryDirectory(prefix="mathsvg_bench_") as work_dir:
+        update_config("latex_format", enabled=False)
+        baseline = _time_compiles(args.runs, work_dir, "plain")
+
+        update_config("latex_format", enabled=True, directory=os.path.join(work_dir, "format"))
+        latex_format._format_state.update(ready=False, failed=False, directory=None)
+        build_start = time.perf_counter()
+        if not latex_format.ensure_format():
+            print("❌ Could not build the preamble format (is mylatexformat installed?).")
+            return
+        build_time = time.perf_counter() - build_start
+        with_format = _time_compiles(args.runs, work_dir, "fmt")
+
+    print("\n--- Precompiled Preamble Benchmark ---")
+    print(f"Runs per mode:      {args.runs}")
+    print(f"Normal compile:     {_describe(baseline)}")
+    print(f"With format:        {_describe(with_format)}")
+    print(f"One-off format build: {build_time * 1000:.1f} ms")
+    speedup = statistics.median(baseline) / statistics.median(with_format)
+    print(f"Median speedup:     {speedup:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_workflow.py
+# 离线的端到端基准：用本地替身 LLM 代替真实模型，将样例语料中的请求完整地跑过 build_workflow()，
+# 报告吞吐量、各节点 p50/p95 延迟、每个任务的迭代次数与编译耗时。不会发起任何真实的 API 调用。
+# 需要本机安装 pdflatex。
+# 用法 (在项目根目录下): python -m benchmarks.bench_workflow --latency 0.5 --workers 4 --repeat 2
+import argparse
+import math
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import run_job
+from benchmarks.fake_llm import FakeChatModel, install_fake_llm, load_cases
+from config import get_config, update_config
+from tools.tracing import summarize_spans
+from workflow import build_workflow
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "workflow_corpus.json")
+
+def _percentile(values: list, pct: float) -> float:
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _print_report(results: list, spans: list, wall: float, args) -> None:
+    statuses = {status: sum(1 for r in results if r["status"] == status) for status in ("approved", "failed", "error")}
+    iterations = [r.get("iterations", 0) for r in results if r["status"] != "error"]
+    job_times = [r["elapsed_seconds"] for r in results]
+
+    by_name = {}
+    for s in spans:
+        by_name.setdefault((s["category"], s["name"]), []).append(s["duration_ms"] / 1000)
+    totals = summarize_spans(spans)["totals"]
+
+    print("\n--- Workflow Benchmark Report ---")
+    print(f"Jobs:            {len(results)} ({len(results) // args.repeat} case(s) x {args.repeat}) | "
+          f"workers {args.workers} | fake latency {args.latency:.2f}s ± {args.jitter:.2f}s")
+    print(f"Wall time:       {wall:.2f}s")
+    print(f"Throughput:      {len(results) / wall:.2f} jobs/s")
+    print(f"Status:          approved {statuses['approved']}, failed {statuses['failed']}, error {statuses['error']}")
+    print(f"Job latency:     p50 {_percentile(job_times, 50):.2f}s, p95 {_percentile(job_times, 95):.2f}s")
+    if iterations:
+        print(f"Iterations/job:  mean {statistics.mean(iterations):.2f}, max {max(iterations)}")
+    print(f"LLM calls/job:   {totals['llm_calls'] / max(1, len(results)):.2f} "
+          f"({totals['llm_cache_hits']} cache hit(s) in total)")
+    print(f"LLM retries:     {totals['llm_retries']} | throttle wait {totals['throttle_ms'] / 1000:.2f}s in total")
+    print(f"Hedged calls:    {totals['llm_hedges']} ({totals['llm_hedge_wins']} won by the hedge)")
+    compiles = by_name.get(("compile", "pdflatex"), [])
+    print(f"pdflatex runs:   {len(compiles)} | p50 {_percentile(compiles, 50):.2f}s, p95 {_percentile(compiles, 95):.2f}s, "
+          f"total {sum(compiles):.2f}s")
+
+    print(f"\n{'category':<9} {'name':<24} {'count':>5} {'p50 (s)':>8} {'p95 (s)':>8} {'max (s)':>8}")
+    for (category, name), durations in sorted(by_name.items()):
+        if category == "run":
+            continue
+        print(f"{category:<9} {name[:24]:<24} {len(durations):>5} {_percentile(durations, 50):>8.3f} "
+              f"{_percentile(durations, 95):>8.3f} {max(durations):>8.3f}")
+
+    errors = [r for r in results if r["status"] == "error"]
+    for r in errors:
+        print(f"⚠️ {r['id']}: {r['error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the workflow offline against a fake LLM and report throughput and latency.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="基准语料 (JSON)")
+    parser.add_argument("--latency", type=float, default=0.5, help="替身 LLM 每次调用的平均延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="延迟的随机浮动范围 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身 LLM 返回模拟 429 错误的概率 (测试重试)")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="替身 LLM 调用卡顿的概率 (模拟长尾延迟)")
+    parser.add_argument("--stall-seconds", type=float, default=10.0, help="卡顿调用额外等待的秒数")
+    parser.add_argument("--workers", type=int, default=4, help="同时运行的任务数")
+    parser.add_argument("--repeat", type=int, default=1, help="语料重复运行的次数 (第二遍起可观察缓存效果)")
+    parser.add_argument("--no-cache", action="store_true", help="关闭 LLM 缓存与编译缓存")
+    parser.add_argument("--workdir", default="", help="输出与缓存目录 (默认使用新的临时目录，保证缓存为冷启动)")
+    args = parser.parse_args()
+
+    cases = load_cases(args.corpus)
+    install_fake_llm(FakeChatModel(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                   stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, cases=cases))
+    # 配置文件按相对路径加载：必须在切换工作目录之前读入，否则所有配置段都会退回默认值
+    get_config()
+    if args.no_cache:
+        update_config("llm_cache", enabled=False)
+        update_config("compile_cache", enabled=False)
+
+    # 输出目录与缓存目录都是相对路径，切换工作目录即可与正常运行的产物隔离 (配置已在上面读入)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mathsvg_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    print(f"--- Benchmarking {len(cases)} case(s) in {workdir} ---")
+
+    app = build_workflow()
+    results, spans = [], []
+    wall = 0.0
+    for round_number in range(args.repeat):
+        jobs = [{"id": f"{case['id']}#{round_number + 1}", "initial_request": {"type": "text", "data": case["request"]}}
+                for case in cases]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            results += list(executor.map(lambda job: run_job(app, job, spans), jobs))
+        wall += time.perf_counter() - start
+
+    _print_report(results, spans, wall, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# benchmarks/fake_llm.py
+# 离线基准测试使用的本地替身 LLM：根据系统提示词判断调用方的角色，从样例语料中返回预先准备好的回答，
+# 并按配置的延迟休眠以模拟网络与推理耗时。不会发起任何真实的 API 调用。
+import asyncio
+import difflib
+import json
+import random
+import re
+import time
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from prompts import ANALYST_PROMPT_ENHANCED, CRITIC_PROMPT_TIKZ, TIKZ_ENGINEER_PROMPT, TIKZ_PATCH_PROMPT, TITLE_GENERATOR_PROMPT
+
+# 语料中 tex 含有该标记时，替身审查员会给出修改意见，用于模拟"审查 -> 会诊 -> 重新生成"的迭代
+REJECT_MARKER = "% BENCH: reject"
+DEFAULT_CRITIC_FEEDBACK = "代码存在问题，请根据几何描述重新检查并修正。"
+
+_PREVIOUS_CODE = re.compile(r"Previous LaTeX Code:\*\*\s*```latex\n(.*?)\n\s*```", re.DOTALL)
+
+class _FakeResponse:
+    def __init__(self, status_code: int, headers: dict):
+        self.status_code = status_code
+        self.headers = headers
+
+class FakeRateLimitError(Exception):
+    """模拟服务端的 429 响应 (带 Retry-After)，用于测试限流与重试"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded (simulated), retry after {retry_after:g}s")
+        self.status_code = 429
+        self.response = _FakeResponse(429, {"retry-after": f"{retry_after:g}"})
+
+def load_cases(corpus_path: str) -> list:
+    """读取基准语料 (JSON 数组，每项包含 id/request/title/plan/tex)"""
+    with open(corpus_path, 'r', encoding='utf-8') as f:
+        cases = json.load(f)
+    for case in cases:
+        case["plan_json"] = json.dumps(case["plan"], ensure_ascii=False, indent=2)
+    return cases
+
+def _text_of(message) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "\n".join(part.get("text", "") for part in message.content if isinstance(part, dict))
+
+class FakeChatModel(BaseChatModel):
+    """按角色从语料中返回固定回答的聊天模型"""
+
+    model_name: str = "fake-geometry-llm"
+    temperature: float = 0.0
+    latency: float = 0.0
+    jitter: float = 0.0
+    # 以该概率返回模拟的 429 错误
+    error_rate: float = 0.0
+    retry_after: float = 0.2
+    # 以该概率额外等待 stall_seconds，模拟长尾延迟
+    stall_rate: float = 0.0
+    stall_seconds: float = 10.0
+    cases: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-geometry"
+
+    def _find_case(self, text: str) -> dict:
+        """按原始请求或计划描述找到对应的样例；多个匹配时取描述最长的一个"""
+        matches = [case for case in self.cases
+                   if case["request"] in text or case["plan"]["description"] in text]
+        if not matches:
+            raise ValueError(f"No benchmark case matches the prompt: {text[:80]!r}")
+        return max(matches, key=lambda case: len(case["plan"]["description"]))
+
+    def respond(self, messages: list) -> str:
+        system_prompt = _text_of(messages[0])
+        user_text = "\n".join(_text_of(m) for m in messages[1:])
+        case = self._find_case(user_text)
+        if system_prompt == ANALYST_PROMPT_ENHANCED:
+            # 初始分析与会诊都返回同一份计划
+            return case["plan_json"]
+        if system_prompt == TITLE_GENERATOR_PROMPT:
+            return case["title"]
+        if system_prompt == TIKZ_ENGINEER_PROMPT:
+            revision = "Previous attempt failed" in user_text
+            return case["tex"][min(1 if revision else 0, len(case["tex"]) - 1)]
+        if system_prompt == TIKZ_PATCH_PROMPT:
+            # 补丁模式：返回从上一轮代码到修正版本的统一差异
+            previous = _PREVIOUS_CODE.search(user_text)
+            target = case["tex"][min(1, len(case["tex"]) - 1)]
+            diff = difflib.unified_diff(previous.group(1).strip().splitlines() if previous else [],
+                                        target.strip().splitlines(), lineterm="", n=2)
+            return "\n".join(diff)
+        if system_prompt == CRITIC_PROMPT_TIKZ:
+            if REJECT_MARKER in user_text:
+                return case.get("critic_feedback", DEFAULT_CRITIC_FEEDBACK)
+            if "Compilation Result:**\n    Failure" in user_text:
+                return "编译失败：请根据编译错误修正代码。"
+            return "APPROVED"
+        raise ValueError("Unknown system prompt in benchmark fake LLM.")
+
+    def _delay(self) -> float:
+        stall = self.stall_seconds if self.stall_rate and random.random() < self.stall_rate else 0.0
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)) + stall
+
+    def _result(self, messages: list) -> ChatResult:
+        content = self.respond(messages)
+        # 粗略估计 token 数，使追踪报告中的 token 统计有意义
+        prompt_tokens = sum(len(_text_of(m)) for m in messages) // 2
+        completion_tokens = len(content) // 2
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeRateLimitError(self.retry_after)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay())
+        self._maybe_fail()
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return self._result(messages)
+
+def install_fake_llm(model: FakeChatModel) -> None:
+    """让所有角色 (规划师、工程师、审查员、标题生成) 都使用替身模型"""
+    from config import set_llm_override
+    set_llm_override(model)
@@ -1,58 +1,134 @@
 # config.py
+# 配置与 LLM 客户端都在第一次使用时才加载/创建：导入本模块不会导入 langchain_openai，
+# 缺少 config.yaml 或 API 密钥时也只在真正需要调用模型时才报错。
 import os
+import threading
+
 import yaml
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
 # 加载 .env 文件中的环境变量（如果存在）
 load_dotenv()
 
+# 角色 -> (使用的模型, config.yaml 中 temperatures 部分的键, 默认温度)
+LLM_ROLES = {
+    "planner": ("multimodal_model_name", "planner_temperature", 0.1),
+    "translator": ("text_model_name", "translator_temperature", 0.0),  # 对于代码生成，需要确定性
+    "critic": ("text_model_name", "critic_temperature", 0.0),
+    "title": ("text_model_name", "title_temperature", 0.0),
+}
+
+# 各功能模块的配置段
+CONFIG_SECTIONS = (
+    "temperatures", "llm_cache", "compile_cache", "latex_format", "compile_executor", "geometry_verifier",
+    "plan_translator", "pdf_render", "sketch_preprocess", "tracing", "cassette", "engineer_patch",
+    "context_budget", "speculative_engineer", "checkpoint",
+    "logging", "server", "llm_limits", "hedging",
+)
+
+_lock = threading.RLock()
+_app_config = None
+_llms = {}
+_llm_override = None
+
 def load_config(config_path="config.yaml"):
-    """从 YAML 文件和环境变量加载配置"""
-    # 从 YAML 文件加载默认配置
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
+    """从 YAML 文件和环境变量加载配置；文件不存在时只使用环境变量与各模块的默认值"""
+    config = {}
+    if os.path.exists(config_path):
+        # 从 YAML 文件加载默认配置
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
 
     # 优先使用环境变量覆盖配置
-    api_key = os.getenv("CUSTOM_API_KEY", config.get("api_key"))
-    base_url = os.getenv("CUSTOM_BASE_URL", config.get("base_url"))
-    multimodal_model_name = os.getenv("CUSTOM_MODEL_NAME", config.get("multimodal_model"))
-    text_model_name = os.getenv("CUSTOM_TEXT_MODEL_NAME", config.get("text_model"))
+    loaded = {
+        "api_key": os.getenv("CUSTOM_API_KEY", config.get("api_key")),
+        "base_url": os.getenv("CUSTOM_BASE_URL", config.get("base_url")),
+        "multimodal_model_name": os.getenv("CUSTOM_MODEL_NAME", config.get("multimodal_model")),
+        "text_model_name": os.getenv("CUSTOM_TEXT_MODEL_NAME", config.get("text_model")),
+    }
+    for section in CONFIG_SECTIONS:
+        loaded[section] = config.get(section) or {}
+    return loaded
+
+def get_config() -> dict:
+    """返回全局配置，第一次调用时从 config.yaml 加载"""
+    global _app_config
+    if _app_config is None:
+        with _lock:
+            if _app_config is None:
+                _app_config = load_config(os.getenv("MATHSVG_CONFIG", "config.yaml"))
+    return _app_config
 
-    if not api_key or api_key == "YOUR_API_KEY_HERE":
+def config_section(name: str) -> dict:
+    """
+    返回功能模块的配置段。各模块在用到设置的函数中调用，而不是在导入时读取成模块常量，
+    这样导入模块不会加载配置，基准脚本与测试修改配置后也能立即生效。
+    """
+    return get_config().get(name) or {}
+
+def update_config(section: str, **values) -> None:
+    """修改配置段中的设置 (如基准脚本关闭缓存)；之后读取该配置段的函数立即使用新值"""
+    get_config().setdefault(section, {}).update(values)
+
+def _create_llm(role: str):
+    # langchain_openai 导入较慢，只在第一次需要调用模型时导入
+    from langchain_openai import ChatOpenAI
+
+    app_config = get_config()
+    if not app_config["api_key"] or app_config["api_key"] == "YOUR_API_KEY_HERE":
         raise ValueError("API key not found. Please set it in config.yaml or as CUSTOM_API_KEY environment variable.")
 
-    return {
-        "api_key": api_key,
-        "base_url": base_url,
-        "multimodal_model_name": multimodal_model_name,
-        "text_model_name": text_model_name,
-    }
+    from tools.llm_limits import http_clients, request_timeout
 
-# 加载配置
-APP_CONFIG = load_config()
-
-# 初始化 LLM 实例，以便在整个项目中重复使用
-# 多模态模型
-multimodal_llm = ChatOpenAI(
-    model=APP_CONFIG["multimodal_model_name"],
-    api_key=APP_CONFIG["api_key"],
-    base_url=APP_CONFIG["base_url"],
-    temperature=0.1,
-    max_tokens=4096,
-    request_timeout=60  # <-- 增加超时设置 (60秒)
-)
+    model_field, temperature_key, default_temperature = LLM_ROLES[role]
+    temperature = float(app_config["temperatures"].get(temperature_key, default_temperature))
+    http_client, http_async_client = http_clients(app_config["base_url"])
+    llm = ChatOpenAI(
+        model=app_config[model_field],
+        api_key=app_config["api_key"],
+        base_url=app_config["base_url"],
+        temperature=temperature,
+        max_tokens=4096,
+        request_timeout=request_timeout(),
+        # 重试由 tools/llm_limits 统一处理 (遵守 Retry-After 并计入指标)，关闭 SDK 自带的重试
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+    print(f"✅ {role.capitalize()} model: {app_config[model_field]} (temperature {temperature:g})")
+    return llm
 
-# 文本模型
-text_llm = ChatOpenAI(
-    model=APP_CONFIG["text_model_name"],
-    api_key=APP_CONFIG["api_key"],
-    base_url=APP_CONFIG["base_url"],
-    temperature=0.0, # 对于代码生成和审查，需要确定性
-    max_tokens=4096,
-    request_timeout=60  # <-- 增加超时设置 (60秒)
-)
+def get_llm(role: str, temperature: float = None):
+    """
+    返回指定角色 (planner / translator / critic / title) 的 LLM 客户端，第一次调用时创建并复用。
+    指定 temperature 时返回使用该温度的副本 (共享同一个底层 HTTP 客户端)。
+    通过 set_llm_override 设置了替身模型时，所有角色都返回替身模型。
+    """
+    if _llm_override is not None:
+        llm = _llm_override
+    elif role not in LLM_ROLES:
+        raise ValueError(f"Unknown LLM role: {role}")
+    else:
+        if role not in _llms:
+            with _lock:
+                if role not in _llms:
+                    _llms[role] = _create_llm(role)
+        llm = _llms[role]
+    if temperature is None or float(temperature) == llm.temperature:
+        return llm
+    return llm.model_copy(update={"temperature": float(temperature)})
+
+def set_llm_override(llm) -> None:
+    """用替身模型 (如基准测试的 FakeChatModel) 代替所有角色的 LLM；传入 None 恢复正常"""
+    global _llm_override
+    _llm_override = llm
 
-print("✅ Configuration loaded successfully.")
-print(f"✅ Multimodal Model: {APP_CONFIG['multimodal_model_name']}")
-print(f"✅ Text Model: {APP_CONFIG['text_model_name']}")
+def __getattr__(name: str):
+    # 向后兼容旧的模块级属性: APP_CONFIG / multimodal_llm / text_llm
+    if name == "APP_CONFIG":
+        return get_config()
+    if name == "multimodal_llm":
+        return get_llm("planner")
+    if name == "text_llm":
+        return get_llm("translator")
+    raise AttributeError(f"module 'config' has no attribute {name!r}")
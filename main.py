@@ -1,11 +1,36 @@
 # main.py
 import os
+import argparse
 
-from workflow import build_workflow
-from tools.logger import log_message # 新增导入
+from tools.logger import flush_logs, log_message # 新增导入
+from tools.tracing import export_trace, print_trace_summary, trace_run
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Geometric Vectorization Agent System")
+    parser.add_argument("--batch", metavar="JSONL", help="批处理模式：从 JSONL 文件读取多个请求并发执行")
+    parser.add_argument("--workers", type=int, default=4, help="批处理模式下同时运行的任务数 (默认: 4)")
+    parser.add_argument("--summary", metavar="PATH", default="", help="批处理结果汇总 JSONL 文件的路径")
+    parser.add_argument("--resume", metavar="JOB_ID", help="从检查点恢复一个中断的任务，沿用原来的输出目录和日志")
+    return parser.parse_args()
 
 def main():
     """主函数，运行整个智能体系统"""
+    args = parse_args()
+    if args.batch:
+        from batch import run_batch
+        run_batch(args.batch, workers=args.workers, summary_path=args.summary)
+        print_cache_stats()
+        return
+
+    if args.resume:
+        resume(args.resume)
+        print_cache_stats()
+        return
+
+    # langgraph 等依赖导入较慢，解析完命令行参数后才导入，--help 可以立即返回
+    from workflow import build_workflow
+    from tools.checkpoint import checkpoint_enabled, discard_checkpoints, job_config, new_job_id
     app = build_workflow()
 
     print("\n--- Welcome to the Geometric Vectorization Agent System ---")
@@ -23,22 +48,29 @@ def main():
 
     # 定义初始状态
     initial_state = {"initial_request": initial_request}
+    job_id = new_job_id()
+    if checkpoint_enabled():
+        print(f"🧷 Job ID: {job_id} (if interrupted, resume with: python main.py --resume {job_id})")
 
     # 流式执行工作流并打印每一步的结果
     final_state = None
-    for event in app.stream(initial_state):
-        # event 是一个字典，key是节点名，value是该节点的输出
-        (node_name, node_output), = event.items()
-        print(f"\n<<< Finished Node: {node_name} >>>")
-        # print(f"Output: {node_output}")
+    with trace_run("interactive") as tracer:
+        for event in app.stream(initial_state, job_config(job_id)):
+            # event 是一个字典，key是节点名，value是该节点的输出
+            (node_name, node_output), = event.items()
+            print(f"\n<<< Finished Node: {node_name} >>>")
+            # print(f"Output: {node_output}")
         
-        # 更新最终状态，保持状态累积
-        if final_state:
-            final_state.update(node_output)
-        else:
-            final_state = node_output
+            # 更新最终状态，保持状态累积
+            if final_state:
+                final_state.update(node_output)
+            else:
+                final_state = node_output
+    # 工作流已经运行结束，检查点不再需要 (中途出错时保留，以便 --resume)
+    discard_checkpoints(job_id)
 
     print("\n--- Workflow Finished ---")
+    _report_trace(tracer, (final_state or {}).get("output_directory", ""))
     
     # 提取并展示最终结果
 
@@ -80,11 +112,53 @@ def main():
         # 新增: 将最终总结写入日志并告知用户
         if log_path:
             log_message(log_path, "\n".join(final_summary_log), title="最终总结")
+            flush_logs()
             print(f"\n📄 A detailed log of this workflow has been saved to: {log_path}")
 
     else:
         print("An unexpected error occurred and the workflow did not complete.")
 
+    print_cache_stats()
+
+def resume(job_id: str):
+    """从检查点恢复中断的任务并打印结果"""
+    from batch import resume_job
+    from workflow import build_workflow
+    try:
+        result = resume_job(build_workflow(), job_id)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if result["status"] == "error":
+        print(f"\n⚠️ Resumed job stopped again: {result['error']}")
+        return
+    status = "✅ Success! The process was approved." if result["status"] == "approved" else "❌ Failure. The process finished without final approval."
+    print(f"\n{status}")
+    for file_path in result["saved_files"]:
+        print(f"- {file_path}")
+    if result["log_file_path"]:
+        flush_logs()
+        print(f"\n📄 A detailed log of this workflow has been saved to: {result['log_file_path']}")
+
+def _report_trace(tracer, output_directory: str):
+    """打印耗时分布并导出追踪文件"""
+    if tracer is None:
+        return
+    print_trace_summary(tracer.spans)
+    paths = export_trace(tracer, output_directory)
+    print(f"📈 Trace written to: {paths['chrome_trace']} (metrics: {paths['metrics']})")
+
+def print_cache_stats():
+    """打印缓存命中统计"""
+    from tools.llm_cache import llm_cache_stats
+    from tools.compile_cache import compile_cache_stats
+    from tools.pdf_utils import pdf_render_cache_stats
+    from tools.image_utils import sketch_cache_stats
+    for label, stats in (("LLM", llm_cache_stats()), ("LaTeX compile", compile_cache_stats()),
+                         ("PDF render", pdf_render_cache_stats()), ("Sketch", sketch_cache_stats())):
+        print(f"🗄️ {label} cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+              f"{stats['entries']} entries ({stats['bytes'] / 1024:.1f} KB)")
+
 
 if __name__ == "__main__":
     main()
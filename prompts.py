@@ -230,6 +230,28 @@ TIKZ_ENGINEER_PROMPT = r"""
 现在，请根据提供的JSON构建计划，生成完整的LaTeX代码。
 """
 
+TIKZ_PATCH_PROMPT = r"""
+你是"TikZ代码翻译官"，现在负责**修改**你上一轮生成的LaTeX/TikZ代码。
+你会收到三部分输入：最新的"几何构建计划"(JSON)、上一轮的完整LaTeX代码，以及审查意见或编译错误。
+
+**核心职责:**
+1.  **最小修改**: 只修改需要修正的行，其余代码保持原样，不要重新排版或改写无关的部分。
+2.  **忠于计划**: 修改后的代码必须符合最新的构建计划，并解决审查意见中指出的问题。
+
+**输出:**
+只输出一个统一差异格式 (unified diff) 的补丁，**不要**输出完整文档，也不要附加任何解释。格式要求:
+-   每个修改块以 `@@ -起始行,行数 +起始行,行数 @@` 开头。
+-   上下文行以一个空格开头，删除的行以 `-` 开头，新增的行以 `+` 开头。
+-   每个修改块前后保留 1 到 3 行未修改的上下文，且上下文必须与原代码**逐字一致**。
+
+**示例:**
+@@ -6,3 +6,3 @@
+     \coordinate (A) at (0,0);
+-    \coordinate (B) at (3,0);
++    \coordinate (B) at (4,0);
+     \draw (A) -- (B);
+"""
+
 CRITIC_PROMPT_TIKZ = r"""
 你是"LaTeX与几何审查员"，一个极其严谨的AI。
 你的职责是审查由"TikZ工程师"生成的 .tex 代码，以及编译结果，确保最终输出在几何上精确，并且代码本身符合LaTeX和TikZ的最佳实践。
@@ -0,0 +1,303 @@
+# server.py
+# 本地 HTTP 任务服务 (仅使用标准库)：接收文本或图片请求并放入队列，由固定数量的工作线程
+# 通过共享的 build_workflow() 执行，提供任务状态、迭代进度与最终 PDF 的查询接口。
+# 用法: python server.py --port 8000 --workers 4
+#       python server.py --fake-llm --fake-latency 0.5   (使用基准测试的替身 LLM，完全离线，便于压测)
+#
+# 接口:
+#   POST /jobs              {"type": "text", "data": "..."} 或 {"type": "image", "image_base64": "...", "filename": "sketch.png"}
+#                           (图片也可以用 "data" 指定上传目录中已有的文件，不接受上传目录以外的路径)
+#   GET  /jobs              所有任务的状态 (已结束的任务最多保留 server.max_finished_jobs 条)
+#   GET  /jobs/<id>         单个任务的状态与进度
+#   GET  /jobs/<id>/pdf     最终 (或最近一次成功编译的) PDF
+#   GET  /health            队列长度、工作线程数与各模型的 LLM 重试/限流/对冲指标
+import argparse
+import base64
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import config_section
+
+_JOB_PATH = re.compile(r"^/jobs/([\w-]+)(/pdf)?/?$")
+_FINISHED = ("approved", "failed", "error")
+
+def _settings() -> dict:
+    """读取 server 配置段并补全默认值"""
+    section = config_section("server")
+    return {
+        "host": section.get("host", "127.0.0.1"),
+        "port": int(section.get("port", 8000)),
+        "workers": int(section.get("workers", 4)),
+        # 排队任务数上限，超出时返回 503
+        "max_queue": int(section.get("max_queue", 100)),
+        "upload_directory": section.get("upload_directory", os.path.join("outputs", "uploads")),
+        "max_body_bytes": int(section.get("max_body_mb", 20) * 1024 * 1024),
+        # 已结束任务记录的保留数量上限，避免长时间运行的服务内存无限增长
+        "max_finished_jobs": int(section.get("max_finished_jobs", 1000)),
+    }
+
+class JobService:
+    """任务队列与固定数量的工作线程；所有任务共享同一个编译好的工作流 (每个任务有独立的检查点)"""
+
+    def __init__(self, app, workers: int = None, max_queue: int = None):
+        settings = _settings()
+        workers = workers or settings["workers"]
+        max_queue = max_queue or settings["max_queue"]
+        self.app = app
+        self.workers = workers
+        self.max_finished = max(1, settings["max_finished_jobs"])
+        self._jobs = {}
+        # 已结束任务的 ID，按结束顺序排列
+        self._finished = deque()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        for n in range(workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{n + 1}", daemon=True).start()
+
+    def submit(self, initial_request: dict) -> dict:
+        """将请求加入队列并返回任务记录；队列已满时抛出 queue.Full"""
+        from tools.checkpoint import new_job_id
+        job_id = new_job_id()
+        record = {
+            "id": job_id,
+            "status": "queued",
+            "request_type": initial_request["type"],
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "current_node": None,
+            "iteration": 0,
+            "output_directory": None,
+            "saved_files": [],
+            "final_pdf": None,
+            "critic_feedback": None,
+            "error": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = record
+        try:
+            self._queue.put_nowait((job_id, initial_request))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        return dict(record)
+
+    def get(self, job_id: str):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record else None
+
+    def list(self) -> list:
+        with self._lock:
+            return [dict(record) for record in self._jobs.values()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for record in self._jobs.values():
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+        from tools.hedging import hedge_metrics
+        from tools.llm_limits import llm_metrics
+        return {"status": "ok", "workers": self.workers, "queued": self._queue.qsize(), "jobs": counts,
+                "llm": llm_metrics(), "hedging": hedge_metrics()}
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+            if fields.get("status") in _FINISHED:
+                self._finished.append(job_id)
+                # 超出上限时丢弃最早结束的任务记录
+                while len(self._finished) > self.max_finished:
+                    self._jobs.pop(self._finished.popleft(), None)
+
+    def _worker(self) -> None:
+        from batch import run_job
+        while True:
+            job_id, initial_request = self._queue.get()
+            self._update(job_id, status="running", started_at=time.time())
+
+            def on_progress(node_name: str, state: dict, job_id=job_id):
+                self._update(job_id, current_node=node_name, iteration=state.get("iteration_count", 0),
+                             output_directory=state.get("output_directory"),
+                             saved_files=list(state.get("saved_files") or []))
+
+            try:
+                result = run_job(self.app, {"id": job_id, "job_id": job_id, "initial_request": initial_request},
+                                 on_progress=on_progress)
+                self._update(job_id, status=result["status"], finished_at=time.time(),
+                             iteration=result.get("iterations", 0),
+                             saved_files=result.get("saved_files", []),
+                             final_pdf=result.get("final_pdf"),
+                             critic_feedback=result.get("critic_feedback"),
+                             error=result.get("error"))
+            except Exception as e:
+                self._update(job_id, status="error", finished_at=time.time(), error=f"{type(e).__name__}: {e}")
+            finally:
+                self._queue.task_done()
+
+def _job_view(record: dict) -> dict:
+    """返回给客户端的任务状态"""
+    end = record["finished_at"] or time.time()
+    view = {**record, "elapsed_seconds": round(end - record["started_at"], 3) if record["started_at"] else 0.0}
+    if _pdf_of(record):
+        view["pdf_url"] = f"/jobs/{record['id']}/pdf"
+    return view
+
+def _pdf_of(record: dict):
+    """任务的最终 PDF；未通过审查时取最近一次成功编译的 PDF"""
+    return record["final_pdf"] or (record["saved_files"][-1] if record["saved_files"] else None)
+
+def _upload_path(path: str):
+    """path 位于上传目录中时返回其真实路径，否则返回 None (不允许客户端让服务读取任意文件)"""
+    upload_directory = os.path.realpath(_settings()["upload_directory"])
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([upload_directory, real_path]) != upload_directory:
+        return None
+    return real_path
+
+def parse_job_request(body: dict) -> dict:
+    """将请求体转换为工作流的 initial_request；格式错误时抛出 ValueError"""
+    request_type = body.get("type", "image" if body.get("image_base64") else "text")
+    if request_type == "text":
+        data = body.get("data") or body.get("text")
+        if not isinstance(data, str) or not data.strip():
+            raise ValueError("A text request needs a non-empty 'data' field.")
+        return {"type": "text", "data": data.strip()}
+    if request_type == "image":
+        if body.get("image_base64"):
+            filename = os.path.basename(body.get("filename") or "sketch.png")
+            upload_directory = _settings()["upload_directory"]
+            os.makedirs(upload_directory, exist_ok=True)
+            path = os.path.join(upload_directory, f"{time.time_ns()}_{filename}")
+            with open(path, 'wb') as f:
+                f.write(base64.b64decode(body["image_base64"], validate=True))
+            return {"type": "image", "data": path}
+        data = body.get("data")
+        path = _upload_path(data) if isinstance(data, str) and data else None
+        if path and os.path.isfile(path):
+            return {"type": "image", "data": path}
+        raise ValueError("An image request needs 'image_base64' or the 'data' path of an existing file in the upload directory.")
+    raise ValueError(f"Unknown request type: {request_type!r}")
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    service: JobService = None
+    verbose = False
+
+    def log_message(self, format, *args):
+        # 压测时每个请求都打印一行会淹没工作流的输出
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: HTTPStatus, payload) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send_json(status, {"error": message})
+
+    def do_GET(self):
+        if self.path in ("/health", "/health/"):
+            return self._send_json(HTTPStatus.OK, self.service.stats())
+        if self.path in ("/jobs", "/jobs/"):
+            return self._send_json(HTTPStatus.OK, [_job_view(r) for r in self.service.list()])
+        match = _JOB_PATH.match(self.path)
+        if not match:
+            return self._send_error(HTTPStatus.NOT_FOUND, "Not found.")
+        record = self.service.get(match.group(1))
+        if record is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job: {match.group(1)}")
+        if not match.group(2):
+            return self._send_json(HTTPStatus.OK, _job_view(record))
+
+        pdf_path = _pdf_of(record)
+        if not pdf_path or not os.path.exists(pdf_path):
+            return self._send_error(HTTPStatus.NOT_FOUND, f"Job {record['id']} has no PDF yet (status: {record['status']}).")
+        with open(pdf_path, 'rb') as f:
+            data = f.read()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Content-Disposition", f'inline; filename="{os.path.basename(pdf_path)}"')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path not in ("/jobs", "/jobs/"):
+            return self._send_error(HTTPStatus.NOT_FOUND, "Not found.")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._send_error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length header.")
+        if length < 0:
+            return self._send_error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length header.")
+        if length > _settings()["max_body_bytes"]:
+            return self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body is too large.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object.")
+            initial_request = parse_job_request(body)
+        except (ValueError, TypeError) as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        try:
+            record = self.service.submit(initial_request)
+        except queue.Full:
+            # 任务没有入队，本次上传的图片不会再被使用；不删除的话客户端重试时会不断填满上传目录
+            if initial_request["type"] == "image" and body.get("image_base64"):
+                try:
+                    os.remove(initial_request["data"])
+                except OSError:
+                    pass
+            return self._send_error(HTTPStatus.SERVICE_UNAVAILABLE, "The job queue is full. Try again later.")
+        self._send_json(HTTPStatus.ACCEPTED, {**_job_view(record), "status_url": f"/jobs/{record['id']}"})
+
+def parse_args():
+    settings = _settings()
+    parser = argparse.ArgumentParser(description="Run the geometric vectorization workflow as a local HTTP job service.")
+    parser.add_argument("--host", default=settings["host"])
+    parser.add_argument("--port", type=int, default=settings["port"])
+    parser.add_argument("--workers", type=int, default=settings["workers"], help="同时运行的任务数")
+    parser.add_argument("--max-queue", type=int, default=settings["max_queue"], help="排队任务数上限")
+    parser.add_argument("--fake-llm", action="store_true", help="使用基准测试的替身 LLM (不发起任何 API 调用)")
+    parser.add_argument("--fake-latency", type=float, default=0.5, help="替身 LLM 每次调用的平均延迟 (秒)")
+    parser.add_argument("--corpus", default="", help="替身 LLM 使用的语料 (默认为基准测试语料)")
+    parser.add_argument("--verbose", action="store_true", help="打印每个 HTTP 请求")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.fake_llm:
+        from benchmarks.bench_workflow import DEFAULT_CORPUS
+        from benchmarks.fake_llm import FakeChatModel, install_fake_llm, load_cases
+        install_fake_llm(FakeChatModel(latency=args.fake_latency, jitter=args.fake_latency / 5,
+                                       cases=load_cases(args.corpus or DEFAULT_CORPUS)))
+        print("🧪 Using the benchmark stand-in LLM. Only requests from the corpus can be answered.")
+
+    from workflow import build_workflow
+    from tools.logger import flush_logs
+    JobRequestHandler.service = JobService(build_workflow(), workers=max(1, args.workers), max_queue=args.max_queue)
+    JobRequestHandler.verbose = args.verbose
+    server = ThreadingHTTPServer((args.host, args.port), JobRequestHandler)
+    print(f"🌐 Job service listening on http://{args.host}:{args.port} ({args.workers} worker(s))")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+        flush_logs()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# tools/cassette.py
+# LLM 流量的录制/回放 ("cassette")。录制模式下将每次真实调用的请求与响应追加到 JSONL 文件；
+# 回放模式下按规范化后的消息内容查找录制的响应，完全离线地重现一次运行，找不到时直接报错。
+# 用于在相同的工作负载下对比编译、渲染、缓存等非 LLM 部分的优化效果。
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+from config import config_section
+from tools.llm_cache import model_name_of, normalize_content
+from tools.hedging import ahedged_invoke, hedged_invoke
+
+_OUTPUT_PATH = re.compile(r"outputs[\\/][^\s'\"`)]+")
+_WHITESPACE = re.compile(r"\s+")
+
+class CassetteMissError(LookupError):
+    """回放模式下，请求在录制文件中没有对应的响应"""
+
+def _settings() -> tuple:
+    """返回 (模式, 录制文件路径, 回放时是否按录制时的耗时等待)；环境变量优先于 config.yaml，便于临时切换"""
+    section = config_section("cassette")
+    mode = os.getenv("MATHSVG_CASSETTE_MODE", section.get("mode", "off")).lower()
+    path = os.getenv("MATHSVG_CASSETTE", section.get("path", os.path.join(".cache", "cassette.jsonl")))
+    realtime = os.getenv("MATHSVG_CASSETTE_REALTIME", str(section.get("realtime", False))).lower() in ("1", "true", "yes")
+    return mode, path, realtime
+
+def _normalize_text(text: str) -> str:
+    """忽略空白差异，并屏蔽每次运行都不同的输出目录 (含时间戳)"""
+    return _WHITESPACE.sub(" ", _OUTPUT_PATH.sub("outputs/<path>", text)).strip()
+
+def _normalize_message(message) -> dict:
+    content = normalize_content(message.content)
+    if isinstance(content, str):
+        content = _normalize_text(content)
+    else:
+        content = [{**part, "text": _normalize_text(part["text"])}
+                   if isinstance(part, dict) and part.get("type") == "text" else part for part in content]
+    return {"role": message.type, "content": content}
+
+def cassette_key(messages: list) -> str:
+    """按规范化后的消息内容计算匹配键 (不包含模型名称，允许换模型回放)"""
+    payload = [_normalize_message(m) for m in messages]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+class Cassette:
+    """一个录制文件。同一请求出现多次时按录制顺序依次回放，用尽后重复最后一条。"""
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._recordings = {}
+        self._positions = {}
+        if mode == "replay":
+            self._load()
+        elif mode == "record":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette file not found: {self.path}")
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recordings.setdefault(entry["key"], []).append(entry)
+        print(f"📼 Replaying {sum(len(v) for v in self._recordings.values())} recorded LLM call(s) from {self.path}")
+
+    def lookup(self, messages: list) -> dict:
+        key = cassette_key(messages)
+        with self._lock:
+            entries = self._recordings.get(key)
+            if not entries:
+                preview = _normalize_text(str(messages[-1].content))[:120]
+                raise CassetteMissError(f"No recorded response in {self.path} for request {key[:12]} ({preview!r}).")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        return entries[min(position, len(entries) - 1)]
+
+    def record(self, llm, messages: list, response, latency: float) -> None:
+        entry = {
+            "key": cassette_key(messages),
+            "model": model_name_of(llm),
+            "messages": [_normalize_message(m) for m in messages],
+            "response": {
+                "content": response.content,
+                "response_metadata": getattr(response, "response_metadata", {}) or {},
+                "usage_metadata": getattr(response, "usage_metadata", None),
+            },
+            "latency": round(latency, 4),
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def active_cassette():
+    """返回当前启用的录制文件；mode 为 off 时返回 None"""
+    global _cassette
+    mode, path, _ = _settings()
+    if mode not in ("record", "replay"):
+        return None
+    with _cassette_lock:
+        if _cassette is None or (_cassette.path, _cassette.mode) != (path, mode):
+            _cassette = Cassette(path, mode)
+    return _cassette
+
+def _replayed_message(entry: dict) -> AIMessage:
+    response = entry["response"]
+    return AIMessage(
+        content=response["content"],
+        response_metadata={**response.get("response_metadata", {}), "cassette": True},
+        usage_metadata=response.get("usage_metadata"),
+    )
+
+def call_llm(llm, messages: list, attrs: dict = None):
+    """按录制/回放模式调用 LLM；真实调用受速率、并发限制，自动重试并按智能体的策略对冲 (attrs 为追踪 span 的属性)"""
+    cassette = active_cassette()
+    if cassette and cassette.mode == "replay":
+        entry = cassette.lookup(messages)
+        if _settings()[2]:
+            time.sleep(entry["latency"])
+        return _replayed_message(entry)
+
+    start = time.perf_counter()
+    response = hedged_invoke(llm, messages, attrs)
+    if cassette:
+        cassette.record(llm, messages, response, time.perf_counter() - start)
+    return response
+
+async def acall_llm(llm, messages: list, attrs: dict = None):
+    """call_llm 的异步版本"""
+    cassette = active_cassette()
+    if cassette and cassette.mode == "replay":
+        entry = cassette.lookup(messages)
+        if _settings()[2]:
+            await asyncio.sleep(entry["latency"])
+        return _replayed_message(entry)
+
+    start = time.perf_counter()
+    response = await ahedged_invoke(llm, messages, attrs)
+    if cassette:
+        cassette.record(llm, messages, response, time.perf_counter() - start)
+    return response
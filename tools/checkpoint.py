@@ -0,0 +1,124 @@
+# tools/checkpoint.py
+# 工作流的持久化检查点：每个节点完成后将状态写入本地 SQLite 文件，以任务 ID 作为 LangGraph 的 thread_id。
+# 进程崩溃或 API 超时后可以从最后完成的节点继续运行，无需重新支付分析师、标题生成和之前各轮的 LLM 调用。
+import asyncio
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from config import config_section
+
+def checkpoint_enabled() -> bool:
+    return config_section("checkpoint").get("enabled", True)
+
+def checkpoint_path() -> str:
+    return os.getenv("MATHSVG_CHECKPOINT_DB", config_section("checkpoint").get("path", os.path.join(".cache", "checkpoints.sqlite")))
+
+# new_job_id 生成的任务 ID 末尾的时间戳，用于判断中断任务的检查点是否过期
+_JOB_TIMESTAMP = re.compile(r"(\d{8}_\d{6})_[0-9a-f]{6}$")
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver 只实现了同步接口。异步接口在线程中调用同步实现，
+    使 app.invoke 与 app.ainvoke 可以共用同一个检查点文件和连接 (写入由 SqliteSaver 的锁串行化)。
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+def get_checkpointer():
+    """返回共享的检查点存储 (第一次调用时打开 SQLite 文件)；未启用时返回 None"""
+    global _checkpointer
+    if not checkpoint_enabled():
+        return None
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            path = checkpoint_path()
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 批处理的多个工作线程共用一个连接，SqliteSaver 内部用锁保证同一时刻只有一个线程访问
+            _checkpointer = ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+            _prune_expired(_checkpointer)
+    return _checkpointer
+
+def _prune_expired(checkpointer) -> None:
+    """
+    删除超过 max_age_days 的中断任务的检查点 (正常结束的任务在结束时已删除)。
+    按任务 ID 中的时间戳判断；无法识别时间戳的任务 (如自定义 ID) 保留。
+    """
+    max_age_days = float(config_section("checkpoint").get("max_age_days", 7))
+    if max_age_days <= 0:
+        return
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=max_age_days)
+    try:
+        with checkpointer.cursor() as cur:
+            cur.execute("SELECT DISTINCT thread_id FROM checkpoints")
+            thread_ids = [row[0] for row in cur.fetchall()]
+        expired = []
+        for thread_id in thread_ids:
+            match = _JOB_TIMESTAMP.search(thread_id)
+            if match and datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S") < cutoff:
+                expired.append(thread_id)
+        for thread_id in expired:
+            checkpointer.delete_thread(thread_id)
+        if expired:
+            # 回收删除记录后的空间，检查点文件不会只增不减
+            checkpointer.conn.execute("VACUUM")
+            print(f"🧹 Removed checkpoints of {len(expired)} job(s) older than {max_age_days:g} day(s).")
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not prune old checkpoints: {e}")
+
+def discard_checkpoints(job_id: str) -> None:
+    """任务运行结束 (无论是否通过审查) 后删除其检查点：结束的任务无法也无需恢复"""
+    checkpointer = get_checkpointer()
+    if checkpointer is None:
+        return
+    try:
+        checkpointer.delete_thread(job_id)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not delete checkpoints of job {job_id}: {e}")
+
+def new_job_id(prefix: str = "") -> str:
+    """生成唯一的任务 ID (即检查点的 thread_id)；同一个 thread_id 不能用于两次不同的运行"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    job_id = f"{timestamp}_{uuid.uuid4().hex[:6]}"
+    return f"{prefix}_{job_id}" if prefix else job_id
+
+def job_config(job_id: str) -> dict:
+    """调用 app.invoke/stream 时使用的配置"""
+    return {"configurable": {"thread_id": job_id}}
+
+def resumable_state(app, job_id: str) -> dict:
+    """
+    检查任务是否可以恢复，返回检查点中保存的状态。
+    没有检查点或任务已经运行结束时抛出 ValueError。
+    """
+    snapshot = app.get_state(job_config(job_id))
+    if not snapshot.values:
+        raise ValueError(f"No checkpoint found for job '{job_id}' in {checkpoint_path()}.")
+    if not snapshot.next:
+        raise ValueError(f"Job '{job_id}' has already finished; nothing to resume.")
+    return snapshot.values
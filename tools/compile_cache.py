@@ -0,0 +1,94 @@
+# tools/compile_cache.py
+import hashlib
+import json
+import os
+import shutil
+
+from config import config_section
+from tools.disk_cache import DiskCache, shared_disk_cache
+
+def compile_cache_enabled() -> bool:
+    return config_section("compile_cache").get("enabled", True)
+
+def _compile_cache() -> DiskCache:
+    """编译结果的磁盘缓存，按当前 compile_cache 配置返回"""
+    settings = config_section("compile_cache")
+    return shared_disk_cache(
+        directory=settings.get("directory", os.path.join(".cache", "latex")),
+        max_bytes=int(settings.get("max_size_mb", 500) * 1024 * 1024),
+        name="latex",
+    )
+
+# 结果中的路径在存储时替换为占位符，恢复时再替换为当前任务的路径
+_BASE_PLACEHOLDER = "<OUTPUT_BASE>"
+_DIR_PLACEHOLDER = "<OUTPUT_DIR>"
+
+def compile_cache_key(latex_code: str) -> str:
+    """LaTeX 源码的内容哈希"""
+    return hashlib.sha256(latex_code.encode('utf-8')).hexdigest()
+
+def _place_file(source: str, target: str) -> None:
+    """
+    将缓存文件复制（或硬链接）到输出目录。
+    link_mode 为 "hardlink" 时输出文件与缓存条目共享同一份数据，就地修改输出文件会同时修改缓存，因此默认复制。
+    """
+    if os.path.exists(target):
+        os.remove(target)
+    if config_section("compile_cache").get("link_mode", "copy") == "hardlink":
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            # 跨设备或文件系统不支持硬链接时退回复制
+            pass
+    shutil.copyfile(source, target)
+
+def restore_cached_result(latex_code: str, output_filename_base: str, output_dir: str):
+    """
+    若该 LaTeX 源码曾被编译过，将缓存的PDF和日志放入输出目录并返回编译结果；否则返回 None。
+    """
+    if not compile_cache_enabled():
+        return None
+    path = _compile_cache().lookup(compile_cache_key(latex_code))
+    if not path:
+        return None
+    try:
+        with open(os.path.join(path, "result.json"), 'r', encoding='utf-8') as f:
+            stored = f.read()
+        stored = stored.replace(_BASE_PLACEHOLDER, json.dumps(output_filename_base)[1:-1])
+        stored = stored.replace(_DIR_PLACEHOLDER, json.dumps(output_dir)[1:-1])
+        result = json.loads(stored)
+
+        for ext in ("pdf", "log"):
+            cached_file = os.path.join(path, f"document.{ext}")
+            if os.path.exists(cached_file):
+                _place_file(cached_file, f"{output_filename_base}.{ext}")
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    result["cached"] = True
+    print("-> LaTeX compile cache hit.")
+    return result
+
+def store_compiled_result(latex_code: str, output_filename_base: str, output_dir: str, result: dict) -> None:
+    """将一次真实的 pdflatex 编译结果（成功或失败）写入缓存"""
+    if not compile_cache_enabled():
+        return
+    stored = json.dumps(result, ensure_ascii=False)
+    # 先替换较长的文件名前缀，再替换目录
+    stored = stored.replace(json.dumps(output_filename_base, ensure_ascii=False)[1:-1], _BASE_PLACEHOLDER)
+    stored = stored.replace(json.dumps(output_dir, ensure_ascii=False)[1:-1], _DIR_PLACEHOLDER)
+
+    files = {"result.json": stored.encode('utf-8')}
+    for ext in ("pdf", "log"):
+        produced = f"{output_filename_base}.{ext}"
+        if os.path.exists(produced):
+            files[f"document.{ext}"] = produced
+    try:
+        _compile_cache().store(compile_cache_key(latex_code), files)
+    except OSError as e:
+        print(f"⚠️ Failed to write compile cache entry: {e}")
+
+def compile_cache_stats() -> dict:
+    """返回编译缓存的命中统计"""
+    return _compile_cache().stats()
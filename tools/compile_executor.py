@@ -0,0 +1,115 @@
+# tools/compile_executor.py
+# 有界的 pdflatex 执行池：限制同时运行的 pdflatex 进程数，并为每个进程设置墙钟时间与内存上限。
+# 超时的编译会连同其整个进程组一起被强制结束。
+import contextvars
+import errno
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config_section
+from tools.tracing import span
+
+IS_WINDOWS = platform.system() == "Windows"
+
+_executor_lock = threading.Lock()
+_executor_state = {"max_workers": None, "executor": None}
+
+def _compile_executor() -> ThreadPoolExecutor:
+    """
+    pdflatex 执行池，按当前 compile_executor 配置返回。max_workers 改变后创建新的执行池，
+    旧的执行池不再接受提交，已提交的编译照常运行完毕。
+    """
+    max_workers = int(config_section("compile_executor").get("max_workers", 4))
+    with _executor_lock:
+        if _executor_state["max_workers"] != max_workers:
+            previous = _executor_state["executor"]
+            _executor_state.update(max_workers=max_workers,
+                                   executor=ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdflatex"))
+            if previous is not None:
+                previous.shutdown(wait=False)
+        return _executor_state["executor"]
+
+class CompileTimeoutError(Exception):
+    """pdflatex 超过墙钟时间上限并已被结束"""
+
+    def __init__(self, timeout: float, stdout: str = ""):
+        super().__init__(f"pdflatex exceeded the {timeout:g}s time limit and was killed.")
+        self.timeout = timeout
+        self.stdout = stdout
+
+def _popen_options() -> dict:
+    """让 pdflatex 在独立的进程组中运行，以便超时时结束整个进程树"""
+    if IS_WINDOWS:
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW  # 隐藏命令行窗口
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP, "startupinfo": startupinfo}
+    return {"start_new_session": True}
+
+def _with_memory_limit(command: list, env) -> list:
+    """
+    POSIX 上用 sh 包装命令：先 ulimit -v 设置地址空间上限，再 exec pdflatex，
+    pdflatex 从第一条指令起就受到限制。执行池是多线程的，不能使用 preexec_fn (fork 后可能死锁)。
+    上限高于当前硬限制而无法设置时保持继承的限制；不限制或在 Windows 上时原样返回命令。
+    """
+    memory_limit_mb = int(config_section("compile_executor").get("memory_limit_mb", 2048))
+    if memory_limit_mb <= 0 or IS_WINDOWS:
+        return command
+    # 经 sh 启动时找不到命令只会得到返回码 127；与直接启动一样抛出 FileNotFoundError，调用方据此报告 pdflatex 缺失
+    if shutil.which(command[0], path=(env if env is not None else os.environ).get("PATH")) is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), command[0])
+    limit_kb = memory_limit_mb * 1024
+    return ["sh", "-c", f'ulimit -v {limit_kb} 2>/dev/null; exec "$@"', "sh", *command]
+
+def _kill_process_tree(process: subprocess.Popen) -> None:
+    """强制结束进程及其所在进程组"""
+    try:
+        if IS_WINDOWS:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, ProcessLookupError):
+        pass
+
+def _run(command: list, cwd: str, env, timeout: float):
+    """在当前线程中运行命令，返回 (returncode, stdout, stderr)；超时则抛出 CompileTimeoutError"""
+    with span("pdflatex", "compile", cwd=cwd, timeout=timeout) as attrs:
+        returncode, stdout, stderr = _run_process(command, cwd, env, timeout)
+        attrs["returncode"] = returncode
+        return returncode, stdout, stderr
+
+def _run_process(command: list, cwd: str, env, timeout: float):
+    process = subprocess.Popen(
+        _with_memory_limit(command, env),
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        **_popen_options()
+    )
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_process_tree(process)
+        stdout, _ = process.communicate()
+        raise CompileTimeoutError(timeout, stdout or "")
+    return process.returncode, stdout, stderr
+
+def submit_pdflatex(command: list, cwd: str, env=None, timeout: float = None):
+    """将一次 pdflatex 运行提交到有界执行池，返回 concurrent.futures.Future"""
+    # 在调用方的上下文中运行，使追踪 span 归属到当前任务
+    context = contextvars.copy_context()
+    timeout = timeout or float(config_section("compile_executor").get("timeout_seconds", 60))
+    return _compile_executor().submit(context.run, _run, command, cwd, env, timeout)
+
+def run_pdflatex(command: list, cwd: str, env=None, timeout: float = None):
+    """在执行池中运行 pdflatex 并等待结果，返回 (returncode, stdout, stderr)"""
+    return submit_pdflatex(command, cwd, env, timeout).result()
@@ -0,0 +1,128 @@
+# tools/context_budget.py
+# 提示词的上下文预算：估算每个消息片段的 token 数，超出智能体的上限时按保留优先级裁剪。
+# 保留顺序为：错误信息 > 错误行附近的代码 > 推理说明，即先删去构建计划中的 reasoning 等说明文字，
+# 再省略远离错误行的代码，最后才截断错误信息本身。被裁剪的 token 数会打印并记入追踪。
+import json
+import re
+
+from config import config_section
+from tools.plan_parser import load_plan
+from tools.tracing import span
+
+# 每个智能体默认的提示词 token 上限 (不含系统提示词与图片)，可在配置的 limits 中覆盖
+DEFAULT_LIMITS = {"critic": 3000, "triage": 3000, "engineer": 4000}
+
+# 裁剪优先级：数值越小越先被裁剪
+PRIORITY_REASONING = 1
+PRIORITY_CODE = 2
+PRIORITY_ERRORS = 3
+
+_CJK = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uff00-\uffef]")
+# 日志记录与静态检查中的 "第 12 行"，以及 pdflatex 的 "l.12"
+_ERROR_LINE = re.compile(r"第\s*(\d+)\s*行|\bl\.(\d+)\b")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约每字 1 个 token，其余字符约每 4 个字符 1 个 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def error_lines_of(text: str) -> list:
+    """从错误信息中提取出错的源码行号"""
+    return sorted({int(a or b) for a, b in _ERROR_LINE.findall(text or "")})
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """按行保留开头部分，使文本不超过 max_tokens，并注明省略的行数"""
+    lines = text.splitlines()
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if len(kept) == len(lines):
+        return text
+    return "\n".join(kept + [f"... (省略 {len(lines) - len(kept)} 行)"])
+
+def strip_reasoning(text: str) -> str:
+    """删去构建计划中各步骤的 reasoning 字段，只保留指令；不是构建计划时原样返回"""
+    plan = load_plan(text)
+    if plan is None:
+        return text
+    steps = [{k: v for k, v in step.items() if k != "reasoning"} if isinstance(step, dict) else step
+             for step in plan["construction_plan"]]
+    return json.dumps({**plan, "construction_plan": steps}, ensure_ascii=False, indent=2)
+
+def _code_window(text: str, error_lines: list) -> str:
+    """保留文档开头、结尾以及错误行附近的代码，其余以注释行代替"""
+    lines = text.splitlines()
+    keep = {0, len(lines) - 1}
+    # 每个错误行前后保留的行数
+    context_lines = int(config_section("context_budget").get("code_context_lines", 3))
+    for line in error_lines:
+        keep.update(range(line - 1 - context_lines, line + context_lines))
+    result, skipped = [], 0
+    for n, line in enumerate(lines):
+        if n in keep:
+            if skipped:
+                result.append(f"% ... (省略 {skipped} 行)")
+                skipped = 0
+            result.append(line)
+        else:
+            skipped += 1
+    return "\n".join(result)
+
+def plan_section(name: str, text: str) -> dict:
+    """构建计划：超出预算时删去推理说明；指令本身是绘图的依据，不做截断 (超出的部分由代码与错误信息让出)"""
+    return {"name": name, "text": text, "priority": PRIORITY_REASONING,
+            "trim": lambda plan, max_tokens: strip_reasoning(plan)}
+
+def code_section(name: str, text: str, error_lines: list = ()) -> dict:
+    """LaTeX 代码：超出预算时只保留错误行附近的部分；没有错误行时保留开头"""
+    def trim(code: str, max_tokens: int) -> str:
+        if error_lines:
+            code = _code_window(code, error_lines)
+        return truncate_text(code, max_tokens)
+    return {"name": name, "text": text, "priority": PRIORITY_CODE, "trim": trim}
+
+def fixed_section(name: str, text: str) -> dict:
+    """必须完整发送的片段 (如补丁所基于的代码)：计入预算，挤占其他片段的空间，但自身从不裁剪"""
+    return {"name": name, "text": text, "priority": PRIORITY_ERRORS, "trim": lambda fixed, max_tokens: fixed}
+
+def error_section(name: str, text: str) -> dict:
+    """编译错误、审查意见等：最后才裁剪"""
+    return {"name": name, "text": text, "priority": PRIORITY_ERRORS, "trim": truncate_text}
+
+def apply_budget(agent: str, sections: list) -> dict:
+    """
+    将各片段裁剪到智能体的 token 上限以内，返回 {片段名: 文本}。
+    按优先级从低到高逐个裁剪，每个片段只裁剪到恰好满足上限为止。
+    """
+    texts = {s["name"]: s["text"] for s in sections}
+    settings = config_section("context_budget")
+    limit = {**DEFAULT_LIMITS, **(settings.get("limits") or {})}.get(agent)
+    if not settings.get("enabled", True) or not limit:
+        return texts
+    sizes = {name: estimate_tokens(text) for name, text in texts.items()}
+    total = sum(sizes.values())
+    if total <= limit:
+        return texts
+
+    with span("context_budget", "budget", agent=agent, limit=limit, tokens_before=total) as attrs:
+        removed = {}
+        for s in sorted(sections, key=lambda s: s["priority"]):
+            excess = sum(sizes.values()) - limit
+            if excess <= 0:
+                break
+            name = s["name"]
+            trimmed = s["trim"](texts[name], max(0, sizes[name] - excess))
+            trimmed_size = estimate_tokens(trimmed)
+            if trimmed_size < sizes[name]:
+                removed[name] = sizes[name] - trimmed_size
+                texts[name], sizes[name] = trimmed, trimmed_size
+        after = sum(sizes.values())
+        attrs.update(tokens_after=after, removed_tokens=removed)
+
+    details = ", ".join(f"{name} -{tokens}" for name, tokens in removed.items())
+    print(f"✂️ Context budget ({agent}): ~{total} -> ~{after} tokens (limit {limit}; {details or 'nothing trimmable'}).")
+    return texts
@@ -0,0 +1,128 @@
+# tools/disk_cache.py
+import functools
+import os
+import shutil
+import threading
+import uuid
+
+class DiskCache:
+    """
+    基于目录的内容寻址磁盘缓存。
+    每个条目是 <directory>/<key>/ 下的一组文件；总大小超过上限时按最近使用时间 (LRU) 淘汰。
+    可在多个线程/进程间共享：条目先写入临时目录，再原子地重命名到位。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, name: str = "cache"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def entry_path(self, key: str) -> str:
+        """返回条目目录的路径（不保证存在）"""
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key: str):
+        """
+        查找条目。命中时刷新其最近使用时间并返回条目目录，未命中返回 None。
+        """
+        path = self.entry_path(key)
+        if os.path.isdir(path):
+            try:
+                # 目录的修改时间即 LRU 的"最近使用时间"
+                os.utime(path, None)
+                with self._lock:
+                    self.hits += 1
+                return path
+            except OSError:
+                # 条目可能刚被其他进程淘汰，按未命中处理
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, key: str, files: dict) -> str:
+        """
+        写入一个条目。files 为 {文件名: bytes 内容或已有文件的路径}。
+        返回条目目录；若条目已存在则保留现有版本。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.entry_path(key)
+        tmp_path = os.path.join(self.directory, f".tmp-{key}-{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        try:
+            for filename, content in files.items():
+                target = os.path.join(tmp_path, filename)
+                if isinstance(content, bytes):
+                    with open(target, 'wb') as f:
+                        f.write(content)
+                else:
+                    shutil.copyfile(content, target)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # 另一个线程/进程已写入了同一条目，内容相同，丢弃本次写入
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        self.evict()
+        return path
+
+    def _entries(self) -> list:
+        """返回 [(最近使用时间, 大小, 路径)] 列表，忽略正在写入的临时目录"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if name.startswith(".tmp-"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                entries.append((os.stat(path).st_mtime, size, path))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """淘汰最久未使用的条目，直到总大小不超过上限"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """返回命中/未命中计数以及当前占用"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+@functools.lru_cache(maxsize=None)
+def shared_disk_cache(directory: str, max_bytes: int, name: str) -> DiskCache:
+    """
+    返回按 (目录, 大小上限, 名称) 共享的缓存实例。调用方每次按当前配置传入设置：
+    设置不变时得到同一个实例 (共享命中统计)，update_config 修改设置后立即得到新的实例。
+    """
+    return DiskCache(directory=directory, max_bytes=max_bytes, name=name)
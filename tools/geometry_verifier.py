@@ -0,0 +1,339 @@
+# tools/geometry_verifier.py
+# 确定性的数值几何验证：从 TikZ 源码中解析坐标，用 NumPy 逐条检查构建计划中声明的几何约束。
+# 当所有检查都通过且没有无法验证的内容时，工作流可以直接批准，无需调用审查员 LLM。
+import re
+
+import numpy as np
+
+from config import config_section
+from tools.plan_parser import (CLAUSE_SEPARATOR, FILLER, NUMBER, POINT_NAME, load_plan, parse_closing_shape, parse_paths,
+                               path_segments, plan_points, plan_steps, plan_texts, to_float)
+
+def verifier_enabled() -> bool:
+    return config_section("geometry_verifier").get("enabled", True)
+
+def _tolerance() -> float:
+    # 相对容差：分析师给出的坐标通常保留两位小数
+    return float(config_section("geometry_verifier").get("tolerance", 0.01))
+
+_CODE_COORDINATE = re.compile(
+    r"\\(?:coordinate|node)\s*(?:\[[^\]]*\])?\s*\((" + POINT_NAME + r")\)\s*at\s*\(\s*([^()]*?)\s*\)"
+)
+_NUMERIC_PAIR = re.compile(r"^(" + NUMBER + r")\s*,\s*(" + NUMBER + r")$")
+
+_SEG = r"(?<![A-Za-z])([A-Z]{2})(?![A-Za-z])"
+_LENGTH_CHAIN = re.compile(r"(?<![A-Za-z])((?:[A-Z]{2}\s*[=＝]\s*)+)(" + NUMBER + r")(?![\d.^*/√])")
+_LENGTH_WORDS = re.compile(_SEG + r"\s*的?(?:长度|长|边长)\s*(?:是|为|=|＝)\s*(" + NUMBER + r")(?![\d.^*/√])")
+_EQUAL = re.compile(_SEG + r"\s*[=＝]\s*" + _SEG)
+_SQUARE_SIDE = re.compile(r"边长\s*(?:为|是)?\s*(" + NUMBER + r")\s*的?正方形\s*([A-Z]{4})(?![A-Za-z])")
+_RIGHT_ANGLE = re.compile(r"[∠角]\s*([A-Z]{3})\s*(?:=|＝|为|是)\s*90\s*(?:°|度)?")
+_PERPENDICULAR = re.compile(_SEG + r"\s*(?:⊥|垂直于)\s*" + _SEG)
+_PARALLEL = re.compile(_SEG + r"\s*(?:∥|//|平行于)\s*" + _SEG)
+_MIDPOINT = re.compile(r"(?<![A-Za-z])([A-Z])\s*(?:是|为)\s*(?:线段|边)?\s*([A-Z]{2})\s*的?中点")
+_MIDPOINT_REVERSED = re.compile(r"(?<![A-Za-z])([A-Z]{2})\s*的中点\s*(?:是|为)\s*(?:点)?\s*([A-Z])(?![A-Za-z])")
+_COLLINEAR = re.compile(r"(?<![A-Za-z])([A-Z])\s*[、,，]\s*([A-Z])\s*[、,，和与及]\s*([A-Z])\s*(?:三点)?共线")
+_SHAPE = re.compile(r"(正方形|矩形|长方形|平行四边形|菱形|等边三角形|正三角形)\s*([A-Z]{3,4})(?![A-Za-z])")
+_SHAPE_EN = re.compile(r"\b(square|rectangle|parallelogram|rhombus)\s+([A-Z]{4})\b", re.IGNORECASE)
+
+_SHAPE_KINDS = {
+    "正方形": "square", "矩形": "rectangle", "长方形": "rectangle", "平行四边形": "parallelogram",
+    "菱形": "rhombus", "等边三角形": "equilateral", "正三角形": "equilateral",
+}
+# 数值验证无法覆盖的绘图内容，出现时交给审查员判断
+_UNVERIFIED_FEATURES = re.compile(r"圆|弧|曲线|函数|阴影|填充|角的?标记|直角符号|circle|arc|plot|shade|fill", re.IGNORECASE)
+_LABEL_INSTRUCTION = re.compile(r"标签|标注|label", re.IGNORECASE)
+# 没有列出点名的标签指令 ("为顶点添加标签"、"标注各点") 要求所有点都有标签
+_ALL_POINTS = re.compile(r"所有|全部|各|每个|顶点|点")
+_AXIS_LABEL = re.compile(r"node\s*(?:\[[^\]]*\])?\s*\{\s*\$[xy]\$\s*\}")
+# 要求绘制线段或多边形的子句；其中的每条线段都必须能在 \draw 路径中找到
+_DRAW_CLAUSE = re.compile(r"连接|连结|连线|线段|边|三角形|四边形|正方形|矩形|长方形|平行四边形|菱形|梯形|多边形|五边形|六边形|"
+                          r"draw|画|绘制", re.IGNORECASE)
+_DRAW_STATEMENT = re.compile(r"\\(?:draw|filldraw|path\s*\[[^\]]*draw[^\]]*\])(.*?);", re.DOTALL)
+# 路径中的坐标与连接方式；节点文字 {...} 与选项 [...] 先被移除
+_PATH_TOKEN = re.compile(r"(\+\+|\+)?\(\s*([^()]*?)\s*\)|(--|cycle)|(\S)")
+
+def parse_code_coordinates(latex_code: str):
+    """
+    解析 \\coordinate (X) at (x,y) 形式的坐标。
+    返回 ({点名: np.array}, {用非数值表达式定义的点名})；同名坐标以最后一次定义为准。
+    """
+    numeric, symbolic = {}, set()
+    for match in _CODE_COORDINATE.finditer(latex_code):
+        name, expression = match.group(1), match.group(2)
+        pair = _NUMERIC_PAIR.match(expression)
+        if pair:
+            numeric[name] = np.array([to_float(pair.group(1)), to_float(pair.group(2))])
+            symbolic.discard(name)
+        else:
+            numeric.pop(name, None)
+            symbolic.add(name)
+    return numeric, symbolic
+
+def extract_constraints(texts: list) -> list:
+    """从计划文本中提取可数值验证的约束，返回去重后的元组列表"""
+    constraints = []
+    for text in texts:
+        for match in _LENGTH_CHAIN.finditer(text):
+            for seg in re.findall(r"[A-Z]{2}", match.group(1)):
+                constraints.append(("length", seg, to_float(match.group(2))))
+        for match in _LENGTH_WORDS.finditer(text):
+            constraints.append(("length", match.group(1), to_float(match.group(2))))
+        for match in _EQUAL.finditer(text):
+            constraints.append(("equal", match.group(1), match.group(2)))
+        for match in _SQUARE_SIDE.finditer(text):
+            v = match.group(2)
+            for i in range(4):
+                constraints.append(("length", v[i] + v[(i + 1) % 4], to_float(match.group(1))))
+        for match in _RIGHT_ANGLE.finditer(text):
+            constraints.append(("right_angle", match.group(1)))
+        for match in _PERPENDICULAR.finditer(text):
+            constraints.append(("perpendicular", match.group(1), match.group(2)))
+        for match in _PARALLEL.finditer(text):
+            constraints.append(("parallel", match.group(1), match.group(2)))
+        for match in _MIDPOINT.finditer(text):
+            constraints.append(("midpoint", match.group(1), match.group(2)))
+        for match in _MIDPOINT_REVERSED.finditer(text):
+            constraints.append(("midpoint", match.group(2), match.group(1)))
+        for match in _COLLINEAR.finditer(text):
+            constraints.append(("collinear", "".join(match.groups())))
+        for match in _SHAPE.finditer(text):
+            kind, vertices = _SHAPE_KINDS[match.group(1)], match.group(2)
+            if len(vertices) == (3 if kind == "equilateral" else 4):
+                constraints.append(("shape", kind, vertices))
+        for match in _SHAPE_EN.finditer(text):
+            constraints.append(("shape", match.group(1).lower(), match.group(2)))
+    return list(dict.fromkeys(constraints))
+
+def _close(a: float, b: float) -> bool:
+    return abs(a - b) <= _tolerance() * max(1.0, abs(a), abs(b))
+
+def _vec(points: dict, seg: str):
+    return points[seg[1]] - points[seg[0]]
+
+def _sin_between(u, v) -> float:
+    """两向量夹角的正弦绝对值 (平行时为 0)"""
+    return abs(float(np.cross(u, v))) / (np.linalg.norm(u) * np.linalg.norm(v))
+
+def _cos_between(u, v) -> float:
+    """两向量夹角的余弦绝对值 (垂直时为 0)"""
+    return abs(float(np.dot(u, v))) / (np.linalg.norm(u) * np.linalg.norm(v))
+
+def _check_shape(kind: str, v: str, points: dict) -> tuple:
+    """检查多边形的形状约束，返回 (是否通过, 描述)"""
+    sides = [v[i] + v[(i + 1) % len(v)] for i in range(len(v))]
+    lengths = [float(np.linalg.norm(_vec(points, s))) for s in sides]
+    equal_sides = all(_close(lengths[0], length) for length in lengths)
+    if kind == "equilateral":
+        return equal_sides, f"等边三角形{v}: 边长 {', '.join(f'{x:.3f}' for x in lengths)}"
+    opposite_parallel = (_sin_between(_vec(points, sides[0]), _vec(points, sides[2])) <= _tolerance() and
+                         _sin_between(_vec(points, sides[1]), _vec(points, sides[3])) <= _tolerance())
+    right_corner = _cos_between(_vec(points, sides[0]), _vec(points, sides[1])) <= _tolerance()
+    passed = {
+        "parallelogram": opposite_parallel,
+        "rhombus": opposite_parallel and equal_sides,
+        "rectangle": opposite_parallel and right_corner,
+        "square": opposite_parallel and right_corner and equal_sides,
+    }[kind]
+    return passed, f"{kind} {v}: 边长 {', '.join(f'{x:.3f}' for x in lengths)}"
+
+def _check_constraint(constraint: tuple, points: dict) -> tuple:
+    """检查单个约束，返回 (是否通过, 描述)"""
+    kind = constraint[0]
+    if kind == "length":
+        _, seg, expected = constraint
+        actual = float(np.linalg.norm(_vec(points, seg)))
+        return _close(actual, expected), f"{seg} = {actual:.3f} (期望 {expected:g})"
+    if kind == "equal":
+        _, a, b = constraint
+        la, lb = float(np.linalg.norm(_vec(points, a))), float(np.linalg.norm(_vec(points, b)))
+        return _close(la, lb), f"{a} = {la:.3f}, {b} = {lb:.3f} (期望相等)"
+    if kind == "right_angle":
+        p, q, r = constraint[1]
+        cos = _cos_between(points[p] - points[q], points[r] - points[q])
+        return cos <= _tolerance(), f"∠{p}{q}{r} 的 |cos| = {cos:.4f} (期望 0)"
+    if kind == "perpendicular":
+        _, a, b = constraint
+        cos = _cos_between(_vec(points, a), _vec(points, b))
+        return cos <= _tolerance(), f"{a} ⊥ {b}: |cos| = {cos:.4f}"
+    if kind == "parallel":
+        _, a, b = constraint
+        sin = _sin_between(_vec(points, a), _vec(points, b))
+        return sin <= _tolerance(), f"{a} ∥ {b}: |sin| = {sin:.4f}"
+    if kind == "midpoint":
+        _, m, seg = constraint
+        expected = (points[seg[0]] + points[seg[1]]) / 2
+        distance = float(np.linalg.norm(points[m] - expected))
+        scale = float(np.linalg.norm(_vec(points, seg)))
+        return distance <= _tolerance() * max(1.0, scale), f"{m} 是 {seg} 的中点: 偏差 {distance:.4f}"
+    if kind == "collinear":
+        p, q, r = constraint[1]
+        sin = _sin_between(points[q] - points[p], points[r] - points[p])
+        return sin <= _tolerance(), f"{p}, {q}, {r} 共线: |sin| = {sin:.4f}"
+    if kind == "shape":
+        return _check_shape(constraint[1], constraint[2], points)
+    raise ValueError(f"Unknown constraint type: {kind}")
+
+def _constraint_points(constraint: tuple) -> set:
+    """约束中涉及的全部点名"""
+    parts = constraint[2:] if constraint[0] == "shape" else constraint[1:]
+    return {ch for part in parts if isinstance(part, str) for ch in part}
+
+def _is_degenerate(constraint: tuple, points: dict) -> bool:
+    """约束中出现零长度向量时无法计算角度"""
+    segs = [part for part in constraint[1:] if isinstance(part, str) and len(part) == 2]
+    return any(np.linalg.norm(_vec(points, s)) == 0 for s in segs) or \
+        (constraint[0] in ("right_angle", "collinear") and len({tuple(points[c]) for c in constraint[1]}) < 3)
+
+def _strip_path_decorations(path: str) -> str:
+    """去掉路径中的选项 [...] 与节点文字 {...}，只保留坐标和连接方式"""
+    previous = None
+    while previous != path:
+        previous = path
+        path = re.sub(r"\{[^{}]*\}", " ", path)
+    path = re.sub(r"\[[^\[\]]*\]", " ", path)
+    return re.sub(r"\b(?:node|coordinate|pic)\b", " ", path)
+
+def parse_code_segments(latex_code: str) -> set:
+    """
+    解析 \\draw 路径中以 -- 直接相连的命名坐标，返回 {frozenset({端点1, 端点2})}。
+    未命名的坐标与其他连接方式 (曲线、rectangle、to 等) 会打断路径，不产生线段。
+    """
+    segments = set()
+    for statement in _DRAW_STATEMENT.finditer(latex_code):
+        previous = start = None
+        operator = None
+        for relative, coordinate, keyword, other in _PATH_TOKEN.findall(_strip_path_decorations(statement.group(1))):
+            if keyword == "--":
+                operator = "--"
+                continue
+            if keyword == "cycle":
+                if operator == "--" and previous and start and previous != start:
+                    segments.add(frozenset((previous, start)))
+                previous = start = operator = None
+                continue
+            if other:
+                previous = start = operator = None
+                continue
+            name = coordinate if not relative and re.fullmatch(POINT_NAME, coordinate) else None
+            if operator == "--" and previous and name and previous != name:
+                segments.add(frozenset((previous, name)))
+            if operator is None:
+                start = name
+            previous, operator = name, None
+    return segments
+
+def _check_segment(step: dict, a: str, b: str, drawn: set, report: dict) -> None:
+    if frozenset((a, b)) in drawn:
+        report["checks"].append(f"线段 {a}{b} 已绘制")
+    else:
+        report["failures"].append(f"第 {step.get('step')} 步要求的线段 {a}{b} 没有在任何 \\draw 路径中绘制。")
+
+def _check_drawing(step: dict, drawn: set, report: dict, drawing: dict) -> None:
+    """
+    检查一步指令中要求绘制的线段与多边形是否出现在 \\draw 路径中；无法完整解析的绘图要求记为无法验证。
+    drawing["last_path"] 记录最近要求绘制的路径，供 "形成一个闭合的矩形" 这类子句检查闭合的一段。
+    """
+    instruction = str(step.get("instruction", ""))
+    for clause in CLAUSE_SEPARATOR.split(instruction):
+        if not _DRAW_CLAUSE.search(clause) or _LABEL_INSTRUCTION.search(clause) or _UNVERIFIED_FEATURES.search(clause):
+            continue
+        paths, rest = parse_paths(clause)
+        closing, rest = parse_closing_shape(rest)
+        if not (paths or closing) or FILLER.sub("", rest):
+            report["unverifiable"].append(f"第 {step.get('step')} 步的绘图要求无法解析: {clause.strip()}")
+            continue
+        for names, closed in paths:
+            for a, b in path_segments(names, closed):
+                _check_segment(step, a, b, drawn, report)
+            drawing["last_path"] = names
+        if closing:
+            names = drawing.get("last_path") or []
+            if len(names) < 3:
+                report["unverifiable"].append(f"第 {step.get('step')} 步要求闭合的图形无法确定: {clause.strip()}")
+            else:
+                _check_segment(step, names[-1], names[0], drawn, report)
+
+def _label_names(instruction: str, points: list):
+    """标签指令要求的点名；指令中还有其他无法解析的要求时返回 None"""
+    labels = re.findall(r"\$(" + POINT_NAME + r")\$", instruction)
+    if labels:
+        return labels
+    rest = CLAUSE_SEPARATOR.sub("", instruction)
+    labels = re.findall(r"(?<![A-Za-z])(" + POINT_NAME + r")(?![A-Za-z])", rest)
+    if not labels and _ALL_POINTS.search(rest):
+        labels = list(points)
+    if FILLER.sub("", re.sub(r"(?<![A-Za-z])" + POINT_NAME + r"(?![A-Za-z])", "", rest)):
+        return None
+    return labels or None
+
+def verify_geometry(structured_description: str, latex_code: str) -> dict:
+    """
+    用构建计划中的数值信息验证 TikZ 代码。
+    返回 {"approved": bool, "checks": [...], "failures": [...], "unverifiable": [...]}；
+    只有全部检查通过、且不存在无法验证的内容时 approved 才为 True。
+    """
+    report = {"approved": False, "checks": [], "failures": [], "unverifiable": []}
+    plan = load_plan(structured_description)
+    if plan is None:
+        report["unverifiable"].append("无法解析构建计划 JSON。")
+        return report
+
+    code_points, symbolic = parse_code_coordinates(latex_code)
+
+    # 1. 计划中给出的坐标必须被原样翻译
+    for name, (x, y) in plan_points(plan).items():
+        if name not in code_points:
+            reason = "以非数值表达式定义" if name in symbolic else "未在代码中定义"
+            report["unverifiable"].append(f"点 {name} {reason}。")
+            continue
+        actual = code_points[name]
+        passed = _close(actual[0], x) and _close(actual[1], y)
+        entry = f"点 {name} = ({actual[0]:g}, {actual[1]:g}) (计划 ({x:g}, {y:g}))"
+        report["checks" if passed else "failures"].append(entry)
+        # 已定义的点应至少在一条绘图命令中被使用
+        if len(re.findall(r"\(" + re.escape(name) + r"[).]", latex_code)) < 2:
+            report["unverifiable"].append(f"点 {name} 已定义但没有在任何绘图命令中使用。")
+
+    # 2. 计划文本中声明的几何约束
+    for constraint in extract_constraints(plan_texts(plan)):
+        missing = _constraint_points(constraint) - code_points.keys()
+        if missing:
+            report["unverifiable"].append(f"约束 {constraint} 涉及无数值坐标的点: {', '.join(sorted(missing))}")
+            continue
+        if _is_degenerate(constraint, code_points):
+            report["failures"].append(f"约束 {constraint} 中存在重合的点。")
+            continue
+        passed, entry = _check_constraint(constraint, code_points)
+        report["checks" if passed else "failures"].append(entry)
+
+    # 3. 坐标轴、线段与多边形、标签
+    axes_drawn = "->" in latex_code and bool(_AXIS_LABEL.search(latex_code))
+    if bool(plan.get("show_axes")) != axes_drawn:
+        report["failures"].append(f"show_axes 为 {bool(plan.get('show_axes'))}，但代码中{'绘制了' if axes_drawn else '没有绘制'}坐标轴。")
+    drawn = parse_code_segments(latex_code)
+    drawing = {"last_path": None}
+    for step in plan_steps(plan):
+        instruction = str(step.get("instruction", ""))
+        _check_drawing(step, drawn, report, drawing)
+        if _UNVERIFIED_FEATURES.search(instruction):
+            report["unverifiable"].append(f"第 {step.get('step')} 步包含数值验证无法覆盖的绘图内容。")
+        if _LABEL_INSTRUCTION.search(instruction):
+            labels = _label_names(instruction, plan_points(plan))
+            if not labels:
+                report["unverifiable"].append(f"第 {step.get('step')} 步的标签无法确定。")
+            for label in labels or []:
+                if f"${label}$" in latex_code:
+                    report["checks"].append(f"标签 ${label}$ 已添加")
+                else:
+                    report["failures"].append(f"缺少标签 ${label}$。")
+
+    report["approved"] = bool(report["checks"]) and not report["failures"] and not report["unverifiable"]
+    return report
+
+def format_verification_report(report: dict) -> str:
+    """将验证结果整理为日志文本"""
+    lines = [f"数值验证{'通过' if report['approved'] else '未通过'}。"]
+    lines += [f"✓ {entry}" for entry in report["checks"]]
+    lines += [f"✗ {entry}" for entry in report["failures"]]
+    lines += [f"? {entry}" for entry in report["unverifiable"]]
+    return "\n".join(lines)
@@ -0,0 +1,269 @@
+# tools/hedging.py
+# 对冲请求：某次 LLM 调用的耗时超过该智能体最近调用耗时的某个百分位数时，再发送一个相同的请求
+# (发往同一端点，或配置的备用端点)，采用先返回的结果并取消另一个，以压低长尾延迟。
+# 对冲请求消耗预算：每次调用积累 budget_ratio 个额度，每次对冲花费 1 个，避免在服务端变慢时成倍放大流量。
+# 是否对冲按智能体 (planner / translator / critic / title) 配置；未配置的智能体不受影响。
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import config_section
+from tools.llm_cache import model_name_of
+from tools.llm_limits import acall_with_limits, call_with_limits, http_clients, request_timeout
+
+def _settings() -> dict:
+    """读取 hedging 配置段并补全默认值"""
+    section = config_section("hedging")
+    return {
+        # 智能体 -> 触发对冲的延迟百分位数，例如 {"critic": 95, "title": 90}；为空时不启用
+        "agents": {agent: float(pct) for agent, pct in (section.get("agents") or {}).items() if pct},
+        # 积累到这么多次耗时样本之后才开始对冲
+        "min_samples": int(section.get("min_samples", 20)),
+        "window": int(section.get("window", 200)),
+        # 对冲阈值的下限，避免快速调用也被对冲
+        "min_delay": float(section.get("min_delay_seconds", 1.0)),
+        "budget_ratio": float(section.get("budget_ratio", 0.1)),
+        "budget_burst": float(section.get("budget_burst", 5)),
+        # 备用端点 {"base_url": ..., "api_key": ..., "model": ...}；未配置时对冲请求发往同一端点
+        "secondary": section.get("secondary") or {},
+    }
+
+class LatencyTracker:
+    """一个智能体最近若干次调用的耗时，以及对冲统计"""
+
+    def __init__(self, agent: str, percentile: float):
+        self.agent = agent
+        self.percentile = percentile
+        self.samples = deque(maxlen=_settings()["window"])
+        self._lock = threading.Lock()
+        self.metrics = {"calls": 0, "hedges": 0, "hedge_wins": 0, "budget_denied": 0}
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def threshold(self):
+        """触发对冲的等待秒数；样本不足时返回 None (不对冲)"""
+        settings = _settings()
+        with self._lock:
+            if len(self.samples) < settings["min_samples"]:
+                return None
+            ordered = sorted(self.samples)
+        index = max(0, min(len(ordered) - 1, math.ceil(self.percentile / 100 * len(ordered)) - 1))
+        return max(settings["min_delay"], ordered[index])
+
+    def count(self, field: str) -> None:
+        with self._lock:
+            self.metrics[field] += 1
+
+class HedgeBudget:
+    """对冲额度：每次调用积累 budget_ratio，最多 budget_burst，每次对冲花费 1"""
+
+    def __init__(self):
+        self.credit = None
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        settings = _settings()
+        with self._lock:
+            # 额度从 budget_burst 开始 (第一次调用时才读取配置)
+            credit = settings["budget_burst"] if self.credit is None else self.credit
+            self.credit = min(settings["budget_burst"], credit + settings["budget_ratio"])
+
+    def take(self) -> bool:
+        with self._lock:
+            if self.credit is None or self.credit < 1:
+                return False
+            self.credit -= 1
+            return True
+
+_budget = HedgeBudget()
+_trackers = {}
+_secondary_llms = {}
+_lock = threading.Lock()
+
+def tracker_for(agent: str):
+    """返回智能体的耗时统计；该智能体未启用对冲时返回 None"""
+    percentile = _settings()["agents"].get(agent)
+    if percentile is None:
+        return None
+    with _lock:
+        if agent not in _trackers:
+            _trackers[agent] = LatencyTracker(agent, percentile)
+        return _trackers[agent]
+
+def hedge_metrics() -> dict:
+    """各智能体的对冲阈值、对冲次数、对冲胜出次数与因预算不足放弃的次数"""
+    with _lock:
+        trackers = list(_trackers.values())
+    snapshot = {}
+    for tracker in trackers:
+        threshold = tracker.threshold()
+        with tracker._lock:
+            snapshot[tracker.agent] = {**tracker.metrics, "samples": len(tracker.samples),
+                                       "threshold_seconds": round(threshold, 3) if threshold else None}
+    return snapshot
+
+def _hedge_target(llm) -> tuple:
+    """对冲请求使用的 (LLM 客户端, 限流用的模型名)；配置了备用端点时使用备用端点"""
+    secondary = _settings()["secondary"]
+    if not secondary.get("base_url"):
+        return llm, model_name_of(llm)
+    from langchain_openai import ChatOpenAI
+    if not isinstance(llm, ChatOpenAI):
+        return llm, model_name_of(llm)
+    model = secondary.get("model") or llm.model_name
+    key = (model, llm.temperature)
+    with _lock:
+        if key not in _secondary_llms:
+            http_client, http_async_client = http_clients(secondary["base_url"])
+            _secondary_llms[key] = ChatOpenAI(
+                model=model,
+                api_key=secondary.get("api_key") or llm.openai_api_key,
+                base_url=secondary["base_url"],
+                temperature=llm.temperature,
+                max_tokens=llm.max_tokens,
+                request_timeout=request_timeout(),
+                max_retries=0,
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+    # 备用端点单独限流
+    return _secondary_llms[key], f"{model}@secondary"
+
+def _start_hedge(tracker: LatencyTracker, delay: float) -> bool:
+    """主请求超过阈值时决定是否发送对冲请求"""
+    if not _budget.take():
+        tracker.count("budget_denied")
+        return False
+    tracker.count("hedges")
+    print(f"-> 🔀 {tracker.agent} LLM call exceeded p{tracker.percentile:g} ({delay:.1f}s); sending a hedged request.")
+    return True
+
+def _finish(tracker: LatencyTracker, attrs: dict, winner_attrs: dict, hedge_won: bool) -> None:
+    """
+    采用胜出者的重试与限流记录。耗时样本由调用方记录，且总是主请求的耗时：
+    对冲胜出时的耗时被对冲缩短了，若计入样本，百分位数会逐渐变小，对冲越来越频繁。
+    """
+    for field in ("retries", "throttle_ms"):
+        if field in winner_attrs:
+            attrs[field] = winner_attrs[field]
+    if hedge_won:
+        tracker.count("hedge_wins")
+        attrs["hedge_won"] = True
+
+def _observe_primary(tracker: LatencyTracker, primary, start: float) -> None:
+    if not primary.cancelled() and primary.exception() is None:
+        tracker.observe(time.perf_counter() - start)
+
+def hedged_invoke(llm, messages: list, attrs: dict = None):
+    """
+    调用 LLM (经过 llm_limits 的限流与重试)；attrs["agent"] 启用了对冲时，主请求超过阈值后发送对冲请求。
+    同步版本无法中断已经发出的 HTTP 请求：落败的请求在后台线程中结束，结果被丢弃。
+    """
+    attrs = attrs if attrs is not None else {}
+    model = model_name_of(llm)
+    tracker = tracker_for(attrs.get("agent"))
+    if tracker is None:
+        return call_with_limits(model, lambda: llm.invoke(messages), attrs)
+    tracker.count("calls")
+    _budget.earn()
+    delay = tracker.threshold()
+    start = time.perf_counter()
+    if delay is None:
+        response = call_with_limits(model, lambda: llm.invoke(messages), attrs)
+        tracker.observe(time.perf_counter() - start)
+        return response
+
+    # 主请求与对冲请求各自记录重试与限流，最后采用胜出者的记录
+    primary_attrs, hedge_attrs = {}, {}
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+    try:
+        primary = executor.submit(contextvars.copy_context().run, call_with_limits,
+                                  model, lambda: llm.invoke(messages), primary_attrs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not _start_hedge(tracker, delay):
+            response = primary.result()
+            tracker.observe(time.perf_counter() - start)
+            _finish(tracker, attrs, primary_attrs, hedge_won=False)
+            return response
+
+        attrs["hedged"] = True
+        target, target_model = _hedge_target(llm)
+        hedge = executor.submit(contextvars.copy_context().run, call_with_limits,
+                                target_model, lambda: target.invoke(messages), hedge_attrs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    hedge_won = future is hedge
+                    if hedge_won:
+                        # 主请求仍在后台线程中运行，成功结束时记录它的实际耗时
+                        primary.add_done_callback(lambda f: _observe_primary(tracker, f, start))
+                    else:
+                        tracker.observe(time.perf_counter() - start)
+                    _finish(tracker, attrs, hedge_attrs if hedge_won else primary_attrs, hedge_won)
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def ahedged_invoke(llm, messages: list, attrs: dict = None):
+    """hedged_invoke 的异步版本：落败的请求以 Task.cancel() 取消 (关闭对应的 HTTP 连接)"""
+    attrs = attrs if attrs is not None else {}
+    model = model_name_of(llm)
+    tracker = tracker_for(attrs.get("agent"))
+    if tracker is None:
+        return await acall_with_limits(model, lambda: llm.ainvoke(messages), attrs)
+    tracker.count("calls")
+    _budget.earn()
+    delay = tracker.threshold()
+    start = time.perf_counter()
+    if delay is None:
+        response = await acall_with_limits(model, lambda: llm.ainvoke(messages), attrs)
+        tracker.observe(time.perf_counter() - start)
+        return response
+
+    primary_attrs, hedge_attrs = {}, {}
+    primary = asyncio.ensure_future(acall_with_limits(model, lambda: llm.ainvoke(messages), primary_attrs))
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not _start_hedge(tracker, delay):
+            response = await primary
+            tracker.observe(time.perf_counter() - start)
+            _finish(tracker, attrs, primary_attrs, hedge_won=False)
+            return response
+
+        attrs["hedged"] = True
+        target, target_model = _hedge_target(llm)
+        hedge = asyncio.ensure_future(acall_with_limits(target_model, lambda: target.ainvoke(messages), hedge_attrs))
+        tasks.add(hedge)
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                if task.exception() is None:
+                    hedge_won = task is hedge
+                    if not hedge_won or not primary.done():
+                        # 对冲胜出时主请求即将被取消，实际耗时不可知：记录目前已等待的时间 (不小于对冲阈值)，
+                        # 使样本仍落在分布的尾部
+                        tracker.observe(time.perf_counter() - start)
+                    _finish(tracker, attrs, hedge_attrs if hedge_won else primary_attrs, hedge_won)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,135 @@
+# tools/image_utils.py
+# 手绘草图的预处理：在发送给多模态模型之前纠正方向、缩小尺寸、去除光照不均与噪点，并以紧凑的格式重新编码。
+# Pillow 与 NumPy 导入较慢，只在真正处理图片时才导入，保证启动速度。
+import hashlib
+import io
+import json
+import mimetypes
+import os
+
+from config import config_section
+from tools.disk_cache import DiskCache, shared_disk_cache
+
+_MIME_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+# 输出格式的常见别名
+_FORMAT_ALIASES = {"jpg": "jpeg"}
+
+def _sketch_cache() -> DiskCache:
+    """预处理结果的磁盘缓存，按当前 sketch_preprocess 配置返回"""
+    section = config_section("sketch_preprocess")
+    return shared_disk_cache(
+        directory=section.get("cache_directory", os.path.join(".cache", "sketch")),
+        max_bytes=int(section.get("cache_max_size_mb", 100) * 1024 * 1024),
+        name="sketch",
+    )
+
+def _output_format(value) -> str:
+    """规范化 sketch_preprocess.format；不支持的格式抛出 ValueError"""
+    output_format = str(value).strip().lower()
+    output_format = _FORMAT_ALIASES.get(output_format, output_format)
+    if output_format not in _MIME_TYPES:
+        raise ValueError(f"Unsupported sketch_preprocess.format {value!r}; expected one of: {', '.join(_MIME_TYPES)}.")
+    return output_format
+
+def _settings() -> dict:
+    """影响预处理结果的参数 (同时作为缓存键的一部分)"""
+    section = config_section("sketch_preprocess")
+    return {
+        "max_edge": int(section.get("max_edge", 1280)),
+        # "binarize" (二值化，适合线稿)、"grayscale" (仅去噪) 或 "none" (只缩放)
+        "mode": section.get("mode", "binarize"),
+        # "png"、"webp" 或 "jpeg" ("jpg" 视为 "jpeg")
+        "format": _output_format(section.get("format", "png")),
+        "quality": int(section.get("quality", 85)),
+    }
+
+def _otsu_threshold(pixels) -> int:
+    """Otsu 法计算灰度图的全局二值化阈值"""
+    import numpy as np
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(histogram)
+    means = np.cumsum(histogram * np.arange(256))
+    total, total_mean = weights[-1], means[-1]
+    background = weights[:-1]
+    foreground = total - background
+    valid = (background > 0) & (foreground > 0)
+    between = np.zeros_like(background)
+    between[valid] = (total_mean * background[valid] / total - means[:-1][valid]) ** 2 / (background[valid] * foreground[valid])
+    return int(np.argmax(between))
+
+def _flatten_lighting(image):
+    """用大半径模糊估计纸面背景，再相除以消除照片中的阴影与光照不均"""
+    import numpy as np
+    from PIL import ImageFilter
+    radius = max(8, max(image.size) // 40)
+    background = np.asarray(image.filter(ImageFilter.GaussianBlur(radius)), dtype=np.float64)
+    pixels = np.asarray(image, dtype=np.float64)
+    return np.clip(pixels / np.maximum(background, 1.0) * 255.0, 0, 255).astype(np.uint8)
+
+def _clean_up(image, mode: str):
+    import numpy as np
+    from PIL import Image, ImageFilter, ImageOps
+    gray = ImageOps.grayscale(image).filter(ImageFilter.MedianFilter(3))
+    if mode == "grayscale":
+        return ImageOps.autocontrast(gray)
+    flattened = _flatten_lighting(gray)
+    threshold = _otsu_threshold(flattened)
+    return Image.fromarray(np.where(flattened > threshold, 255, 0).astype(np.uint8)).convert("1")
+
+def _encode(image, settings: dict) -> bytes:
+    buffer = io.BytesIO()
+    if settings["format"] == "jpeg":
+        image.convert("L" if image.mode in ("1", "L") else "RGB").save(buffer, format="JPEG", quality=settings["quality"], optimize=True)
+    elif settings["format"] == "webp":
+        image.convert("L" if image.mode in ("1", "L") else "RGB").save(buffer, format="WEBP", quality=settings["quality"])
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+def _process(source_bytes: bytes, settings: dict) -> bytes:
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(source_bytes)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L", "1"):
+            # 透明背景按白纸处理
+            canvas = Image.new("RGB", image.size, "white")
+            canvas.paste(image.convert("RGBA"), mask=image.convert("RGBA").split()[-1])
+            image = canvas
+        image.thumbnail((settings["max_edge"], settings["max_edge"]), Image.LANCZOS)
+        if settings["mode"] != "none":
+            image = _clean_up(image, settings["mode"])
+        return _encode(image, settings)
+
+def preprocess_sketch(image_path: str) -> tuple:
+    """
+    读取并预处理手绘草图，返回 (图片字节, MIME 类型)。结果按源文件哈希缓存。
+    预处理关闭或 Pillow 无法解码时返回原始字节及按扩展名推断的 MIME 类型。
+    """
+    with open(image_path, "rb") as image_file:
+        source_bytes = image_file.read()
+    if not config_section("sketch_preprocess").get("enabled", True):
+        return source_bytes, mimetypes.guess_type(image_path)[0] or "image/png"
+
+    settings = _settings()
+    digest = hashlib.sha256(source_bytes)
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    key = digest.hexdigest()
+    filename = f"sketch.{settings['format']}"
+    entry = _sketch_cache().lookup(key)
+    if entry:
+        with open(os.path.join(entry, filename), "rb") as f:
+            return f.read(), _MIME_TYPES[settings["format"]]
+
+    try:
+        processed = _process(source_bytes, settings)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not preprocess sketch ({e}). Sending the original file.")
+        return source_bytes, mimetypes.guess_type(image_path)[0] or "image/png"
+
+    print(f"🖼️ Sketch preprocessed: {len(source_bytes) / 1024:.1f} KB -> {len(processed) / 1024:.1f} KB")
+    _sketch_cache().store(key, {filename: processed})
+    return processed, _MIME_TYPES[settings["format"]]
+
+def sketch_cache_stats() -> dict:
+    """返回草图预处理缓存的统计信息"""
+    return _sketch_cache().stats()
@@ -1,78 +1,147 @@
 # tools/latex_compiler.py
+import asyncio
 import os
-import subprocess
-import platform
 
-# 修改 compile_latex_code 函数签名和逻辑
+from tools.compile_cache import restore_cached_result, store_compiled_result
+from tools.compile_executor import CompileTimeoutError, run_pdflatex, submit_pdflatex
+from tools.latex_format import ensure_format, format_command, format_unusable, uses_standard_preamble
+from tools.latex_log import format_log_record, parse_latex_log, read_log_tail
+
+PDFLATEX_NOT_FOUND_ERROR = "Error: 'pdflatex' command not found. Please ensure a LaTeX distribution (like MiKTeX or TeX Live) is installed and in your system's PATH."
+
+def _write_source(latex_code: str, output_filename_base: str, output_dir: str) -> None:
+    """将 .tex 文件写入目标目录 (缓存命中时输出目录中同样保留源码)"""
+    # 目录创建已在工作流中完成，此处为安全校验
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # 将 .tex 文件写入目标子目录
+    with open(f"{output_filename_base}.tex", 'w', encoding='utf-8') as f:
+        f.write(latex_code)
+
+def _prepare_compilation(latex_code: str, output_filename_base: str) -> dict:
+    """
+    返回编译所需的命令与各文件路径。
+    若启用了预编译导言区且文档导言区与模板一致，则使用预编译格式文件 (首次使用时构建)。
+    """
+    job = _normal_job({
+        "tex_filename": os.path.basename(f"{output_filename_base}.tex"),  # 只传递文件名，因为我们将在该目录中运行
+        "pdf_filepath": f"{output_filename_base}.pdf",
+        "log_filepath": f"{output_filename_base}.log",
+    })
+    if uses_standard_preamble(latex_code):
+        format_dir = ensure_format()
+        if format_dir:
+            job["command"], job["env"] = format_command(job["tex_filename"], format_dir)
+            job["uses_format"] = True
+    return job
+
+def _normal_job(job: dict) -> dict:
+    """返回使用普通 pdflatex 命令的编译任务"""
+    return {
+        **job,
+        "command": ["pdflatex", "-interaction=nonstopmode", job["tex_filename"]],
+        "env": None,
+        "uses_format": False,
+    }
+
+def _build_result(returncode: int, stdout: str, stderr: str, job: dict, output_dir: str) -> dict:
+    """根据 pdflatex 的退出码和日志文件生成结构化的编译结果。"""
+    pdf_filepath = job["pdf_filepath"]
+    log_filepath = job["log_filepath"]
+
+    # 检查PDF文件是否在预期位置生成
+    if returncode == 0 and os.path.exists(pdf_filepath):
+        return {"success": True, "path": pdf_filepath, "log": f"Compilation successful. Log file at {log_filepath}"}
+
+    # 只解析日志末尾，提取结构化的错误记录；没有日志时退回解析终端输出
+    source_code = ""
+    tex_filepath = os.path.join(output_dir, job["tex_filename"])
+    if os.path.exists(tex_filepath):
+        with open(tex_filepath, 'r', encoding='utf-8') as tex_file:
+            source_code = tex_file.read()
+    log_text = read_log_tail(log_filepath) if os.path.exists(log_filepath) else stdout
+    record = parse_latex_log(log_text, source_code)
+
+    error_message = f"pdflatex compilation failed with return code {returncode}.\n"
+    error_message += format_log_record(record)
+    if stderr.strip():
+        error_message += f"\nSTDERR:\n{stderr.strip()[-500:]}"
+    return {"success": False, "error": error_message, "error_type": "compile", "log_record": record}
+
+def _timeout_result(error: CompileTimeoutError) -> dict:
+    """将超时转换为结构化的编译结果，供审查员和分析师参考"""
+    message = (
+        f"{error}\n"
+        "The TikZ code most likely contains an infinite loop or an extremely expensive construct "
+        "(for example a plot with a very large 'samples=' value). Simplify it so that it compiles quickly."
+    )
+    return {"success": False, "error": message, "error_type": "timeout", "timeout_seconds": error.timeout}
+
+def _run_pdflatex(job: dict, output_dir: str):
+    """在有界编译池中运行 pdflatex，返回 (returncode, stdout, stderr)"""
+    # 【核心修正】: 在目标输出目录中执行命令
+    return run_pdflatex(job["command"], cwd=output_dir, env=job["env"])
+
+async def _arun_pdflatex(job: dict, output_dir: str):
+    """_run_pdflatex 的异步版本，等待编译池结果时不阻塞事件循环"""
+    return await asyncio.wrap_future(submit_pdflatex(job["command"], cwd=output_dir, env=job["env"]))
 
 def compile_latex_code(latex_code: str, output_filename_base: str, output_dir: str) -> dict:
     """
     将 LaTeX 代码字符串写入 .tex 文件并使用 pdflatex 进行编译。
     此版本通过在目标目录中执行命令来增强路径处理的稳定性。
     """
-    # 完整的文件路径
-    tex_filepath = f"{output_filename_base}.tex"
-    pdf_filepath = f"{output_filename_base}.pdf"
-    log_filepath = f"{output_filename_base}.log"
+    try:
+        _write_source(latex_code, output_filename_base, output_dir)
+        # 完全相同的源码无需再次编译，直接复用缓存的PDF和日志；先查缓存，命中时无需准备 (或构建) 预编译格式
+        cached = restore_cached_result(latex_code, output_filename_base, output_dir)
+        if cached:
+            return cached
 
-    # 从完整路径中仅提取文件名
-    tex_filename_only = os.path.basename(tex_filepath)
+        job = _prepare_compilation(latex_code, output_filename_base)
+        returncode, stdout, stderr = _run_pdflatex(job, output_dir)
+        if job["uses_format"] and returncode != 0 and format_unusable(stdout + stderr):
+            job = _normal_job(job)
+            returncode, stdout, stderr = _run_pdflatex(job, output_dir)
+
+        result = _build_result(returncode, stdout, stderr, job, output_dir)
+        store_compiled_result(latex_code, output_filename_base, output_dir, result)
+        return result
+
+    except CompileTimeoutError as e:
+        return _timeout_result(e)
+    except FileNotFoundError:
+        return {"success": False, "error": PDFLATEX_NOT_FOUND_ERROR, "error_type": "not_found"}
+    except Exception as e:
+        return {"success": False, "error": f"An unexpected error occurred: {str(e)}", "error_type": "exception"}
 
+async def acompile_latex_code(latex_code: str, output_filename_base: str, output_dir: str) -> dict:
+    """
+    compile_latex_code 的异步版本。
+    pdflatex 在有界编译池中运行，等待期间不会阻塞事件循环。
+    """
     try:
-        # 目录创建已在工作流中完成，此处为安全校验
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        # 将 .tex 文件写入目标子目录
-        with open(tex_filepath, 'w', encoding='utf-8') as f:
-            f.write(latex_code)
-
-        # 构建 pdflatex 命令，现在只使用文件名，因为我们将在该目录中运行
-        command = [
-            "pdflatex",
-            "-interaction=nonstopmode",
-            tex_filename_only  # 只传递文件名
-        ]
-
-        # 在 Windows 上隐藏命令行窗口
-        startupinfo = None
-        if platform.system() == "Windows":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-        # 【核心修正】: 使用 cwd 参数指定命令的执行目录
-        process = subprocess.run(
-            command,
-            cwd=output_dir,  # 在目标输出目录中执行命令
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            startupinfo=startupinfo
-        )
-
-        # 检查PDF文件是否在预期位置生成
-        if process.returncode == 0 and os.path.exists(pdf_filepath):
-            return {"success": True, "path": pdf_filepath, "log": f"Compilation successful. Log file at {log_filepath}"}
-        else:
-            # 尝试读取日志文件获取更详细的错误
-            error_log = ""
-            if os.path.exists(log_filepath):
-                with open(log_filepath, 'r', encoding='utf-8', errors='replace') as log_file:
-                    log_content = log_file.read()
-                    errors = [line for line in log_content.splitlines() if line.startswith("!")]
-                    error_log = "\n".join(errors) if errors else log_content[-1000:]
-
-            error_message = f"pdflatex compilation failed with return code {process.returncode}.\n"
-            error_message += f"Executed in: {output_dir}\n"
-            error_message += f"STDOUT:\n{process.stdout}\n"
-            error_message += f"STDERR:\n{process.stderr}\n"
-            error_message += f"ERROR LOG:\n{error_log}"
-            return {"success": False, "error": error_message}
+        _write_source(latex_code, output_filename_base, output_dir)
+        cached = restore_cached_result(latex_code, output_filename_base, output_dir)
+        if cached:
+            return cached
+
+        # 首次使用预编译格式时需要构建格式文件，放到线程中执行以免阻塞事件循环
+        job = await asyncio.to_thread(_prepare_compilation, latex_code, output_filename_base)
+
+        returncode, stdout, stderr = await _arun_pdflatex(job, output_dir)
+        if job["uses_format"] and returncode != 0 and format_unusable(stdout + stderr):
+            job = _normal_job(job)
+            returncode, stdout, stderr = await _arun_pdflatex(job, output_dir)
+
+        result = _build_result(returncode, stdout, stderr, job, output_dir)
+        store_compiled_result(latex_code, output_filename_base, output_dir, result)
+        return result
 
+    except CompileTimeoutError as e:
+        return _timeout_result(e)
     except FileNotFoundError:
-        error = "Error: 'pdflatex' command not found. Please ensure a LaTeX distribution (like MiKTeX or TeX Live) is installed and in your system's PATH."
-        return {"success": False, "error": error}
+        return {"success": False, "error": PDFLATEX_NOT_FOUND_ERROR, "error_type": "not_found"}
     except Exception as e:
-        return {"success": False, "error": f"An unexpected error occurred: {str(e)}"}
+        return {"success": False, "error": f"An unexpected error occurred: {str(e)}", "error_type": "exception"}
@@ -0,0 +1,130 @@
+# tools/latex_format.py
+# 预编译格式文件 (mylatexformat) 支持：将 TikZ 模板的公共导言区预先转储为 .fmt，
+# 之后导言区相同的文档可以直接加载该格式，省去每次重新载入 TikZ 的时间。
+# 格式文件按导言区与 pdflatex 版本的哈希分目录存放，任何一方变化后都会重新构建。
+import hashlib
+import os
+import re
+import threading
+
+from config import config_section
+from tools.compile_executor import CompileTimeoutError, run_pdflatex
+
+FORMAT_NAME = "mathsvg_tikz"
+
+# 与 prompts.TIKZ_ENGINEER_PROMPT 中 LaTeX 代码模板完全一致的导言区
+STANDARD_PREAMBLE = r"""
+\documentclass[tikz,border=10pt]{standalone}
+\usepackage{tikz}
+\usetikzlibrary{calc,intersections}
+"""
+
+# pdflatex 在格式文件缺失、损坏或与当前引擎版本不匹配时输出的信息
+_FORMAT_FAILURE_MARKERS = ("can't find the format file", "format file error", "stymied", "was written by")
+
+_build_lock = threading.Lock()
+_format_state = {"ready": False, "failed": False, "directory": None}
+
+def _normalize(preamble: str) -> str:
+    """去除注释与多余空白，便于比较导言区"""
+    lines = []
+    for line in preamble.splitlines():
+        line = re.sub(r"(?<!\\)%.*$", "", line).strip()
+        if line:
+            lines.append(re.sub(r"\s+", " ", line))
+    return "\n".join(lines)
+
+_STANDARD_NORMALIZED = _normalize(STANDARD_PREAMBLE)
+
+def _format_directory() -> str:
+    return os.path.abspath(config_section("latex_format").get("directory", os.path.join(".cache", "latex_format")))
+
+def _format_key(directory: str):
+    """
+    标准导言区与 `pdflatex --version` 输出的哈希，作为格式文件的子目录名。
+    导言区修改或 TeX 发行版升级后键随之改变，不会继续加载过期的格式。无法运行 pdflatex 时返回 None。
+    """
+    try:
+        returncode, stdout, _ = run_pdflatex(["pdflatex", "--version"], cwd=directory)
+    except (OSError, CompileTimeoutError) as e:
+        print(f"⚠️ Could not determine the pdflatex version: {e}")
+        return None
+    if returncode != 0:
+        return None
+    payload = f"{_STANDARD_NORMALIZED}\n{stdout.strip()}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def uses_standard_preamble(latex_code: str) -> bool:
+    """判断文档的导言区是否与预编译的标准导言区一致"""
+    head, sep, _ = latex_code.partition(r"\begin{document}")
+    return bool(sep) and _normalize(head) == _STANDARD_NORMALIZED
+
+def ensure_format():
+    """
+    返回可用的格式文件目录；首次调用时构建格式文件。
+    未启用或构建失败时返回 None，调用方应退回普通编译。
+    """
+    if not config_section("latex_format").get("enabled", False) or _format_state["failed"]:
+        return None
+    if _format_state["ready"]:
+        return _format_state["directory"]
+
+    with _build_lock:
+        if _format_state["ready"] or _format_state["failed"]:
+            return None if _format_state["failed"] else _format_state["directory"]
+        base_directory = _format_directory()
+        os.makedirs(base_directory, exist_ok=True)
+        key = _format_key(base_directory)
+        directory = os.path.join(base_directory, key) if key else None
+        if directory and (os.path.exists(os.path.join(directory, f"{FORMAT_NAME}.fmt")) or _build_format(directory)):
+            _format_state.update(ready=True, directory=directory)
+            return directory
+        _format_state["failed"] = True
+        return None
+
+def _build_format(directory: str) -> bool:
+    """使用 mylatexformat 将标准导言区转储为格式文件"""
+    print("-> Building precompiled TikZ preamble format (one-off)...")
+    os.makedirs(directory, exist_ok=True)
+    source_name = f"{FORMAT_NAME}_preamble.tex"
+    with open(os.path.join(directory, source_name), 'w', encoding='utf-8') as f:
+        f.write(STANDARD_PREAMBLE.lstrip() + "\\begin{document}\n\\end{document}\n")
+
+    command = [
+        "pdflatex", "-ini", "-interaction=nonstopmode",
+        f"-jobname={FORMAT_NAME}",
+        "&pdflatex", "mylatexformat.ltx", source_name,
+    ]
+    try:
+        returncode, _, _ = run_pdflatex(command, cwd=directory)
+    except (OSError, CompileTimeoutError) as e:
+        print(f"⚠️ Could not build preamble format: {e}")
+        return False
+
+    if returncode != 0 or not os.path.exists(os.path.join(directory, f"{FORMAT_NAME}.fmt")):
+        print(f"⚠️ Could not build preamble format (return code {returncode}); using normal compilation.")
+        return False
+    print(f"✅ Precompiled preamble format ready: {os.path.join(directory, FORMAT_NAME)}.fmt")
+    return True
+
+def format_command(tex_filename: str, format_dir: str):
+    """返回使用预编译格式的 pdflatex 命令及环境变量"""
+    env = dict(os.environ)
+    # 末尾的路径分隔符表示在此目录之后继续搜索默认的格式路径
+    env["TEXFORMATS"] = format_dir + os.pathsep + env.get("TEXFORMATS", "")
+    command = ["pdflatex", "-interaction=nonstopmode", f"-fmt={FORMAT_NAME}", tex_filename]
+    return command, env
+
+def format_unusable(output: str) -> bool:
+    """根据 pdflatex 的输出判断失败是否由格式文件本身引起；若是，则在本进程内停用格式"""
+    lowered = output.lower()
+    if any(marker in lowered for marker in _FORMAT_FAILURE_MARKERS):
+        _format_state["failed"] = True
+        # 删除无法加载的格式文件，下次启动时会重新构建
+        try:
+            os.remove(os.path.join(_format_state["directory"], f"{FORMAT_NAME}.fmt"))
+        except (OSError, TypeError):
+            pass
+        print("⚠️ Precompiled preamble format is unusable; falling back to normal compilation.")
+        return True
+    return False
@@ -0,0 +1,198 @@
+# tools/latex_linter.py
+# 编译前的快速静态检查：发现机械性错误（Markdown 标记、括号/环境不匹配、坐标未定义等），
+# 无需运行 pdflatex 和审查员即可直接反馈给工程师。只包含确定会导致编译失败的检查，避免误报。
+import re
+
+PATH_COMMANDS = ("draw", "fill", "filldraw", "path", "node", "coordinate", "clip", "shade", "shadedraw", "pic")
+
+_COMMENT = re.compile(r"(?<!\\)%.*$", re.MULTILINE)
+_PICTURE = re.compile(r"\\begin\{tikzpicture\}(.*?)\\end\{tikzpicture\}", re.DOTALL)
+_CALC = re.compile(r"\(\$(.*?)\$\)", re.DOTALL)
+_MATH = re.compile(r"(?<!\\)\$.*?(?<!\\)\$", re.DOTALL)
+_NAME = r"[A-Za-z][\w']*(?:-\w+)*"
+# 坐标定义: \coordinate (A)、路径中的 coordinate (A)、node (A)、\node[name=A]、name intersections 的 by={P,Q}
+_DEFINITION = re.compile(r"(?:coordinate|node)\s*(?:\[[^\]]*\])?\s*\((" + _NAME + r")\)")
+_NAME_OPTION = re.compile(r"[\[,]\s*name\s*=\s*(" + _NAME + r")\s*[,\]]")
+_BY_OPTION = re.compile(r"\bby\s*=\s*(\{[^}]*\}|" + _NAME + r")")
+# 坐标引用: (A)、(A.north)、(A -| B)；不匹配函数调用如 sin(x) 和数值坐标
+_REFERENCE = re.compile(
+    r"(?<![\w\\])\(\s*(" + _NAME + r")(?:\.[\w ]+)?\s*(?:(?:-\||\|-)\s*(" + _NAME + r")(?:\.[\w ]+)?\s*)?\)"
+)
+# 节点文字 {...} 之前的部分: node / \node 加上任意选项、名称与 at 坐标
+_NODE_HEAD = re.compile(r"\bnode\s*(?:\[[^\]]*\]\s*|\(\$.*?\$\)\s*|\([^()]*\)\s*|at\s*\(\$.*?\$\)\s*|at\s*\([^()]*\)\s*)*\{")
+# label=above:文字 / pin={[red]left:文字} 等选项的值
+_LABEL_OPTION = re.compile(r"\b(?:label|pin)\s*=\s*")
+# 由 \foreach 等宏动态生成的坐标名，无法静态确定
+_DYNAMIC_DEFINITION = re.compile(r"(?:coordinate|node)\s*(?:\[[^\]]*\])?\s*\(\s*\\")
+
+def _strip_comments(latex_code: str) -> str:
+    return _COMMENT.sub("", latex_code)
+
+def _line_of(text: str, index: int) -> int:
+    return text.count("\n", 0, index) + 1
+
+def _check_markdown(latex_code: str) -> list:
+    if re.search(r"^\s*```", latex_code, re.MULTILINE):
+        return ["输出中包含 Markdown 代码块标记 (```)。请只输出纯 LaTeX 文档，不要使用任何 Markdown 标记。"]
+    return []
+
+def _check_document_structure(code: str) -> list:
+    findings = []
+    for command, hint in ((r"\documentclass", r"\documentclass[tikz,border=10pt]{standalone}"),
+                          (r"\begin{document}", r"\begin{document}"),
+                          (r"\end{document}", r"\end{document}")):
+        if command not in code:
+            findings.append(f"缺少 `{command}`。文档必须严格遵循模板，包含 `{hint}`。")
+    preface = code.split(r"\documentclass", 1)[0].strip()
+    if preface and r"\documentclass" in code and not preface.startswith("```"):
+        findings.append(f"`\\documentclass` 之前包含多余的文字 (\"{preface.splitlines()[0][:40]}\")。输出必须以 `\\documentclass` 开头。")
+    return findings
+
+def _check_environments(code: str) -> list:
+    """检查 \\begin{...}/\\end{...} 是否正确配对和嵌套"""
+    findings = []
+    stack = []
+    for match in re.finditer(r"\\(begin|end)\{([^}]+)\}", code):
+        kind, env = match.groups()
+        line = _line_of(code, match.start())
+        if kind == "begin":
+            stack.append((env, line))
+        elif not stack:
+            findings.append(f"第 {line} 行的 `\\end{{{env}}}` 没有对应的 `\\begin{{{env}}}`。")
+        elif stack[-1][0] != env:
+            open_env, open_line = stack[-1]
+            findings.append(f"环境嵌套错误：第 {open_line} 行的 `\\begin{{{open_env}}}` 应先用 `\\end{{{open_env}}}` 关闭，"
+                            f"但第 {line} 行出现了 `\\end{{{env}}}`。")
+            return findings
+        else:
+            stack.pop()
+    for env, line in stack:
+        findings.append(f"第 {line} 行的 `\\begin{{{env}}}` 缺少对应的 `\\end{{{env}}}`。")
+    return findings
+
+def _check_braces(code: str) -> list:
+    """检查花括号是否配对（忽略转义的 \\{ 和 \\}）"""
+    depth_stack = []
+    for match in re.finditer(r"(?<!\\)[{}]", code):
+        if match.group() == "{":
+            depth_stack.append(match.start())
+        elif depth_stack:
+            depth_stack.pop()
+        else:
+            return [f"第 {_line_of(code, match.start())} 行有多余的右花括号 `}}`。"]
+    if depth_stack:
+        return [f"第 {_line_of(code, depth_stack[-1])} 行的左花括号 `{{` 没有闭合。"]
+    return []
+
+def _check_semicolons(body: str, offset_line: int) -> list:
+    """TikZ 路径命令必须以分号结束：检查每条路径命令到下一条命令 (或图形结尾) 之间是否有分号"""
+    starts = re.compile(r"^\s*\\(" + "|".join(PATH_COMMANDS) + r")\b", re.MULTILINE)
+    findings = []
+    matches = list(starts.finditer(body))
+    for current, end in zip(matches, [m.start() for m in matches[1:]] + [len(body)]):
+        if ";" not in body[current.start():end]:
+            line = offset_line + _line_of(body, current.start()) - 1
+            findings.append(f"第 {line} 行的 `\\{current.group(1)}` 命令缺少结尾的分号 `;`。")
+    return findings
+
+def _blank(text: str, start: int, end: int) -> str:
+    """将 text[start:end] 替换为空格 (保留换行，行号不变)"""
+    return text[:start] + re.sub(r"[^\n]", " ", text[start:end]) + text[end:]
+
+def _group_end(text: str, start: int, stops: str = "") -> int:
+    """从 start 开始扫描到同层的右花括号 (start 处为左花括号时) 或 stops 中的字符，返回结束位置"""
+    depth = 0
+    for i in range(start, len(text)):
+        ch = text[i]
+        if ch == "{" and (i == 0 or text[i - 1] != "\\"):
+            depth += 1
+        elif ch == "}" and (i == 0 or text[i - 1] != "\\"):
+            depth -= 1
+            if depth == 0 and not stops:
+                return i + 1
+            if depth < 0:
+                return i
+        elif depth == 0 and ch in stops:
+            return i
+    return len(text)
+
+def _mask_node_text(body: str) -> str:
+    """
+    去掉节点文字与 label/pin 选项中的文字，如 node[below] {length (cm)} 中的 (cm) 不是坐标引用。
+    选项中的坐标 (如 shift={(A)}) 不受影响。
+    """
+    for match in list(_NODE_HEAD.finditer(body)):
+        brace = match.end() - 1
+        body = _blank(body, brace + 1, _group_end(body, brace) - 1)
+    for match in list(_LABEL_OPTION.finditer(body)):
+        body = _blank(body, match.end(), _group_end(body, match.end(), stops=",]"))
+    return body
+
+def _check_coordinates(body: str, offset_line: int) -> list:
+    """检查坐标名是否在使用前定义"""
+    definitions = {}
+    definition_spans = set()
+    for match in _DEFINITION.finditer(body):
+        definitions.setdefault(match.group(1), match.start(1))
+        definition_spans.add(match.start(1))
+    for match in _NAME_OPTION.finditer(body):
+        definitions.setdefault(match.group(1), match.start(1))
+    for match in _BY_OPTION.finditer(body):
+        for name in re.findall(_NAME, match.group(1)):
+            definitions.setdefault(name, match.start(1))
+
+    dynamic = bool(_DYNAMIC_DEFINITION.search(body))
+    implicit_intersections = "name intersections" in body
+
+    # 先去掉节点文字，再收集 calc 表达式 ($...$) 中的引用，最后去掉普通数学公式，避免将 $f(x)$ 误认为坐标
+    text = _mask_node_text(body)
+    references = []
+    for calc in _CALC.finditer(text):
+        for ref in _REFERENCE.finditer(calc.group(1)):
+            references.append((ref, calc.start(1)))
+    masked = _CALC.sub(lambda m: " " * len(m.group()), text)
+    masked = _MATH.sub(lambda m: " " * len(m.group()), masked)
+    for ref in _REFERENCE.finditer(masked):
+        references.append((ref, 0))
+
+    findings = []
+    reported = set()
+    for ref, base in sorted(references, key=lambda r: r[0].start() + r[1]):
+        for group in (1, 2):
+            name = ref.group(group)
+            if not name or name in reported:
+                continue
+            position = base + ref.start(group)
+            if position in definition_spans:
+                continue
+            line = offset_line + _line_of(body, position) - 1
+            if name in definitions:
+                if definitions[name] > position:
+                    def_line = offset_line + _line_of(body, definitions[name]) - 1
+                    findings.append(f"第 {line} 行使用了坐标 `({name})`，但它在第 {def_line} 行才被定义。请先定义再使用。")
+                    reported.add(name)
+            elif not dynamic and not (implicit_intersections and name.startswith("intersection")):
+                findings.append(f"第 {line} 行使用了未定义的坐标 `({name})`。请先用 `\\coordinate ({name}) at (x,y);` 定义它。")
+                reported.add(name)
+    return findings
+
+def lint_latex_code(latex_code: str) -> list:
+    """
+    对 LaTeX/TikZ 代码进行静态检查，返回问题列表（为空表示未发现问题）。
+    """
+    findings = _check_markdown(latex_code)
+    code = _strip_comments(latex_code)
+    findings += _check_document_structure(code)
+    findings += _check_environments(code)
+    findings += _check_braces(code)
+    for picture in _PICTURE.finditer(code):
+        offset_line = _line_of(code, picture.start(1))
+        findings += _check_semicolons(picture.group(1), offset_line)
+        findings += _check_coordinates(picture.group(1), offset_line)
+    return findings
+
+def format_lint_feedback(findings: list) -> str:
+    """将静态检查结果整理为发给工程师的反馈"""
+    lines = ["静态检查在编译前发现以下问题，请逐条修正后重新输出完整的 LaTeX 文档："]
+    lines += [f"{i}. {finding}" for i, finding in enumerate(findings, start=1)]
+    return "\n".join(lines)
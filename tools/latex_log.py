@@ -0,0 +1,129 @@
+# tools/latex_log.py
+# LaTeX 日志解析：从日志末尾读取，提取错误（含行号与出错的源码行）、未定义的控制序列、
+# Overfull 盒子与 TeX 容量错误，整理成紧凑的结构化记录，代替原始日志发送给审查员和分析师。
+import os
+import re
+
+# 出错信息总是位于日志末尾附近，只需读取最后这部分
+TAIL_BYTES = 64 * 1024
+MAX_ERRORS = 5
+MAX_BOXES = 3
+
+_ERROR_START = re.compile(r"^! (.*)$")
+_FILE_LINE_ERROR = re.compile(r"^(?:\./)?[^:\s]+\.tex:(\d+): (.*)$")
+_LINE_MARKER = re.compile(r"^l\.(\d+) ?(.*)$")
+_CONTROL_SEQUENCE = re.compile(r"(\\[A-Za-z@]+|\\.)\s*$")
+_OVERFULL = re.compile(r"^(Overfull \\[hv]box \([^)]*\).*?)(?: at lines? (\d+)(?:--\d+)?)?$")
+_CAPACITY = re.compile(r"TeX capacity exceeded, sorry \[(.*?)\]")
+_MISSING_FILE = re.compile(r"File `([^']+)' not found")
+
+def read_log_tail(log_path: str, max_bytes: int = TAIL_BYTES) -> str:
+    """从文件末尾读取最多 max_bytes 字节；截断时丢弃开头不完整的一行"""
+    with open(log_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        data = f.read()
+    text = data.decode('utf-8', errors='replace')
+    if size > max_bytes:
+        text = text.split("\n", 1)[-1]
+    return text
+
+def _source_line(source_lines: list, line_number: int) -> str:
+    if source_lines and 0 < line_number <= len(source_lines):
+        return source_lines[line_number - 1].strip()
+    return ""
+
+def parse_latex_log(log_text: str, latex_code: str = "") -> dict:
+    """
+    解析 pdflatex 的日志（或终端输出），返回结构化记录：
+    {"errors": [{"message", "line", "context", "source"}], "undefined_control_sequences": [...],
+     "overfull_boxes": [...], "capacity_exceeded": str | None, "missing_files": [...], "no_output": bool}
+    """
+    source_lines = latex_code.splitlines() if latex_code else []
+    lines = log_text.splitlines()
+    record = {
+        "errors": [],
+        "undefined_control_sequences": [],
+        "overfull_boxes": [],
+        "capacity_exceeded": None,
+        "missing_files": [],
+        "no_output": "No pages of output." in log_text,
+    }
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        start = _ERROR_START.match(line) or _FILE_LINE_ERROR.match(line)
+        overfull = _OVERFULL.match(line)
+        if start:
+            message = start.group(start.lastindex)
+            error = {"message": message, "line": None, "context": "", "source": ""}
+            if start.re is _FILE_LINE_ERROR:
+                error["line"] = int(start.group(1))
+            # 错误信息可能跨多行，直到遇到 "l.<行号>" 标记
+            for j in range(i + 1, min(i + 12, len(lines))):
+                marker = _LINE_MARKER.match(lines[j])
+                if marker:
+                    error["line"] = int(marker.group(1))
+                    remainder = lines[j + 1].strip() if j + 1 < len(lines) else ""
+                    error["context"] = f"{marker.group(2)} {remainder}".strip()
+                    if "Undefined control sequence" in message:
+                        cs = _CONTROL_SEQUENCE.search(marker.group(2))
+                        if cs and cs.group(1) not in record["undefined_control_sequences"]:
+                            record["undefined_control_sequences"].append(cs.group(1))
+                    i = j
+                    break
+                if _ERROR_START.match(lines[j]):
+                    break
+            if error["line"]:
+                error["source"] = _source_line(source_lines, error["line"])
+            capacity = _CAPACITY.search(message)
+            if capacity:
+                record["capacity_exceeded"] = capacity.group(1)
+            missing = _MISSING_FILE.search(message)
+            if missing and missing.group(1) not in record["missing_files"]:
+                record["missing_files"].append(missing.group(1))
+            # 同一错误常因 nonstopmode 被重复报告，只保留第一次
+            if not any(e["message"] == error["message"] and e["line"] == error["line"] for e in record["errors"]):
+                record["errors"].append(error)
+        elif overfull and len(record["overfull_boxes"]) < MAX_BOXES:
+            record["overfull_boxes"].append(overfull.group(0).strip())
+        i += 1
+    return record
+
+def format_log_record(record: dict) -> str:
+    """将结构化记录整理为发给 LLM 的紧凑文本"""
+    lines = []
+    if record["capacity_exceeded"]:
+        lines.append(f"TeX 容量超限 ({record['capacity_exceeded']})：代码很可能存在无限递归或过多的采样点。")
+    if record["missing_files"]:
+        lines.append(f"缺少文件: {', '.join(record['missing_files'])}")
+    if record["undefined_control_sequences"]:
+        lines.append(f"未定义的控制序列: {', '.join(record['undefined_control_sequences'])}")
+    errors = record["errors"]
+    if errors:
+        lines.append(f"LaTeX 错误 ({len(errors)} 处):")
+        for n, error in enumerate(errors[:MAX_ERRORS], start=1):
+            where = f"第 {error['line']} 行: " if error["line"] else ""
+            lines.append(f"{n}. {where}{error['message']}")
+            if error["source"]:
+                lines.append(f"   源码: {error['source']}")
+            elif error["context"]:
+                lines.append(f"   上下文: {error['context']}")
+        if len(errors) > MAX_ERRORS:
+            lines.append(f"... 另有 {len(errors) - MAX_ERRORS} 处错误未列出")
+    if record["overfull_boxes"]:
+        lines.append("排版警告:")
+        lines += [f"- {box}" for box in record["overfull_boxes"]]
+    if record["no_output"]:
+        lines.append("没有生成任何页面 (No pages of output)。")
+    return "\n".join(lines) if lines else "日志中没有发现错误或警告。"
+
+def summarize_latex_log(log_path: str, latex_code: str = "") -> str:
+    """读取日志末尾并返回紧凑的错误摘要；日志不存在时返回说明文字"""
+    try:
+        log_text = read_log_tail(log_path)
+    except OSError:
+        return "Log file not found or could not be read."
+    return format_log_record(parse_latex_log(log_text, latex_code))
@@ -0,0 +1,102 @@
+# tools/llm_cache.py
+import hashlib
+import json
+import os
+import re
+
+from langchain_core.messages import AIMessage
+
+from config import config_section
+from tools.disk_cache import DiskCache, shared_disk_cache
+
+# 匹配消息中内联的 base64 图片，计算缓存键时只使用其哈希
+DATA_URL_PATTERN = re.compile(r"^data:([\w/+.-]+);base64,(.*)$", re.DOTALL)
+
+def _llm_cache() -> DiskCache:
+    """LLM 响应的磁盘缓存，按当前 llm_cache 配置返回"""
+    settings = config_section("llm_cache")
+    return shared_disk_cache(
+        directory=settings.get("directory", os.path.join(".cache", "llm")),
+        max_bytes=int(settings.get("max_size_mb", 200) * 1024 * 1024),
+        name="llm",
+    )
+
+def normalize_content(content):
+    """将消息内容转换为可哈希的结构，图片数据替换为其 SHA-256"""
+    if isinstance(content, str):
+        return content
+    normalized = []
+    for part in content:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            url = part["image_url"]["url"] if isinstance(part["image_url"], dict) else part["image_url"]
+            match = DATA_URL_PATTERN.match(url)
+            if match:
+                digest = hashlib.sha256(match.group(2).encode('ascii')).hexdigest()
+                url = f"{match.group(1)};sha256={digest}"
+            normalized.append({"type": "image_url", "image_url": url})
+        else:
+            normalized.append(part)
+    return normalized
+
+def model_name_of(llm) -> str:
+    """获取 LLM 实例的模型名称"""
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+def cache_key(llm, messages: list) -> str:
+    """根据模型名称、温度以及全部消息（含系统提示词和图片哈希）计算缓存键"""
+    payload = {
+        "model": model_name_of(llm),
+        "temperature": getattr(llm, "temperature", None),
+        "messages": [{"role": m.type, "content": normalize_content(m.content)} for m in messages],
+    }
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+def should_use_cache(llm, use_cache=None) -> bool:
+    """
+    判断本次调用是否使用缓存。
+    use_cache 显式指定时优先；否则只对温度为 0 的确定性调用启用缓存。
+    """
+    if os.getenv("MATHSVG_NO_LLM_CACHE"):
+        return False
+    if use_cache is not None:
+        return use_cache
+    settings = config_section("llm_cache")
+    if not settings.get("enabled", True):
+        return False
+    temperature = getattr(llm, "temperature", None)
+    return settings.get("cache_nonzero_temperature", False) or not temperature
+
+def load_cached_response(key: str):
+    """读取缓存的响应，未命中时返回 None"""
+    path = _llm_cache().lookup(key)
+    if not path:
+        return None
+    try:
+        with open(os.path.join(path, "response.json"), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return AIMessage(
+        content=record["content"],
+        response_metadata={**record.get("response_metadata", {}), "cache_hit": True},
+        usage_metadata=record.get("usage_metadata"),
+    )
+
+def store_response(key: str, llm, response) -> None:
+    """将响应写入缓存"""
+    record = {
+        "model": model_name_of(llm),
+        "content": response.content,
+        "response_metadata": getattr(response, "response_metadata", {}) or {},
+        "usage_metadata": getattr(response, "usage_metadata", None),
+    }
+    data = json.dumps(record, ensure_ascii=False, default=str).encode('utf-8')
+    try:
+        _llm_cache().store(key, {"response.json": data})
+    except OSError as e:
+        print(f"⚠️ Failed to write LLM cache entry: {e}")
+
+def llm_cache_stats() -> dict:
+    """返回 LLM 缓存的命中统计"""
+    return _llm_cache().stats()
@@ -0,0 +1,54 @@
+# tools/llm_client.py
+# 所有智能体调用 LLM 的统一入口。缓存、追踪、录制/回放等横切逻辑都在这里处理，智能体本身只负责构建消息。
+# 调用顺序: 缓存 -> 录制/回放 (cassette) -> 对冲 (hedging) -> 限流与重试 (llm_limits) -> 真实 LLM。
+from tools.cassette import acall_llm, call_llm
+from tools.llm_cache import cache_key, load_cached_response, model_name_of, should_use_cache, store_response
+from tools.tracing import image_bytes_of, record_llm_usage, span
+
+def invoke_llm(llm, messages: list, use_cache=None, agent: str = None):
+    """
+    调用 LLM 并返回响应消息。
+    use_cache 为 None 时按默认策略决定是否使用缓存（温度为 0 的调用会被缓存）。
+    agent 为调用方的角色 (planner / translator / critic / title)，用于选择对冲策略。
+    """
+    model = model_name_of(llm)
+    with span(f"llm:{model}", "llm", model=model, agent=agent, image_bytes=image_bytes_of(messages)) as attrs:
+        if not should_use_cache(llm, use_cache):
+            response = call_llm(llm, messages, attrs)
+            record_llm_usage(attrs, response)
+            return response
+
+        key = cache_key(llm, messages)
+        cached = load_cached_response(key)
+        if cached is not None:
+            print("-> LLM cache hit.")
+            # 缓存命中不消耗 token，不记录用量
+            attrs["cache_hit"] = True
+            return cached
+
+        response = call_llm(llm, messages, attrs)
+        store_response(key, llm, response)
+        record_llm_usage(attrs, response)
+        return response
+
+async def ainvoke_llm(llm, messages: list, use_cache=None, agent: str = None):
+    """invoke_llm 的异步版本"""
+    model = model_name_of(llm)
+    with span(f"llm:{model}", "llm", model=model, agent=agent, image_bytes=image_bytes_of(messages)) as attrs:
+        if not should_use_cache(llm, use_cache):
+            response = await acall_llm(llm, messages, attrs)
+            record_llm_usage(attrs, response)
+            return response
+
+        key = cache_key(llm, messages)
+        cached = load_cached_response(key)
+        if cached is not None:
+            print("-> LLM cache hit.")
+            # 缓存命中不消耗 token，不记录用量
+            attrs["cache_hit"] = True
+            return cached
+
+        response = await acall_llm(llm, messages, attrs)
+        store_response(key, llm, response)
+        record_llm_usage(attrs, response)
+        return response
@@ -0,0 +1,320 @@
+# tools/llm_limits.py
+# LLM 请求的流量控制：每个模型一个令牌桶限制请求速率、一个信号量限制同时进行的请求数，
+# 遇到 429 / 5xx / 超时 / 连接错误时按带抖动的指数退避重试，并遵守服务端返回的 Retry-After。
+# 429 的 Retry-After 对同一模型的所有并发请求生效，避免各线程各自重试、继续触发限流。
+# 所有角色共用按 base_url 复用的 httpx 连接池 (keep-alive)。重试次数与限流等待时间记录为指标。
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+
+from config import config_section
+
+RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+# openai / httpx 中表示超时或连接失败的异常 (按名称判断，避免在这里导入 openai)
+_RETRY_ERROR_NAMES = ("APITimeoutError", "APIConnectionError", "TimeoutException", "ConnectError",
+                      "ReadTimeout", "ConnectTimeout", "RemoteProtocolError")
+
+def _settings() -> dict:
+    """读取 llm_limits 配置段并补全默认值"""
+    section = config_section("llm_limits")
+    return {
+        # 每分钟请求数；可以按模型单独设置，例如 {"default": 60, "gpt-4o": 30}。0 表示不限速
+        "requests_per_minute": section.get("requests_per_minute", 0),
+        # 令牌桶容量，即空闲之后允许的突发请求数
+        "burst": max(1, int(section.get("burst", 5))),
+        # 每个模型同时进行的请求数上限
+        "max_in_flight": max(1, int(section.get("max_in_flight", 8))),
+        "max_retries": max(0, int(section.get("max_retries", 4))),
+        "backoff_base": float(section.get("backoff_base_seconds", 1.0)),
+        "backoff_max": float(section.get("backoff_max_seconds", 30.0)),
+        # 服务端要求的等待时间过长时不再等待，直接报错
+        "max_retry_after": float(section.get("max_retry_after_seconds", 60.0)),
+        "max_connections": int(section.get("max_connections", 20)),
+        "max_keepalive_connections": int(section.get("max_keepalive_connections", 10)),
+        "keepalive_expiry": float(section.get("keepalive_expiry_seconds", 30.0)),
+    }
+
+def request_timeout() -> float:
+    """单次 LLM 请求的超时秒数"""
+    return float(config_section("llm_limits").get("request_timeout_seconds", 60.0))
+
+def _rate_of(model: str, rpm) -> float:
+    """模型的每秒请求数；0 表示不限速"""
+    if isinstance(rpm, dict):
+        rpm = rpm.get(model, rpm.get("default", 0))
+    return float(rpm or 0) / 60
+
+class InFlightGate:
+    """
+    同时进行的请求数上限，线程与各线程中的事件循环共用。
+    释放时直接把名额交给最早等待的调用方 (线程或协程)，异步调用方等待期间不占用线程、也不轮询。
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self.slots > 0 and not self._waiters:
+                self.slots -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.slots > 0 and not self._waiters:
+                self.slots -= 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiting = (loop, future) in self._waiters
+                if waiting:
+                    self._waiters.remove((loop, future))
+            # 已经分到名额 (future 有结果) 时归还；future 被取消时由 _hand_over 归还
+            if not waiting and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self.slots += 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            try:
+                loop.call_soon_threadsafe(self._hand_over, future)
+            except RuntimeError:
+                # 事件循环已经关闭，名额交给下一个等待者
+                self.release()
+
+    def _hand_over(self, future) -> None:
+        """在等待者的事件循环中运行：等待者已被取消时把名额交给下一个"""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+class ModelLimiter:
+    """一个模型的令牌桶、并发信号量与指标"""
+
+    def __init__(self, model: str):
+        settings = _settings()
+        self.model = model
+        self.rate = _rate_of(model, settings["requests_per_minute"])
+        self.burst = settings["burst"]
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        # 429 的 Retry-After 生效期间，所有请求都要等到这个时间点之后
+        self.blocked_until = 0.0
+        self.in_flight = InFlightGate(settings["max_in_flight"])
+        self._lock = threading.Lock()
+        self.metrics = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0,
+                        "throttle_wait_seconds": 0.0, "in_flight": 0, "peak_in_flight": 0}
+
+    def reserve(self) -> float:
+        """预订一个令牌，返回发出请求前需要等待的秒数 (令牌可以透支，由等待时间补偿)"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.blocked_until - now)
+            if self.rate > 0:
+                self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def block_for(self, seconds: float) -> None:
+        """服务端要求等待时，让同一模型的后续请求都推迟"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def count(self, field: str, amount=1) -> None:
+        with self._lock:
+            self.metrics[field] += amount
+
+    def enter(self) -> None:
+        with self._lock:
+            self.metrics["calls"] += 1
+            self.metrics["in_flight"] += 1
+            self.metrics["peak_in_flight"] = max(self.metrics["peak_in_flight"], self.metrics["in_flight"])
+
+    def leave(self) -> None:
+        with self._lock:
+            self.metrics["in_flight"] -= 1
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(model: str) -> ModelLimiter:
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = ModelLimiter(model)
+        return _limiters[model]
+
+def llm_metrics() -> dict:
+    """各模型的调用数、重试次数、限流次数与累计等待时间"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    snapshot = {}
+    for limiter in limiters:
+        with limiter._lock:
+            snapshot[limiter.model] = {**limiter.metrics,
+                                       "throttle_wait_seconds": round(limiter.metrics["throttle_wait_seconds"], 3)}
+    return snapshot
+
+def _status_of(error: Exception):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def is_retryable(error: Exception) -> bool:
+    """429、5xx、超时与连接错误可以重试；其他错误 (如 400、401) 重试也不会成功"""
+    if _status_of(error) in RETRY_STATUS_CODES:
+        return True
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _RETRY_ERROR_NAMES for cls in type(error).__mro__)
+
+def retry_after_of(error: Exception):
+    """从响应头中读取服务端要求的等待秒数 (retry-after-ms / retry-after)，没有时返回 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP 日期格式
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """第 attempt 次重试前的等待时间：有 Retry-After 时遵守它，否则为带完全抖动的指数退避"""
+    settings = _settings()
+    retry_after = retry_after_of(error)
+    if retry_after is not None:
+        # 加一点抖动，避免同时被限流的请求在同一时刻一起重试
+        return retry_after + random.uniform(0, settings["backoff_base"] / 2)
+    return random.uniform(0, min(settings["backoff_max"], settings["backoff_base"] * 2 ** attempt))
+
+def _should_retry(limiter: ModelLimiter, attempt: int, error: Exception):
+    """返回重试前的等待秒数；不应重试时返回 None"""
+    settings = _settings()
+    if attempt >= settings["max_retries"] or not is_retryable(error):
+        return None
+    delay = backoff_delay(attempt, error)
+    if retry_after_of(error) is not None and delay > settings["max_retry_after"]:
+        return None
+    if _status_of(error) == 429:
+        limiter.count("rate_limited")
+        limiter.block_for(delay)
+    limiter.count("retries")
+    print(f"-> ⏳ LLM request to {limiter.model} failed ({type(error).__name__}"
+          f"{f' {_status_of(error)}' if _status_of(error) else ''}); retry {attempt + 1}/{settings['max_retries']} in {delay:.1f}s")
+    return delay
+
+def call_with_limits(model: str, call, attrs: dict = None):
+    """
+    在模型的速率与并发限制下执行 call()，可重试的错误按退避策略重试。
+    attrs 为追踪 span 的属性，写入重试次数与限流等待时间。
+    """
+    limiter = limiter_for(model)
+    attrs = attrs if attrs is not None else {}
+    attempt = 0
+    while True:
+        start = time.perf_counter()
+        wait = limiter.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        limiter.in_flight.acquire()
+        waited = time.perf_counter() - start
+        limiter.count("throttle_wait_seconds", waited)
+        attrs["throttle_ms"] = round(attrs.get("throttle_ms", 0) + waited * 1000, 3)
+        limiter.enter()
+        try:
+            return call()
+        except Exception as e:
+            delay = _should_retry(limiter, attempt, e)
+            if delay is None:
+                limiter.count("failures")
+                raise
+        finally:
+            limiter.leave()
+            limiter.in_flight.release()
+        attempt += 1
+        attrs["retries"] = attempt
+        time.sleep(delay)
+
+async def acall_with_limits(model: str, call, attrs: dict = None):
+    """call_with_limits 的异步版本：call 为无参的协程函数"""
+    limiter = limiter_for(model)
+    attrs = attrs if attrs is not None else {}
+    attempt = 0
+    while True:
+        start = time.perf_counter()
+        wait = limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await limiter.in_flight.aacquire()
+        waited = time.perf_counter() - start
+        limiter.count("throttle_wait_seconds", waited)
+        attrs["throttle_ms"] = round(attrs.get("throttle_ms", 0) + waited * 1000, 3)
+        limiter.enter()
+        try:
+            return await call()
+        except Exception as e:
+            delay = _should_retry(limiter, attempt, e)
+            if delay is None:
+                limiter.count("failures")
+                raise
+        finally:
+            limiter.leave()
+            limiter.in_flight.release()
+        attempt += 1
+        attrs["retries"] = attempt
+        await asyncio.sleep(delay)
+
+_http_clients = {}
+_http_clients_lock = threading.Lock()
+
+def http_clients(base_url: str = None) -> tuple:
+    """
+    返回 (httpx.Client, httpx.AsyncClient)，同一个 base_url 的所有 LLM 客户端共用，
+    保持 keep-alive 连接，避免每次请求重新握手 TLS。
+    """
+    import httpx
+
+    with _http_clients_lock:
+        if base_url not in _http_clients:
+            settings = _settings()
+            limits = httpx.Limits(max_connections=settings["max_connections"],
+                                  max_keepalive_connections=settings["max_keepalive_connections"],
+                                  keepalive_expiry=settings["keepalive_expiry"])
+            timeout = httpx.Timeout(request_timeout(), connect=min(10.0, request_timeout()))
+            _http_clients[base_url] = (httpx.Client(limits=limits, timeout=timeout),
+                                       httpx.AsyncClient(limits=limits, timeout=timeout))
+        return _http_clients[base_url]
@@ -1,41 +1,151 @@
 # tools/logger.py
+# 工作流日志。调用方只把格式化好的记录放入队列，由后台写线程按批追加到 workflow_log.txt，
+# 并在旁边写入机器可读的 workflow_log.jsonl；节点代码不会因为磁盘 I/O 而阻塞。
+# 进程退出 (包括未捕获的异常和 SIGTERM) 时通过 atexit 写完队列中剩余的记录，也可以随时调用 flush_logs()。
+import atexit
 import datetime
+import json
 import os
+import queue
+import signal
+import threading
+import time
+
+from config import config_section
+
+_SEPARATOR = "=" * 70
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
 
 def get_timestamp():
     """返回标准格式的当前时间戳。"""
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+def jsonl_path_of(log_path: str) -> str:
+    """文本日志对应的 JSONL 日志路径 (workflow_log.txt -> workflow_log.jsonl)"""
+    return os.path.splitext(log_path)[0] + ".jsonl"
+
+def _write_batch(records: list) -> None:
+    """按顺序写入一批记录，每个文件在一批中只打开一次；mode 为 "w" 的记录会重新创建文件"""
+    handles = {}
+    write_jsonl = config_section("logging").get("jsonl", True)
+    try:
+        for record in records:
+            targets = [(record["path"], record["text"])]
+            if write_jsonl:
+                targets.append((jsonl_path_of(record["path"]), json.dumps(record["entry"], ensure_ascii=False) + "\n"))
+            for path, content in targets:
+                try:
+                    if record["mode"] == "w" or path not in handles:
+                        if path in handles:
+                            handles.pop(path).close()
+                        handles[path] = open(path, record["mode"], encoding='utf-8')
+                    handles[path].write(content)
+                except Exception as e:
+                    print(f"错误：无法写入日志文件 {path}: {e}")
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+def _drain(records: list) -> list:
+    """取出队列中已有的全部记录，追加到 records 后返回"""
+    while True:
+        try:
+            records.append(_queue.get_nowait())
+        except queue.Empty:
+            return records
+
+def _writer_loop() -> None:
+    while True:
+        records = [_queue.get()]
+        # 任何异常都只影响这一批记录，写线程本身不能退出
+        try:
+            # 收到第一条记录后等待一小段时间，期间到达的记录合并为一次写入
+            flush_interval = float(config_section("logging").get("flush_interval_seconds", 0.2))
+            if flush_interval > 0:
+                time.sleep(flush_interval)
+            _write_batch(_drain(records))
+        except Exception as e:
+            print(f"错误：日志写线程无法写入 {len(records)} 条记录: {e}")
+        finally:
+            for _ in records:
+                _queue.task_done()
+
+def _submit(record: dict) -> None:
+    """将记录交给后台写线程 (第一次调用时启动)；未启用缓冲时直接写入"""
+    global _writer
+    # buffered 为 False 时退回每次调用同步写文件 (先写完队列中已有的记录，保证顺序)
+    if not config_section("logging").get("buffered", True):
+        flush_logs()
+        _write_batch([record])
+        return
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_writer_loop, name="log-writer", daemon=True)
+                _writer.start()
+    _queue.put(record)
+
+def flush_logs() -> None:
+    """阻塞直到队列中的所有日志记录都已写入磁盘；写线程已经退出时在当前线程中写完剩余的记录"""
+    if _writer is not None and _writer.is_alive():
+        _queue.join()
+        return
+    records = _drain([])
+    if records:
+        try:
+            _write_batch(records)
+        finally:
+            for _ in records:
+                _queue.task_done()
+
+def _exit_on_sigterm(signum, frame) -> None:
+    """
+    SIGTERM 的默认处理会直接结束进程而不运行 atexit。转换为 SystemExit 后主线程正常退出，
+    atexit 中的 flush_logs 写完剩余的记录。不在信号处理函数中直接等待队列：
+    信号可能恰好在主线程持有队列锁时到达，此时等待会死锁。
+    """
+    raise SystemExit(128 + signum)
+
+atexit.register(flush_logs)
+# 只有主线程可以设置信号处理函数；应用已经设置了自己的处理函数时不覆盖
+if (hasattr(signal, "SIGTERM") and threading.current_thread() is threading.main_thread()
+        and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL):
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
 def initialize_log(directory: str) -> str:
     """
     在指定的目录中初始化一个日志文件。
     返回日志文件的完整路径。
     """
     log_path = os.path.join(directory, "workflow_log.txt")
-    try:
-        with open(log_path, 'w', encoding='utf-8') as f:
-            f.write(f"[{get_timestamp()}] --- 工作流日志初始化 ---\n")
-            f.write(f"日志文件创建于: {log_path}\n")
-        return log_path
-    except Exception as e:
+    if not os.path.isdir(directory):
         # 在主程序中打印错误，因为日志本身可能无法工作
-        print(f"错误：无法初始化日志文件于 {log_path}: {e}")
+        print(f"错误：无法初始化日志文件于 {log_path}: 目录不存在")
         return ""
+    timestamp = get_timestamp()
+    _submit({
+        "path": log_path,
+        "mode": "w",
+        "text": f"[{timestamp}] --- 工作流日志初始化 ---\n日志文件创建于: {log_path}\n",
+        "entry": {"timestamp": timestamp, "title": "工作流日志初始化", "message": log_path,
+                  "thread": threading.current_thread().name},
+    })
+    return log_path
 
 def log_message(log_path: str, message: str, title: str = ""):
     """
-    将一条格式化的消息追加到指定的日志文件中。
+    将一条格式化的消息追加到指定的日志文件中 (由后台线程写入，调用方不会阻塞)。
     """
     if not log_path:
         return
-    try:
-        with open(log_path, 'a', encoding='utf-8') as f:
-            f.write("\n" + "="*70 + "\n")
-            if title:
-                f.write(f"[{get_timestamp()}] --- {title.upper()} ---\n\n")
-            else:
-                f.write(f"[{get_timestamp()}]\n\n")
-            f.write(message.strip() + "\n")
-            f.write("="*70 + "\n")
-    except Exception as e:
-        print(f"错误：无法写入日志文件 {log_path}: {e}")
+    timestamp = get_timestamp()
+    header = f"[{timestamp}] --- {title.upper()} ---\n\n" if title else f"[{timestamp}]\n\n"
+    _submit({
+        "path": log_path,
+        "mode": "a",
+        "text": f"\n{_SEPARATOR}\n{header}{message.strip()}\n{_SEPARATOR}\n",
+        "entry": {"timestamp": timestamp, "title": title, "message": message.strip(),
+                  "thread": threading.current_thread().name},
+    })
@@ -0,0 +1,88 @@
+# tools/patch_utils.py
+# 将 LLM 返回的统一差异格式 (unified diff) 补丁应用到上一轮的 LaTeX 代码上。
+# LLM 给出的行号经常不准确，因此按上下文内容定位每个修改块，行号只用于在多处匹配时选择最近的一处。
+import re
+
+from config import config_section
+
+_HUNK_HEADER = re.compile(r"^@@\s*-(\d+)(?:,\d+)?\s+\+\d+(?:,\d+)?\s*@@")
+_FENCE = re.compile(r"^```[\w-]*\s*$")
+
+class PatchError(ValueError):
+    """补丁格式错误或无法应用到原始代码"""
+
+def patch_revisions_enabled() -> bool:
+    """修正轮次是否让工程师返回补丁而非完整文档；补丁无法应用时自动退回完整重新生成"""
+    return config_section("engineer_patch").get("enabled", True)
+
+def parse_unified_diff(diff_text: str) -> list:
+    """
+    解析统一差异格式，返回修改块列表 [{"start": 原始行号提示 (从 0 开始) 或 None, "lines": [(标记, 内容), ...]}]。
+    标记为 " " (上下文)、"-" (删除) 或 "+" (新增)。忽略 Markdown 代码块标记与 ---/+++ 文件头。
+    """
+    hunks = []
+    current = None
+    for line in diff_text.strip("\n").splitlines():
+        if _FENCE.match(line) or line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            continue
+        header = _HUNK_HEADER.match(line)
+        if header:
+            current = {"start": max(int(header.group(1)) - 1, 0), "lines": []}
+            hunks.append(current)
+        elif line.startswith("@@"):
+            # 没有行号的块头，例如 "@@ ... @@"
+            current = {"start": None, "lines": []}
+            hunks.append(current)
+        elif current is None:
+            if line.strip():
+                raise PatchError(f"Unexpected line before the first hunk: {line!r}")
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        elif line[:1] in (" ", "-", "+"):
+            current["lines"].append((line[0], line[1:]))
+        elif not line.strip():
+            current["lines"].append((" ", ""))  # LLM 常常省略空白上下文行前的空格
+        else:
+            raise PatchError(f"Invalid line in hunk: {line!r}")
+    hunks = [hunk for hunk in hunks if any(tag != " " for tag, _ in hunk["lines"])]
+    if not hunks:
+        raise PatchError("The patch contains no changes.")
+    return hunks
+
+def _find_block(lines: list, block: list, start_from: int, hint) -> int:
+    """在 lines[start_from:] 中查找 block，先精确匹配，再忽略行首尾空白匹配；多处匹配时取离行号提示最近的一处"""
+    for normalize in (lambda s: s.rstrip(), lambda s: s.strip()):
+        target = [normalize(s) for s in block]
+        candidates = [i for i in range(start_from, len(lines) - len(block) + 1)
+                      if [normalize(s) for s in lines[i:i + len(block)]] == target]
+        if candidates:
+            return min(candidates, key=lambda i: abs(i - hint)) if hint is not None else candidates[0]
+    return -1
+
+def apply_unified_diff(original: str, diff_text: str) -> str:
+    """将补丁应用到原始文本上，返回修改后的文本；任何一个修改块无法定位时抛出 PatchError"""
+    lines = original.splitlines()
+    hunks = parse_unified_diff(diff_text)
+    result = []
+    position = 0
+    for number, hunk in enumerate(hunks, 1):
+        old_block = [text for tag, text in hunk["lines"] if tag != "+"]
+        if old_block:
+            index = _find_block(lines, old_block, position, hunk["start"])
+        elif hunk["start"] is not None and position <= hunk["start"] <= len(lines):
+            index = hunk["start"]  # 纯插入且没有上下文时，只能依赖行号
+        else:
+            index = -1
+        if index < 0:
+            raise PatchError(f"Hunk {number} does not match the original code.")
+        result.extend(lines[position:index])
+        position = index
+        for tag, text in hunk["lines"]:
+            if tag == "+":
+                result.append(text)
+            else:
+                if tag == " ":
+                    result.append(lines[position])  # 上下文行保留原文 (可能只是空白不同)
+                position += 1
+    result.extend(lines[position:])
+    return "\n".join(result) + ("\n" if original.endswith("\n") else "")
@@ -1,21 +1,131 @@
 # tools/pdf_utils.py
-import fitz  # PyMuPDF
+# PyMuPDF (fitz) 与 Pillow 导入较慢，只在真正渲染时才导入，保证启动速度。
 import base64
+import hashlib
+import io
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config_section
+from tools.disk_cache import DiskCache, shared_disk_cache
+
+def _render_cache() -> DiskCache:
+    """渲染结果的磁盘缓存，按当前 pdf_render 配置返回"""
+    section = config_section("pdf_render")
+    return shared_disk_cache(
+        directory=section.get("cache_directory", os.path.join(".cache", "pdf_render")),
+        max_bytes=int(section.get("cache_max_size_mb", 100) * 1024 * 1024),
+        name="pdf_render",
+    )
+
+def _render_settings() -> dict:
+    """影响渲染结果的参数 (同时作为缓存键的一部分)"""
+    section = config_section("pdf_render")
+    return {
+        "dpi": float(section.get("dpi", 110)),
+        # 单页像素上限，超出时按比例降低分辨率；0 表示不限制
+        "max_pixels": int(section.get("max_pixels", 1_000_000)),
+        "crop": section.get("crop", True),
+        "margin": float(section.get("crop_margin_pt", 8)),
+        # "rgb"、"gray" 或 "palette" (灰度后再量化为少量颜色)
+        "color": section.get("color_mode", "gray"),
+        "palette": int(section.get("palette_colors", 16)),
+    }
+
+def render_cache_key(pdf_bytes: bytes, settings: dict) -> str:
+    """以 PDF 内容与渲染参数的哈希作为缓存键"""
+    digest = hashlib.sha256(pdf_bytes)
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def _content_clip(page, margin: float):
+    """返回页面上实际绘制内容的外接矩形 (加上边距)；没有可识别内容时返回 None"""
+    import fitz  # PyMuPDF
+    bbox = fitz.Rect()
+    for _, rect in page.get_bboxlog():
+        rect = fitz.Rect(rect)
+        if not rect.is_empty and not rect.is_infinite:
+            bbox |= rect
+    if bbox.is_empty:
+        return None
+    clip = bbox + (-margin, -margin, margin, margin)
+    return clip & page.rect
+
+def _zoom_for(rect, settings: dict) -> float:
+    """按 DPI 计算缩放比例，并保证渲染结果不超过像素上限"""
+    zoom = settings["dpi"] / 72
+    max_pixels = settings["max_pixels"]
+    if max_pixels > 0 and rect.width * rect.height * zoom * zoom > max_pixels:
+        zoom = math.sqrt(max_pixels / (rect.width * rect.height))
+    return zoom
+
+def _render_page(pdf_bytes: bytes, page_number: int, settings: dict) -> bytes:
+    """渲染单页为 PNG。每个线程单独打开文档，PyMuPDF 的文档对象不能跨线程共享。"""
+    import fitz  # PyMuPDF
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page = doc[page_number]
+        clip = _content_clip(page, settings["margin"]) if settings["crop"] else None
+        zoom = _zoom_for(clip or page.rect, settings)
+        colorspace = fitz.csRGB if settings["color"] == "rgb" else fitz.csGRAY
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=colorspace, alpha=False)
+        img_bytes = pix.tobytes("png")
+    if settings["color"] == "palette":
+        # 几何图形只有少量灰阶，量化为调色板 PNG 可进一步缩小体积
+        from PIL import Image
+        image = Image.open(io.BytesIO(img_bytes)).quantize(colors=settings["palette"])
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+        img_bytes = buffer.getvalue()
+    return img_bytes
+
+def render_pdf_pages(pdf_path: str) -> list[bytes]:
+    """
+    将 PDF 的每一页渲染为 PNG 字节，结果按 PDF 内容哈希缓存。
+    多页文档的各页并行渲染。
+    """
+    with open(pdf_path, 'rb') as f:
+        pdf_bytes = f.read()
+
+    section = config_section("pdf_render")
+    cache_enabled = section.get("cache_enabled", True)
+    settings = _render_settings()
+    key = render_cache_key(pdf_bytes, settings)
+    if cache_enabled:
+        entry = _render_cache().lookup(key)
+        if entry:
+            pages = []
+            for name in sorted(os.listdir(entry)):
+                with open(os.path.join(entry, name), 'rb') as f:
+                    pages.append(f.read())
+            if pages:
+                return pages
+
+    import fitz  # PyMuPDF
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+    workers = int(section.get("workers", 4))
+    if page_count > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, page_count)) as executor:
+            pages = list(executor.map(lambda n: _render_page(pdf_bytes, n, settings), range(page_count)))
+    else:
+        pages = [_render_page(pdf_bytes, n, settings) for n in range(page_count)]
+
+    if cache_enabled and pages:
+        _render_cache().store(key, {f"page_{n:04d}.png": page for n, page in enumerate(pages)})
+    return pages
 
 def pdf_to_base64_images(pdf_path: str) -> list[str]:
     """
     将PDF文件的每一页转换为Base64编码的PNG图片字符串列表。
     """
     try:
-        doc = fitz.open(pdf_path)
-        base64_images = []
-        for page in doc:
-            pix = page.get_pixmap()
-            img_bytes = pix.tobytes("png")
-            base64_image = base64.b64encode(img_bytes).decode('utf-8')
-            base64_images.append(base64_image)
-        doc.close()
-        return base64_images
+        return [base64.b64encode(img_bytes).decode('utf-8') for img_bytes in render_pdf_pages(pdf_path)]
     except Exception as e:
         print(f"Error converting PDF to images: {e}")
         return []
+
+def pdf_render_cache_stats() -> dict:
+    """返回 PDF 渲染缓存的统计信息"""
+    return _render_cache().stats()
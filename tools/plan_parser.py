@@ -0,0 +1,128 @@
+# tools/plan_parser.py
+# 解析分析师输出的 JSON 几何构建计划。
+import json
+import re
+
+NUMBER = r"[-−]?\d+(?:\.\d+)?"
+POINT_NAME = r"[A-Z](?:_?\d+)?'*"
+
+# 例如 "定义点B的坐标为(-3,0)"、"点C为坐标(3,0)"、"定义顶点A的坐标为（0，4）"
+POINT_DEFINITION = re.compile(
+    r"(?:点|顶点|圆心|中点|垂足|交点)?\s*(" + POINT_NAME + r")\s*(?:的坐标|的位置)?\s*(?:为|是|在|设为|定义为|:|：)\s*"
+    r"(?:坐标|点)?\s*(?:为|是)?\s*[(（]\s*(" + NUMBER + r")\s*[,，]\s*(" + NUMBER + r")\s*[)）]"
+)
+
+# 一条指令中以句号、分号分隔的子句
+CLAUSE_SEPARATOR = re.compile(r"[。；;]|\.(?!\d)")
+_NAME_LIST = r"((?:['\"‘“]?\$?" + POINT_NAME + r"\$?['\"’”]?[\s,，、和与及]*)+)"
+# "连接点A, B, C" / "连接AB和CD" / "绘制线段OA"
+CONNECT = re.compile(r"(?:依次)?(?:连接|连结|连线|画出?线段|绘制线段|画出?|绘制)\s*(?:点|顶点|线段|边)?\s*" + _NAME_LIST)
+# "三角形ABC" / "矩形ABCD"
+POLYGON = re.compile(r"(三角形|四边形|正方形|矩形|长方形|平行四边形|菱形|梯形|多边形|五边形|六边形)\s*([A-Z]{3,})(?![A-Za-z])")
+# 不带顶点名的图形名称，如 "形成一个闭合的矩形"：表示将上一条路径闭合
+CLOSING_SHAPE = re.compile(r"(?:形成|构成|组成|围成|连成)?\s*(?:一个)?\s*(?:闭合|封闭)?的?\s*"
+                           r"(三角形|四边形|正方形|矩形|长方形|平行四边形|菱形|梯形|多边形|五边形|六边形)(?!\s*[A-Z])")
+CLOSED_PATH = re.compile(r"闭合|封闭|首尾相连|cycle|多边形|三角形|四边形|正方形|矩形")
+# 被解析后剩余的无实际含义的字词；剩余内容不为空说明指令中有无法解析的要求
+FILLER = re.compile(
+    r"[\s,，、:：!！'\"“”‘’()（）`$]|定义|使用|利用|用|draw|node|命令|并且|并|和|与|及|然后|最后|依次|将|把|形成|"
+    r"一个|一条|闭合|封闭|首尾相连|路径|图形|的|出|画|绘制|作|添加|加上|为|给|在|四个|三个|五个|六个|两个|所有|全部|各|每个|"
+    r"顶点|点|分别|相应|对应|位置|合适|标签|标注|label|坐标轴|坐标系|[xXyY]\s*轴|其",
+    re.IGNORECASE,
+)
+
+def to_float(text: str) -> float:
+    """将计划中的数字（可能使用全角负号）转换为浮点数"""
+    return float(text.replace("−", "-"))
+
+def load_plan(structured_description: str):
+    """
+    从分析师的输出中解析构建计划 JSON。
+    输出可能被 Markdown 代码块包裹或前后带有说明文字；无法解析时返回 None。
+    """
+    text = structured_description.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        plan = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(plan, dict) or not isinstance(plan.get("construction_plan"), list):
+        return None
+    return plan
+
+def plan_steps(plan: dict) -> list:
+    """返回格式正确的构建步骤列表"""
+    return [step for step in plan.get("construction_plan", []) if isinstance(step, dict)]
+
+def plan_texts(plan: dict) -> list:
+    """返回计划中所有的自然语言文本：描述、推理与指令"""
+    texts = [str(plan.get("description", ""))]
+    for step in plan_steps(plan):
+        texts.append(str(step.get("reasoning", "")))
+        texts.append(str(step.get("instruction", "")))
+    return [t for t in texts if t]
+
+def plan_points(plan: dict) -> dict:
+    """从指令中提取明确给出数值坐标的点，返回 {点名: (x, y)}"""
+    points = {}
+    for step in plan_steps(plan):
+        for match in POINT_DEFINITION.finditer(str(step.get("instruction", ""))):
+            points[match.group(1)] = (to_float(match.group(2)), to_float(match.group(3)))
+    return points
+
+def consume(clause: str, match) -> str:
+    """将已解析的片段替换为空格"""
+    return clause[:match.start()] + " " * (match.end() - match.start()) + clause[match.end():]
+
+def split_names(text: str) -> list:
+    """将 "A, B, C" / "'$A$', '$B$'" / "ABCD" / "AB, BC" 拆分为点名列表的列表（每个元素代表一组连续的点）"""
+    groups = []
+    for token in re.split(r"[\s,，、和与及]+", text):
+        token = re.sub(r"['\"‘’“”$]", "", token)
+        if token:
+            groups.append(re.findall(POINT_NAME, token))
+    return groups
+
+def parse_paths(clause: str) -> tuple:
+    """
+    解析子句中的多边形与连线指令。
+    返回 ([(点名列表, 是否闭合), ...], 消费掉这些片段后剩余的子句)。
+    """
+    paths = []
+    closed = bool(CLOSED_PATH.search(clause))
+    for match in list(POLYGON.finditer(clause)):
+        paths.append((re.findall(POINT_NAME, match.group(2)), True))
+        clause = consume(clause, match)
+    for match in list(CONNECT.finditer(clause)):
+        groups = split_names(match.group(1))
+        if all(len(group) == 1 for group in groups):
+            # "连接点A, B, C, D"：按顺序连成一条路径
+            paths.append(([group[0] for group in groups], closed))
+        else:
+            # "连接AB, BC" 或 "连接ABCD"：每组单独成一条路径
+            paths += [(group, closed and len(group) > 2) for group in groups]
+        clause = consume(clause, match)
+    return paths, clause
+
+def parse_closing_shape(clause: str) -> tuple:
+    """
+    解析不带顶点名的闭合图形子句。
+    返回 (是否要求闭合上一条路径, 剩余的子句)。
+    """
+    closing = False
+    for match in list(CLOSING_SHAPE.finditer(clause)):
+        closing = True
+        clause = consume(clause, match)
+    return closing, clause
+
+def path_segments(names: list, closed: bool) -> list:
+    """路径经过的线段 (两个端点名)，闭合路径包含首尾相连的一段"""
+    segments = list(zip(names, names[1:]))
+    if closed and len(names) > 2:
+        segments.append((names[-1], names[0]))
+    return segments
@@ -0,0 +1,77 @@
+# tools/speculative.py
+# 推测执行：同时运行多个候选任务，第一个满足条件的结果胜出，其余任务被取消。
+# 工程师节点用它并行生成、编译多个候选文档，以少量额外的 token 换取更短的墙钟时间。
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import config_section
+
+DEFAULT_TEMPERATURES = [0.0, 0.5, 0.9]
+DEFAULT_HINTS = [
+    "",
+    "请先用 \\coordinate 显式定义所有点，再用 \\draw 连接，避免在路径中嵌套复杂的计算。",
+    "请只使用最基础的 TikZ 命令，避免不常用的库与宏，确保一次编译通过。",
+]
+
+def candidate_count() -> int:
+    """每轮同时生成的候选文档数；为 1 时不启用"""
+    return max(1, int(config_section("speculative_engineer").get("candidates", 1)))
+
+def candidate_variants(count: int = None) -> list:
+    """返回每个候选使用的温度与提示 [{"temperature": ..., "hint": ...}]，配置的列表较短时循环使用"""
+    settings = config_section("speculative_engineer")
+    temperatures = settings.get("temperatures") or DEFAULT_TEMPERATURES
+    hints = settings.get("hints") or DEFAULT_HINTS
+    count = count or candidate_count()
+    return [{"temperature": float(temperatures[i % len(temperatures)]), "hint": hints[i % len(hints)]}
+            for i in range(count)]
+
+def race(jobs: list, accept) -> tuple:
+    """
+    在线程池中并行执行 jobs (每个 job 接收一个 threading.Event，被置位表示已被取消，应尽快返回)。
+    返回 (胜出的序号或 None, {序号: 结果或异常})。
+    有结果满足 accept 时立即返回并取消其余任务；否则等待全部完成。
+    每个任务在调用方 contextvars 的副本中运行，追踪 span 会归入当前节点。
+    """
+    cancelled = threading.Event()
+    results = {}
+    winner = None
+    executor = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="candidate")
+    try:
+        # 每个任务需要独立的上下文副本：同一个 Context 不能同时在多个线程中进入
+        futures = {executor.submit(contextvars.copy_context().run, job, cancelled): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = e
+                continue
+            if accept(results[index]):
+                winner = index
+                break
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return winner, results
+
+async def arace(jobs: list, accept) -> tuple:
+    """race 的异步版本：jobs 为无参的协程函数，失败者以 Task.cancel() 取消"""
+    tasks = {asyncio.ensure_future(job()): i for i, job in enumerate(jobs)}
+    results = {}
+    winner = None
+    pending = set(tasks)
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: tasks[t]):
+                index = tasks[task]
+                results[index] = task.exception() or task.result()
+                if winner is None and not isinstance(results[index], Exception) and accept(results[index]):
+                    winner = index
+    finally:
+        for task in pending:
+            task.cancel()
+    return winner, results
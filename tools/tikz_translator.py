@@ -0,0 +1,173 @@
+# tools/tikz_translator.py
+# 基于规则的构建计划翻译器：将格式固定的指令（定义点、连线、多边形、圆、标签）直接翻译成 TikZ，
+# 跳过工程师 LLM。只要有一条指令无法被完整解析，就返回 None，交给工程师 LLM 处理。
+import math
+import re
+
+from config import config_section
+from tools.latex_format import STANDARD_PREAMBLE
+from tools.plan_parser import (CLAUSE_SEPARATOR, FILLER, NUMBER, POINT_DEFINITION, POINT_NAME, consume, load_plan,
+                               parse_closing_shape, parse_paths, plan_steps, to_float)
+
+_BARE_POINT = re.compile(r"点\s*(" + POINT_NAME + r")\s*[(（]\s*(" + NUMBER + r")\s*[,，]\s*(" + NUMBER + r")\s*[)）]")
+_CIRCLE_WITH_RADIUS = re.compile(
+    r"以\s*(?:点)?\s*(" + POINT_NAME + r")\s*为圆心\s*[,，、]?\s*(?:以)?\s*"
+    r"(?:(?:半径|r)\s*(?:为|=|是)?\s*(" + NUMBER + r")|(" + NUMBER + r")\s*为半径|"
+    r"(?:线段)?(" + POINT_NAME + r")(" + POINT_NAME + r")\s*(?:的长度|长)?\s*为半径)\s*(?:画|作|绘制)?\s*(?:一个)?圆"
+)
+_CIRCLE_CENTER_FIRST = re.compile(
+    r"(?:画|作|绘制)?\s*(?:一个)?圆心为\s*(?:点)?\s*(" + POINT_NAME + r")\s*[,，、]?\s*半径为\s*(" + NUMBER + r")\s*的?圆"
+)
+_LABEL_CLAUSE = re.compile(r"标签|标注|label", re.IGNORECASE)
+# 没有列出点名的标签子句 ("为顶点添加标签"、"标注各点") 表示为所有已定义的点添加标签
+_ALL_POINTS = re.compile(r"所有|全部|各|每个|顶点|点")
+_AXES_CLAUSE = re.compile(r"坐标轴|坐标系|[xXyY]\s*轴")
+# 标签方向：按点相对图形中心的方位选择，使标签位于图形外侧
+_ANCHORS = ["right", "above right", "above", "above left", "left", "below left", "below", "below right"]
+
+def translator_enabled() -> bool:
+    return config_section("plan_translator").get("enabled", True)
+
+def _require_points(names: list, figure: dict) -> bool:
+    """只能引用已定义的点"""
+    return all(name in figure["points"] for name in names)
+
+def _take_points(clause: str, figure: dict) -> str:
+    for pattern in (POINT_DEFINITION, _BARE_POINT):
+        for match in list(pattern.finditer(clause)):
+            name = match.group(1)
+            figure["points"][name] = (to_float(match.group(2)), to_float(match.group(3)))
+            figure["commands"].append(f"\\coordinate ({name}) at ({_fmt(figure['points'][name][0])},{_fmt(figure['points'][name][1])});")
+            clause = consume(clause, match)
+    return clause
+
+def _take_circles(clause: str, figure: dict):
+    for match in list(_CIRCLE_WITH_RADIUS.finditer(clause)):
+        center, radius, radius_first, p, q = match.groups()
+        radius = radius or radius_first
+        if radius is not None:
+            if not _require_points([center], figure):
+                return None
+            figure["commands"].append(f"\\draw ({center}) circle ({_fmt(to_float(radius))});")
+            figure["extents"].append((figure["points"][center], to_float(radius)))
+        else:
+            if not _require_points([center, p, q], figure):
+                return None
+            (px, py), (qx, qy) = figure["points"][p], figure["points"][q]
+            r = math.hypot(qx - px, qy - py)
+            figure["commands"].append(f"\\draw ({center}) circle ({_fmt(round(r, 4))});")
+            figure["extents"].append((figure["points"][center], r))
+        clause = consume(clause, match)
+    for match in list(_CIRCLE_CENTER_FIRST.finditer(clause)):
+        center, radius = match.groups()
+        if not _require_points([center], figure):
+            return None
+        figure["commands"].append(f"\\draw ({center}) circle ({_fmt(to_float(radius))});")
+        figure["extents"].append((figure["points"][center], to_float(radius)))
+        clause = consume(clause, match)
+    return clause
+
+def _path_command(names: list, closed: bool) -> str:
+    path = " -- ".join(f"({name})" for name in names)
+    return f"\\draw {path}{' -- cycle' if closed and len(names) > 2 else ''};"
+
+def _draw_path(names: list, closed: bool, figure: dict) -> bool:
+    if len(names) < 2 or not _require_points(names, figure):
+        return False
+    figure["commands"].append(_path_command(names, closed))
+    figure["last_path"] = (len(figure["commands"]) - 1, names)
+    return True
+
+def _close_last_path(figure: dict) -> bool:
+    """"形成一个闭合的矩形"：将最近绘制的路径闭合；之前没有画过多于两个点的路径时返回 False"""
+    if figure.get("last_path") is None or len(figure["last_path"][1]) < 3:
+        return False
+    index, names = figure["last_path"]
+    figure["commands"][index] = _path_command(names, True)
+    return True
+
+def _take_paths(clause: str, figure: dict):
+    paths, rest = parse_paths(clause)
+    for names, closed in paths:
+        if not _draw_path(names, closed, figure):
+            return None
+    closing, rest = parse_closing_shape(rest)
+    if closing and not _close_last_path(figure):
+        return None
+    return rest
+
+def _take_labels(clause: str, figure: dict):
+    names = re.findall(r"\$(" + POINT_NAME + r")\$", clause)
+    if not names:
+        names = re.findall(r"(?<![A-Za-z])(" + POINT_NAME + r")(?![A-Za-z])", clause)
+    if not names and _ALL_POINTS.search(clause):
+        names = list(figure["points"])
+    if not names or not _require_points(names, figure):
+        return None
+    figure["labels"].extend(name for name in names if name not in figure["labels"])
+    return re.sub(r"\$?" + POINT_NAME + r"\$?", " ", clause)
+
+def _translate_clause(clause: str, figure: dict) -> bool:
+    """翻译一条子句；子句中含有无法翻译的内容时返回 False"""
+    if _LABEL_CLAUSE.search(clause):
+        rest = _take_labels(clause, figure)
+    elif _AXES_CLAUSE.search(clause):
+        # 坐标轴统一由顶层的 show_axes 决定
+        rest = _AXES_CLAUSE.sub(" ", clause)
+    else:
+        rest = _take_points(clause, figure)
+        rest = _take_circles(rest, figure)
+        rest = rest and _take_paths(rest, figure)
+    return rest is not None and not FILLER.sub("", rest)
+
+def _fmt(value: float) -> str:
+    return f"{value:g}"
+
+def _label_anchor(point: tuple, center: tuple) -> str:
+    dx, dy = point[0] - center[0], point[1] - center[1]
+    if abs(dx) < 1e-9 and abs(dy) < 1e-9:
+        return "above right"
+    sector = int(round(math.atan2(dy, dx) / (math.pi / 4))) % 8
+    return _ANCHORS[sector]
+
+def _axes_commands(figure: dict) -> list:
+    xs = [0.0] + [p[0] for p in figure["points"].values()]
+    ys = [0.0] + [p[1] for p in figure["points"].values()]
+    for (cx, cy), r in figure["extents"]:
+        xs += [cx - r, cx + r]
+        ys += [cy - r, cy + r]
+    return [
+        f"\\draw[->] ({_fmt(math.floor(min(xs)) - 1)},0) -- ({_fmt(math.ceil(max(xs)) + 1)},0) node[right] {{$x$}};",
+        f"\\draw[->] (0,{_fmt(math.floor(min(ys)) - 1)}) -- (0,{_fmt(math.ceil(max(ys)) + 1)}) node[above] {{$y$}};",
+    ]
+
+def translate_plan(structured_description: str):
+    """
+    将构建计划直接翻译为完整的 LaTeX 文档（与 TIKZ_ENGINEER_PROMPT 的模板一致）。
+    计划无法解析或含有翻译器不支持的步骤时返回 None。
+    """
+    plan = load_plan(structured_description)
+    if plan is None or not plan_steps(plan):
+        return None
+    figure = {"points": {}, "commands": [], "labels": [], "extents": []}
+    for step in plan_steps(plan):
+        for clause in CLAUSE_SEPARATOR.split(str(step.get("instruction", ""))):
+            if clause.strip() and not _translate_clause(clause, figure):
+                return None
+    if not figure["points"]:
+        return None
+
+    body = []
+    if plan.get("show_axes"):
+        body += _axes_commands(figure)
+    body += figure["commands"]
+    xs = [p[0] for p in figure["points"].values()]
+    ys = [p[1] for p in figure["points"].values()]
+    center = (sum(xs) / len(xs), sum(ys) / len(ys))
+    for name in figure["labels"]:
+        body.append(f"\\node[{_label_anchor(figure['points'][name], center)}] at ({name}) {{${name}$}};")
+
+    lines = [STANDARD_PREAMBLE.strip(), "", r"\begin{document}", r"\begin{tikzpicture}"]
+    lines += [f"    {command}" for command in body]
+    lines += [r"\end{tikzpicture}", r"\end{document}"]
+    return "\n".join(lines)
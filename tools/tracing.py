@@ -0,0 +1,187 @@
+# tools/tracing.py
+# 轻量级追踪：记录每个图节点、每次 LLM 调用和每个 pdflatex 进程的耗时、token 用量、图片体积与缓存命中，
+# 导出为 JSONL 指标文件和 Chrome trace-event JSON (可在 chrome://tracing 或 Perfetto 中打开)。
+# 当前任务的追踪器保存在 contextvar 中，并发任务之间互不干扰；没有活动的追踪器时所有调用都是空操作。
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import config_section
+
+METRICS_FILENAME = "trace_metrics.jsonl"
+CHROME_TRACE_FILENAME = "trace.json"
+
+_current_tracer = contextvars.ContextVar("mathsvg_tracer", default=None)
+_current_span = contextvars.ContextVar("mathsvg_span", default=None)
+
+class Tracer:
+    """收集一次运行中的所有 span，可在多个线程中同时写入"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.run_id = uuid.uuid4().hex[:12]
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, span: dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+@contextmanager
+def trace_run(name: str):
+    """为一次工作流运行启用追踪，返回追踪器；配置中关闭追踪时返回 None"""
+    if not config_section("tracing").get("enabled", True):
+        yield None
+        return
+    tracer = Tracer(name)
+    token = _current_tracer.set(tracer)
+    try:
+        with span("workflow", "run", run=name):
+            yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+@contextmanager
+def span(name: str, category: str, **attrs):
+    """
+    记录一段代码的耗时。返回的字典可以在代码块中补充属性 (如 token 数)。
+    没有活动的追踪器时不做任何记录。
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield attrs
+        return
+    span_id = uuid.uuid4().hex[:8]
+    parent = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        end = time.perf_counter()
+        _current_span.reset(token)
+        tracer.record({
+            "run_id": tracer.run_id,
+            "span_id": span_id,
+            "parent_id": parent,
+            "name": name,
+            "category": category,
+            "start_ms": round((start - tracer.origin) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+            "thread": threading.current_thread().name,
+            "attrs": attrs,
+        })
+
+def image_bytes_of(messages: list) -> int:
+    """估算消息中内联图片 (base64 data URL) 的原始字节数"""
+    total = 0
+    for message in messages:
+        if isinstance(message.content, list):
+            for part in message.content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    url = part.get("image_url", {}).get("url", "")
+                    total += len(url.split(",", 1)[-1]) * 3 // 4
+    return total
+
+def record_llm_usage(attrs: dict, response) -> None:
+    """从响应中提取 token 用量与费用，写入 span 属性"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if not usage:
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        usage = {"input_tokens": token_usage.get("prompt_tokens", 0),
+                 "output_tokens": token_usage.get("completion_tokens", 0)}
+    attrs["prompt_tokens"] = usage.get("input_tokens", 0) or 0
+    attrs["completion_tokens"] = usage.get("output_tokens", 0) or 0
+    # 每百万 token 的价格，例如 {"gpt-4o": {"prompt": 2.5, "completion": 10}}
+    price = (config_section("tracing").get("prices") or {}).get(attrs.get("model"))
+    if price:
+        attrs["cost"] = round((attrs["prompt_tokens"] * price.get("prompt", 0) +
+                               attrs["completion_tokens"] * price.get("completion", 0)) / 1_000_000, 6)
+
+def export_trace(tracer, directory: str = "") -> dict:
+    """将追踪结果写入 JSONL 指标文件与 Chrome trace 文件，返回两个文件的路径"""
+    if tracer is None:
+        return {}
+    if directory:
+        metrics_path = os.path.join(directory, METRICS_FILENAME)
+        chrome_path = os.path.join(directory, CHROME_TRACE_FILENAME)
+    else:
+        # 没有任务输出目录时 (例如任务在创建目录前失败) 使用的导出目录
+        directory = config_section("tracing").get("directory", os.path.join("outputs", "traces"))
+        metrics_path = os.path.join(directory, f"{tracer.run_id}_{METRICS_FILENAME}")
+        chrome_path = os.path.join(directory, f"{tracer.run_id}_{CHROME_TRACE_FILENAME}")
+    os.makedirs(directory, exist_ok=True)
+
+    spans = sorted(tracer.spans, key=lambda s: s["start_ms"])
+    with open(metrics_path, 'w', encoding='utf-8') as f:
+        for s in spans:
+            f.write(json.dumps(s, ensure_ascii=False, default=str) + "\n")
+
+    thread_ids = {}
+    events = []
+    for s in spans:
+        tid = thread_ids.setdefault(s["thread"], len(thread_ids) + 1)
+        events.append({
+            "name": s["name"], "cat": s["category"], "ph": "X",
+            "ts": int(s["start_ms"] * 1000), "dur": int(s["duration_ms"] * 1000),
+            "pid": 1, "tid": tid, "args": s["attrs"],
+        })
+    for thread_name, tid in thread_ids.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread_name}})
+    with open(chrome_path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                   "otherData": {"run": tracer.name, "run_id": tracer.run_id}}, f, ensure_ascii=False, default=str)
+    return {"metrics": metrics_path, "chrome_trace": chrome_path}
+
+def summarize_spans(spans: list) -> dict:
+    """按 (类别, 名称) 聚合耗时，并统计 LLM token、费用与缓存命中"""
+    groups = {}
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "image_bytes": 0, "cost": 0.0,
+              "llm_calls": 0, "llm_cache_hits": 0, "llm_retries": 0, "throttle_ms": 0.0,
+              "llm_hedges": 0, "llm_hedge_wins": 0}
+    for s in spans:
+        group = groups.setdefault((s["category"], s["name"]), {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        group["count"] += 1
+        group["total_ms"] += s["duration_ms"]
+        group["max_ms"] = max(group["max_ms"], s["duration_ms"])
+        if s["category"] == "llm":
+            attrs = s["attrs"]
+            totals["llm_calls"] += 1
+            totals["llm_cache_hits"] += 1 if attrs.get("cache_hit") else 0
+            totals["llm_retries"] += attrs.get("retries", 0) or 0
+            totals["throttle_ms"] += attrs.get("throttle_ms", 0) or 0
+            totals["llm_hedges"] += 1 if attrs.get("hedged") else 0
+            totals["llm_hedge_wins"] += 1 if attrs.get("hedge_won") else 0
+            for field in ("prompt_tokens", "completion_tokens", "image_bytes", "cost"):
+                totals[field] += attrs.get(field, 0) or 0
+    return {"groups": groups, "totals": totals}
+
+def print_trace_summary(spans: list) -> None:
+    """打印按节点、LLM 调用和 pdflatex 聚合的耗时分布"""
+    if not spans:
+        return
+    summary = summarize_spans(spans)
+    runs = summary["groups"]
+    run_total = sum(g["total_ms"] for (category, _), g in runs.items() if category == "run") or 1.0
+    print("\n--- Latency Breakdown ---")
+    print(f"{'category':<9} {'name':<28} {'count':>5} {'total (s)':>10} {'mean (s)':>9} {'max (s)':>8} {'% run':>6}")
+    for (category, name), g in sorted(runs.items(), key=lambda item: (item[0][0] != "run", -item[1]["total_ms"])):
+        print(f"{category:<9} {name[:28]:<28} {g['count']:>5} {g['total_ms'] / 1000:>10.2f} "
+              f"{g['total_ms'] / g['count'] / 1000:>9.2f} {g['max_ms'] / 1000:>8.2f} {g['total_ms'] / run_total:>6.0%}")
+    totals = summary["totals"]
+    print(f"🔢 LLM calls: {totals['llm_calls']} ({totals['llm_cache_hits']} cache hit(s)) | "
+          f"tokens: {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion | "
+          f"images: {totals['image_bytes'] / 1024:.1f} KB"
+          + (f" | cost: ${totals['cost']:.4f}" if totals["cost"] else ""))
+    if totals["llm_retries"] or totals["throttle_ms"] >= 1:
+        print(f"🚦 LLM retries: {totals['llm_retries']} | throttle wait: {totals['throttle_ms'] / 1000:.2f}s")
+    if totals["llm_hedges"]:
+        print(f"🔀 Hedged LLM calls: {totals['llm_hedges']} ({totals['llm_hedge_wins']} won by the hedge)")
@@ -1,20 +1,46 @@
 # workflow.py
 from typing import TypedDict, List, Dict, Any
 from langgraph.graph import StateGraph, END
+import hashlib
 import json
 import os
 import datetime  # 新增导入
 
-from agents.analyst import get_analyst_response
-from agents.tikz_engineer import get_tikz_engineer_response
-from agents.tikz_critic import get_tikz_critic_response
-
-from agents.title_generator import get_title_from_description  # 新增导入
-from tools.latex_compiler import compile_latex_code
+from langchain_core.runnables import RunnableLambda
+
+from agents.analyst import get_analyst_response, aget_analyst_response
+from agents.tikz_engineer import (get_tikz_engineer_response, aget_tikz_engineer_response,
+                                  get_tikz_patch_response, aget_tikz_patch_response)
+from agents.tikz_critic import get_tikz_critic_response, aget_tikz_critic_response
+
+from agents.title_generator import get_title_from_description, aget_title_from_description  # 新增导入
+from tools.checkpoint import get_checkpointer
+from tools.context_budget import apply_budget, error_section, plan_section
+from tools.geometry_verifier import format_verification_report, verifier_enabled, verify_geometry
+from tools.latex_compiler import compile_latex_code, acompile_latex_code
+from tools.latex_linter import format_lint_feedback, lint_latex_code
+from tools.latex_log import summarize_latex_log
+from tools.patch_utils import PatchError, apply_unified_diff, patch_revisions_enabled
+from tools.speculative import arace, candidate_count, candidate_variants, race
+from tools.tikz_translator import translate_plan, translator_enabled
+from tools.tracing import span
 from tools.logger import initialize_log, log_message  # 新增导入
 
 MAX_ITERATIONS = 5
 
+# 由代码本身引起的失败：错误信息已足以让工程师修正，直接返回工程师，不经过审查员和会诊分析师
+ENGINEER_RETRY_ERRORS = {
+    "lint": ("Static pre-check failed", "静态检查未通过，跳过编译和审查"),
+    "compile": ("Compilation failed", "编译失败，跳过审查员和会诊"),
+    "timeout": ("Compilation timed out", "编译超时，跳过审查员和会诊"),
+}
+
+# 编译环境本身的故障 (pdflatex 不存在、编译器出现意外异常)：没有 PDF 可供审查，重试也不会改变结果，直接结束任务
+ENVIRONMENT_ERRORS = {
+    "not_found": ("pdflatex not found", "找不到 pdflatex"),
+    "exception": ("Compiler raised an unexpected error", "编译器出现意外错误"),
+}
+
 # 修改 AgentState 类，增加 output_directory 字段
 
 class AgentState(TypedDict):
@@ -30,60 +56,80 @@ class AgentState(TypedDict):
     saved_files: List[str]
     last_pdf_path: str
     last_log_path: str
+    tried_translations: List[str]  # 已提交过的规则翻译 (SHA-256)；再次进入工程师节点说明它们已被否决
 
 # --- 节点定义 ---
+# 每个节点都有同步和异步两个版本，它们共享状态处理的辅助函数，
+# 只在调用 LLM 和编译器的方式上不同。
 
-def initial_analyst_node(state: AgentState) -> AgentState:
-    """仅用于处理初始请求的分析师节点"""
-    print("--- NODE: INITIAL ANALYST ---")
+def _analyst_request(state: AgentState) -> dict:
+    """根据初始请求构建分析师的输入"""
     request = state["initial_request"]
     # 区分请求类型
     if os.path.exists(request['data']):
-         req = {"type": "initial_image", "data": request['data']}
-    else:
-         req = {"type": "initial_text", "data": request['data']}
+         return {"type": "initial_image", "data": request['data']}
+    return {"type": "initial_text", "data": request['data']}
 
-    description = get_analyst_response(req)
+def initial_analyst_node(state: AgentState) -> AgentState:
+    """仅用于处理初始请求的分析师节点"""
+    print("--- NODE: INITIAL ANALYST ---")
+    description = get_analyst_response(_analyst_request(state))
     return {"structured_description": description, "iteration_count": 0, "saved_files": []}
 
-# 在 initial_analyst_node 和 triage_analyst_node 之间，添加新节点 title_generator_node
-def title_generator_node(state: AgentState) -> AgentState:
-    """根据描述生成标题并为当前任务创建输出目录。"""
-    print("--- NODE: TITLE GENERATOR & DIRECTORY SETUP ---")
-    description = state["structured_description"]
-    
-    # 1. 生成标题
-    title = get_title_from_description(description)
+async def ainitial_analyst_node(state: AgentState) -> AgentState:
+    """initial_analyst_node 的异步版本"""
+    print("--- NODE: INITIAL ANALYST ---")
+    description = await aget_analyst_response(_analyst_request(state))
+    return {"structured_description": description, "iteration_count": 0, "saved_files": []}
 
-    # 2. 创建带时间戳的目录
+def _setup_output_directory(description: str, title: str) -> AgentState:
+    """为当前任务创建带时间戳的输出目录，并初始化日志文件。"""
+    # 创建带时间戳的目录
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     dir_name = f"{timestamp}_{title}"
     output_path = os.path.join("outputs", dir_name)
 
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-        print(f"✅ Created output directory: {output_path}")
-
-    # 3. 初始化日志文件
+    # 批处理模式下可能有多个任务在同一秒生成相同标题，目录名冲突时追加序号
+    os.makedirs("outputs", exist_ok=True)
+    suffix = 1
+    while True:
+        try:
+            os.makedirs(output_path)
+            break
+        except FileExistsError:
+            suffix += 1
+            output_path = os.path.join("outputs", f"{dir_name}_{suffix}")
+    print(f"✅ Created output directory: {output_path}")
+
+    # 初始化日志文件
     log_path = initialize_log(output_path)
 
-    # 4. 记录上一个节点 (analyst) 的输出
+    # 记录上一个节点 (analyst) 的输出
     log_message(log_path, description, title="几何构建规划师 (Analyst) 输出")
 
     return {"output_directory": output_path, "log_file_path": log_path}
 
-def triage_analyst_node(state: AgentState) -> AgentState:
-    """处理反馈、进行诊断和修正的分析师节点"""
-    print("--- NODE: TRIAGE ANALYST ---")
-    
-    log_content = ""
-    try:
-        with open(state['last_log_path'], 'r', encoding='utf-8', errors='replace') as f:
-            log_content = f.read()[-1500:] # 只读取日志的最后部分
-    except Exception:
-        log_content = "Log file not found or could not be read."
+# 在 initial_analyst_node 和 triage_analyst_node 之间，添加新节点 title_generator_node
+def title_generator_node(state: AgentState) -> AgentState:
+    """根据描述生成标题并为当前任务创建输出目录。"""
+    print("--- NODE: TITLE GENERATOR & DIRECTORY SETUP ---")
+    description = state["structured_description"]
+    title = get_title_from_description(description)
+    return _setup_output_directory(description, title)
+
+async def atitle_generator_node(state: AgentState) -> AgentState:
+    """title_generator_node 的异步版本"""
+    print("--- NODE: TITLE GENERATOR & DIRECTORY SETUP ---")
+    description = state["structured_description"]
+    title = await aget_title_from_description(description)
+    return _setup_output_directory(description, title)
+
+def _feedback_package(state: AgentState) -> dict:
+    """收集审查意见、编译日志和PDF路径，构建发给分析师的反馈包"""
+    # 只发送从日志末尾解析出的结构化错误摘要，而不是原始日志
+    log_content = summarize_latex_log(state['last_log_path'], state.get('latex_code', ""))
 
-    feedback_package = {
+    return {
         "type": "feedback",
         "data": {
             "original_description": state["structured_description"],
@@ -92,9 +138,9 @@ def triage_analyst_node(state: AgentState) -> AgentState:
             "log_content": log_content
         }
     }
-    
-    # 调用分析师进行诊断，并获取可能被修正后的新JSON
-    new_description = get_analyst_response(feedback_package)
+
+def _record_triage(state: AgentState, new_description: str) -> AgentState:
+    """打印并记录诊断后的新规划"""
     print("\n--- Analyst Triage Result (New Description) ---")
     print(new_description)
     print("-----------------------------------------------\n")
@@ -106,43 +152,151 @@ def triage_analyst_node(state: AgentState) -> AgentState:
     # 更新状态中的几何描述
     return {"structured_description": new_description}
 
-def engineer_node(state: AgentState) -> AgentState:
-    """TikZ工程师节点"""
-    print("--- NODE: TIKZ ENGINEER & COMPILER ---")
+def triage_analyst_node(state: AgentState) -> AgentState:
+    """处理反馈、进行诊断和修正的分析师节点"""
+    print("--- NODE: TRIAGE ANALYST ---")
+    # 调用分析师进行诊断，并获取可能被修正后的新JSON
+    new_description = get_analyst_response(_feedback_package(state))
+    return _record_triage(state, new_description)
+
+async def atriage_analyst_node(state: AgentState) -> AgentState:
+    """triage_analyst_node 的异步版本"""
+    print("--- NODE: TRIAGE ANALYST ---")
+    new_description = await aget_analyst_response(_feedback_package(state))
+    return _record_triage(state, new_description)
+
+def _engineer_input(state: AgentState) -> str:
+    """构建工程师的输入：首轮为几何描述，修正轮次附带审查意见"""
     description = state["structured_description"]
-    current_iteration = state["iteration_count"]
-    output_dir = state["output_directory"]
-    log_path = state["log_file_path"] # 获取日志路径
-    
     feedback = state.get("critic_feedback")
     if feedback and feedback != "APPROVED":
         print("Engineer is revising based on feedback...")
-        revised_description = f"""
+        fitted = apply_budget("engineer", [plan_section("description", description), error_section("feedback", feedback)])
+        return f"""
         Original Description:
-        {description}
+        {fitted["description"]}
 
         Previous attempt failed. Please correct your code based on this feedback:
-        {feedback}
+        {fitted["feedback"]}
         """
-        latex_code = get_tikz_engineer_response(revised_description)
-    else:
-        latex_code = get_tikz_engineer_response(description)
-    
+    return description
+
+def _engineer_use_cache(state: AgentState):
+    """
+    工程师调用的缓存策略：首轮生成按默认策略 (None) 使用 LLM 缓存；修正轮次不使用缓存 (False)。
+    重新生成的代码以同样的方式失败时，编译缓存返回相同的错误，工程师的提示词逐字相同，
+    缓存只会一直重放同一个失败的答案。
+    """
+    feedback = state.get("critic_feedback")
+    return False if feedback and feedback != "APPROVED" else None
+
+def _translation_hash(latex_code: str) -> str:
+    return hashlib.sha256(latex_code.encode('utf-8')).hexdigest()
+
+def _translated_code(state: AgentState):
+    """
+    尝试用规则翻译器直接将构建计划翻译为代码。
+    计划含有翻译器无法处理的步骤，或同样的译文在本任务中已经提交过 (即已被否决) 时返回 None，由工程师 LLM 生成。
+    计划被会诊修改后译文随之改变，可以再次使用翻译器。
+    """
+    if not translator_enabled():
+        return None
+    latex_code = translate_plan(state["structured_description"])
+    if latex_code is None:
+        return None
+    if _translation_hash(latex_code) in (state.get("tried_translations") or []):
+        print("-> The rule-based translation was already rejected. Using the engineer LLM.")
+        return None
+    print("✅ Construction plan translated by rules. Skipping the engineer LLM.")
+    return latex_code
+
+def _record_translation(state: AgentState, update: dict, latex_code: str) -> AgentState:
+    """在节点的状态更新中记录本轮提交的规则译文"""
+    tried = list(state.get("tried_translations") or [])
+    return {**update, "tried_translations": tried + [_translation_hash(latex_code)]}
+
+def _patch_base(state: AgentState):
+    """修正轮次返回上一轮的代码，作为工程师补丁的基础；首轮或未启用补丁模式时返回 None"""
+    feedback = state.get("critic_feedback")
+    if not patch_revisions_enabled() or not state.get("latex_code") or not feedback or feedback == "APPROVED":
+        return None
+    return state["latex_code"]
+
+def _apply_engineer_patch(state: AgentState, previous_code: str, patch: str):
+    """应用工程师返回的补丁；补丁无法应用或没有任何修改时返回 None，由工程师完整重新生成"""
+    log_path = state["log_file_path"]
+    title_suffix = f"第 {state['iteration_count'] + 1} 轮"
+    try:
+        latex_code = apply_unified_diff(previous_code, patch)
+    except PatchError as e:
+        print(f"⚠️ Engineer patch could not be applied ({e}). Falling back to full regeneration.")
+        log_message(log_path, f"{e}\n\n{patch}", title=f"补丁应用失败 - {title_suffix}")
+        return None
+    if latex_code.strip() == previous_code.strip():
+        print("⚠️ Engineer patch made no changes. Falling back to full regeneration.")
+        return None
+    print(f"✅ Engineer patch applied ({len(patch)} chars instead of a full document).")
+    log_message(log_path, patch, title=f"代码翻译官 (Engineer) 补丁 - {title_suffix}")
+    return latex_code
+
+def _patched_code(state: AgentState, temperature: float = None, hint: str = ""):
+    """修正轮次让工程师只返回补丁并在本地应用；不适用或应用失败时返回 None"""
+    previous_code = _patch_base(state)
+    if previous_code is None:
+        return None
+    patch = get_tikz_patch_response(state["structured_description"], previous_code, state["critic_feedback"],
+                                    temperature, hint)
+    return _apply_engineer_patch(state, previous_code, patch)
+
+async def _apatched_code(state: AgentState, temperature: float = None, hint: str = ""):
+    """_patched_code 的异步版本"""
+    previous_code = _patch_base(state)
+    if previous_code is None:
+        return None
+    patch = await aget_tikz_patch_response(state["structured_description"], previous_code, state["critic_feedback"],
+                                           temperature, hint)
+    return _apply_engineer_patch(state, previous_code, patch)
+
+def _output_base(state: AgentState) -> str:
+    """本轮编译产物的文件名前缀"""
+    return os.path.join(state["output_directory"], f"geometry_v{state['iteration_count'] + 1}")
+
+def _record_generated_code(state: AgentState, latex_code: str) -> str:
+    """打印并记录生成的代码，返回本轮编译产物的文件名前缀"""
+    current_iteration = state["iteration_count"]
     print("\n--- Generated LaTeX Code ---\n", latex_code, "\n--------------------------\n")
     # 记录生成的代码
-    log_message(log_path, latex_code, title=f"代码翻译官 (Engineer) 输出 - 第 {current_iteration + 1} 轮")
-
-    output_base = os.path.join(output_dir, f"geometry_v{current_iteration + 1}")
-    compilation_result = compile_latex_code(latex_code, output_base, output_dir)
+    log_message(state["log_file_path"], latex_code, title=f"代码翻译官 (Engineer) 输出 - 第 {current_iteration + 1} 轮")
+    return _output_base(state)
+
+def _lint_before_compile(latex_code: str):
+    """
+    编译前的静态检查。发现问题时返回一个失败的编译结果 (error_type 为 "lint")，
+    调用方应跳过编译；未发现问题时返回 None。
+    """
+    findings = lint_latex_code(latex_code)
+    if not findings:
+        return None
+    return {"success": False, "error": format_lint_feedback(findings), "error_type": "lint", "lint_findings": findings}
+
+def _record_compilation(state: AgentState, latex_code: str, compilation_result: dict, output_base: str) -> AgentState:
+    """记录编译结果，并返回本轮迭代的状态更新"""
+    current_iteration = state["iteration_count"]
 
     # 记录编译结果
     if compilation_result["success"]:
         log_content = f"✅ PDF文件成功生成于: {compilation_result['path']}"
+        log_title = f"LaTeX 编译器输出 - 第 {current_iteration + 1} 轮"
+    elif compilation_result.get("error_type") == "lint":
+        log_content = f"⚠️ 静态检查未通过，跳过编译。\n{compilation_result['error']}"
+        log_title = f"编译前静态检查 - 第 {current_iteration + 1} 轮"
     else:
         log_content = f"❌ LaTeX 编译失败。\n错误详情:\n{compilation_result['error']}"
-    log_message(log_path, log_content, title=f"LaTeX 编译器输出 - 第 {current_iteration + 1} 轮")
+        log_title = f"LaTeX 编译器输出 - 第 {current_iteration + 1} 轮"
+    log_message(state["log_file_path"], log_content, title=log_title)
 
-    saved_files = state["saved_files"]
+    # 复制而不是修改原列表：检查点中保存的上一步状态不能被改动
+    saved_files = list(state["saved_files"])
     if compilation_result["success"]:
         pdf_path = compilation_result["path"]
         saved_files.append(pdf_path)
@@ -152,7 +306,7 @@ def engineer_node(state: AgentState) -> AgentState:
         print(f"Error details: {compilation_result['error']}")
 
     # 保存本次迭代的文件路径以供反馈
-    return {
+    update = {
         "latex_code": latex_code,
         "compilation_result": compilation_result,
         "iteration_count": current_iteration + 1,
@@ -160,21 +314,165 @@ def engineer_node(state: AgentState) -> AgentState:
         "last_pdf_path": f"{output_base}.pdf",
         "last_log_path": f"{output_base}.log"
     }
+    # 环境故障结束任务，错误信息作为最终反馈保留在结果中
+    if compilation_result.get("error_type") in ENVIRONMENT_ERRORS:
+        update["critic_feedback"] = compilation_result["error"]
+    # 静态检查与编译错误直接作为反馈交给下一轮的工程师，不经过审查员
+    if compilation_result.get("error_type") in ENGINEER_RETRY_ERRORS:
+        update["critic_feedback"] = compilation_result["error"]
+        # 与上一轮的代码完全相同：再次重试只会得到同样的失败，由 after_engineer_edge 结束任务
+        if latex_code.strip() == (state.get("latex_code") or "").strip():
+            update["compilation_result"] = {**compilation_result, "repeated": True}
+    return update
+
+def _check_candidate(state: AgentState, index: int, latex_code: str, compilation_result: dict, output_base: str) -> dict:
+    """整理一个候选文档的结果；静态检查与编译通过，且数值几何验证没有发现错误时视为通过本地检查"""
+    passed = compilation_result["success"]
+    if passed and verifier_enabled():
+        passed = not verify_geometry(state["structured_description"], latex_code)["failures"]
+    return {"index": index, "latex_code": latex_code, "compilation_result": compilation_result,
+            "output_base": output_base, "passed": passed}
+
+def _engineer_candidate(state: AgentState, engineer_input: str, index: int, variant: dict, cancelled) -> dict:
+    """生成并编译一个候选文档；其他候选已经胜出时跳过编译"""
+    with span(f"candidate_{index + 1}", "candidate", temperature=variant["temperature"]):
+        latex_code = (_patched_code(state, **variant)
+                      or get_tikz_engineer_response(engineer_input, **variant, use_cache=_engineer_use_cache(state)))
+        if cancelled.is_set():
+            return None
+        output_base = f"{_output_base(state)}_c{index + 1}"
+        compilation_result = _lint_before_compile(latex_code) or compile_latex_code(latex_code, output_base, state["output_directory"])
+        return _check_candidate(state, index, latex_code, compilation_result, output_base)
+
+async def _aengineer_candidate(state: AgentState, engineer_input: str, index: int, variant: dict) -> dict:
+    """_engineer_candidate 的异步版本；被取消时任务直接中止"""
+    with span(f"candidate_{index + 1}", "candidate", temperature=variant["temperature"]):
+        latex_code = (await _apatched_code(state, **variant)
+                      or await aget_tikz_engineer_response(engineer_input, **variant, use_cache=_engineer_use_cache(state)))
+        output_base = f"{_output_base(state)}_c{index + 1}"
+        compilation_result = _lint_before_compile(latex_code) or await acompile_latex_code(latex_code, output_base, state["output_directory"])
+        return _check_candidate(state, index, latex_code, compilation_result, output_base)
+
+def _choose_candidate(state: AgentState, winner, results: dict) -> dict:
+    """
+    选出交给审查员的候选：优先取第一个通过本地检查的候选；
+    都没有通过时，取编译成功的，其次是编译失败的，最后是静态检查未通过的。
+    """
+    candidates = [r for r in results.values() if isinstance(r, dict)]
+    if not candidates:
+        # 所有候选都抛出了异常
+        raise next(r for r in results.values() if isinstance(r, Exception))
+    if winner is not None:
+        chosen = results[winner]
+    else:
+        chosen = max(candidates, key=lambda c: (c["compilation_result"]["success"],
+                                                c["compilation_result"].get("error_type") != "lint", -c["index"]))
+
+    variants = candidate_variants()
+    lines = []
+    for index, variant in enumerate(variants):
+        result = results.get(index)
+        if result is None:
+            status = "已取消"
+        elif isinstance(result, Exception):
+            status = f"异常: {result}"
+        elif result["passed"]:
+            status = "通过本地检查"
+        elif result["compilation_result"]["success"]:
+            status = "编译成功，几何验证未通过"
+        else:
+            status = "静态检查未通过" if result["compilation_result"].get("error_type") == "lint" else "编译失败"
+        marker = " <- 选用" if result is chosen else ""
+        lines.append(f"候选 {index + 1} (temperature {variant['temperature']:g}): {status}{marker}")
+    log_message(state["log_file_path"], "\n".join(lines), title=f"并行候选 - 第 {state['iteration_count'] + 1} 轮")
+    cancelled = sum(1 for i in range(len(variants)) if results.get(i) is None)
+    print(f"🏁 Speculative engineer: candidate {chosen['index'] + 1} of {len(variants)} "
+          f"{'passed local checks first' if chosen['passed'] else 'chosen (none passed local checks)'}; {cancelled} cancelled.")
+    return chosen
+
+def _speculative_engineer(state: AgentState) -> dict:
+    """并行生成并编译多个候选文档，第一个通过本地检查的候选胜出，其余被取消"""
+    engineer_input = _engineer_input(state)
+    jobs = [lambda cancelled, i=i, variant=variant: _engineer_candidate(state, engineer_input, i, variant, cancelled)
+            for i, variant in enumerate(candidate_variants())]
+    winner, results = race(jobs, lambda c: c is not None and c["passed"])
+    return _choose_candidate(state, winner, results)
+
+async def _aspeculative_engineer(state: AgentState) -> dict:
+    """_speculative_engineer 的异步版本"""
+    engineer_input = _engineer_input(state)
+    jobs = [lambda i=i, variant=variant: _aengineer_candidate(state, engineer_input, i, variant)
+            for i, variant in enumerate(candidate_variants())]
+    winner, results = await arace(jobs, lambda c: c["passed"])
+    return _choose_candidate(state, winner, results)
+
+def _record_candidate(state: AgentState, candidate: dict) -> AgentState:
+    """记录胜出候选的代码与编译结果"""
+    _record_generated_code(state, candidate["latex_code"])
+    return _record_compilation(state, candidate["latex_code"], candidate["compilation_result"], candidate["output_base"])
+
+def engineer_node(state: AgentState) -> AgentState:
+    """TikZ工程师节点"""
+    print("--- NODE: TIKZ ENGINEER & COMPILER ---")
+    translated = _translated_code(state)
+    if translated is None and candidate_count() > 1:
+        return _record_candidate(state, _speculative_engineer(state))
+    latex_code = (translated or _patched_code(state)
+                  or get_tikz_engineer_response(_engineer_input(state), use_cache=_engineer_use_cache(state)))
+    output_base = _record_generated_code(state, latex_code)
+    compilation_result = _lint_before_compile(latex_code) or compile_latex_code(latex_code, output_base, state["output_directory"])
+    update = _record_compilation(state, latex_code, compilation_result, output_base)
+    return _record_translation(state, update, translated) if translated else update
+
+async def aengineer_node(state: AgentState) -> AgentState:
+    """engineer_node 的异步版本"""
+    print("--- NODE: TIKZ ENGINEER & COMPILER ---")
+    translated = _translated_code(state)
+    if translated is None and candidate_count() > 1:
+        return _record_candidate(state, await _aspeculative_engineer(state))
+    latex_code = (translated or await _apatched_code(state)
+                  or await aget_tikz_engineer_response(_engineer_input(state), use_cache=_engineer_use_cache(state)))
+    output_base = _record_generated_code(state, latex_code)
+    compilation_result = _lint_before_compile(latex_code) or await acompile_latex_code(latex_code, output_base, state["output_directory"])
+    update = _record_compilation(state, latex_code, compilation_result, output_base)
+    return _record_translation(state, update, translated) if translated else update
+
+def _record_critic_feedback(state: AgentState, feedback: str) -> AgentState:
+    """记录审查员的反馈"""
+    log_message(state["log_file_path"], feedback, title=f"审查员 (Critic) 反馈 - 第 {state['iteration_count']} 轮")
+    return {"critic_feedback": feedback}
+
+def _local_approval(state: AgentState):
+    """
+    编译成功时先用数值几何验证检查代码；全部检查通过则直接批准，无需调用审查员 LLM。
+    返回节点的状态更新，无法在本地批准时返回 None。
+    """
+    if not verifier_enabled() or not state["compilation_result"].get("success"):
+        return None
+    report = verify_geometry(state["structured_description"], state["latex_code"])
+    log_message(state["log_file_path"], format_verification_report(report), title=f"数值几何验证 - 第 {state['iteration_count']} 轮")
+    if not report["approved"]:
+        return None
+    print(f"✅ Geometry verified locally ({len(report['checks'])} checks passed). Skipping the critic LLM.")
+    return _record_critic_feedback(state, "APPROVED")
 
 def critic_node(state: AgentState) -> AgentState:
     """审查员节点"""
     print("--- NODE: CRITIC ---")
-    description = state["structured_description"]
-    code = state["latex_code"]
-    result = state["compilation_result"]
-    log_path = state["log_file_path"] # 获取日志路径
-
-    feedback = get_tikz_critic_response(description, code, result)
-
-    # 记录审查员的反馈
-    log_message(log_path, feedback, title=f"审查员 (Critic) 反馈 - 第 {state['iteration_count']} 轮")
-
-    return {"critic_feedback": feedback}
+    approval = _local_approval(state)
+    if approval:
+        return approval
+    feedback = get_tikz_critic_response(state["structured_description"], state["latex_code"], state["compilation_result"])
+    return _record_critic_feedback(state, feedback)
+
+async def acritic_node(state: AgentState) -> AgentState:
+    """critic_node 的异步版本"""
+    print("--- NODE: CRITIC ---")
+    approval = _local_approval(state)
+    if approval:
+        return approval
+    feedback = await aget_tikz_critic_response(state["structured_description"], state["latex_code"], state["compilation_result"])
+    return _record_critic_feedback(state, feedback)
 
 # --- 定义条件边 ---
 
@@ -201,16 +499,62 @@ def should_continue_edge(state: AgentState) -> str:
 
     return decision
 
+def after_engineer_edge(state: AgentState) -> str:
+    """
+    静态检查、编译失败或编译超时时，带着解析后的错误直接返回工程师修正，
+    跳过审查员 (只会复述错误) 和会诊分析师 (需要的 PDF 可能根本不存在)，每轮省去 2 次 LLM 调用；
+    工程师重复提交上一轮的失败代码时结束任务；pdflatex 缺失等环境故障直接结束任务；编译成功时交给审查员。
+    """
+    error_type = state["compilation_result"].get("error_type")
+    log_path = state["log_file_path"]
+    if error_type in ENVIRONMENT_ERRORS:
+        label, description = ENVIRONMENT_ERRORS[error_type]
+        print(f"DECISION: {label}. Finishing without review.")
+        log_message(log_path, f"{description}，无法生成 PDF，重试不会改变结果。任务结束。", title="决策")
+        return "end"
+    if error_type not in ENGINEER_RETRY_ERRORS:
+        return "review"
+
+    count = state["iteration_count"]
+    if count >= MAX_ITERATIONS:
+        print(f"DECISION: Max iterations ({MAX_ITERATIONS}) reached. Finishing.")
+        log_message(log_path, f"已达到最大迭代次数 ({MAX_ITERATIONS})。任务结束。", title="决策")
+        return "end"
+    if state["compilation_result"].get("repeated"):
+        print("DECISION: Engineer resubmitted the same failing code. Finishing.")
+        log_message(log_path, "工程师提交了与上一轮完全相同的失败代码，继续重试不会有变化。任务结束。", title="决策")
+        return "end"
+    label, description = ENGINEER_RETRY_ERRORS[error_type]
+    print(f"DECISION: {label}. Returning to engineer, skipping critic and triage (Iteration {count}).")
+    log_message(log_path, f"{description}，直接返回工程师修正 (第 {count} 轮)。", title="决策")
+    return "retry"
+
 # --- 构建图 (新结构) ---
+def _node(name: str, func, afunc):
+    """
+    将同步和异步实现包装为同一个节点：
+    app.stream/invoke 调用同步版本，app.astream/ainvoke 调用异步版本。
+    每次执行都会记录一个追踪 span。
+    """
+    def traced(state: AgentState) -> AgentState:
+        with span(name, "node"):
+            return func(state)
+
+    async def atraced(state: AgentState) -> AgentState:
+        with span(name, "node"):
+            return await afunc(state)
+
+    return RunnableLambda(traced, afunc=atraced, name=name)
+
 def build_workflow():
     workflow = StateGraph(AgentState)
 
     # 添加所有节点
-    workflow.add_node("initial_analyst", initial_analyst_node)
-    workflow.add_node("title_generator", title_generator_node)  # 新增节点
-    workflow.add_node("triage_analyst", triage_analyst_node)
-    workflow.add_node("engineer", engineer_node)
-    workflow.add_node("critic", critic_node)
+    workflow.add_node("initial_analyst", _node("initial_analyst", initial_analyst_node, ainitial_analyst_node))
+    workflow.add_node("title_generator", _node("title_generator", title_generator_node, atitle_generator_node))  # 新增节点
+    workflow.add_node("triage_analyst", _node("triage_analyst", triage_analyst_node, atriage_analyst_node))
+    workflow.add_node("engineer", _node("engineer", engineer_node, aengineer_node))
+    workflow.add_node("critic", _node("critic", critic_node, acritic_node))
 
     # 设置入口点
     workflow.set_entry_point("initial_analyst")
@@ -219,7 +563,15 @@ def build_workflow():
     workflow.add_edge("initial_analyst", "title_generator")  # 修改：分析师 -> 标题生成器
     workflow.add_edge("title_generator", "engineer")       # 新增：标题生成器 -> 工程师
     workflow.add_edge("triage_analyst", "engineer")  # 诊断后也去工程师那里
-    workflow.add_edge("engineer", "critic")
+    workflow.add_conditional_edges(
+        "engineer",
+        after_engineer_edge,
+        {
+            "review": "critic",
+            "retry": "engineer",  # 静态检查与编译错误无需审查员和分析师介入
+            "end": END
+        }
+    )
     
     # 定义条件边 (这是核心改动)
     workflow.add_conditional_edges(
@@ -231,6 +583,7 @@ def build_workflow():
         }
     )
 
-    app = workflow.compile()
+    # 每个节点完成后将状态写入检查点，调用时需在 config 中提供 thread_id (见 tools/checkpoint.job_config)
+    app = workflow.compile(checkpointer=get_checkpointer())
     print("✅ Workflow compiled successfully with title generator and triage loop.")
     return app